@@ -2,9 +2,13 @@ import os
 import logging
 import time
 import asyncio
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+import functools
+import secrets
+import shutil
+import signal
+from urllib.parse import urlsplit
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, MessageEntity, Video
 from telegram.ext import (
-    ApplicationBuilder,
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
@@ -13,28 +17,55 @@ from telegram.ext import (
     ContextTypes
 )
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import BadRequest
 
 from config import Config
-from utils import is_valid_youtube_url, download_video, get_video_info
+from fileops import FINALIZE_POSTPROCESSOR, resolve_temp_dir
+from format_planner import format_budget, plan_format
+from utils import download_video, extract_urls, forget_downloaded, get_video_info, handoff_info, is_downloaded
 from download_manager import get_download_manager, CancelledError
-from telegram_downloader import download_telegram_video, get_video_info as get_telegram_video_info
+from executors import POSTPROCESS_STAGE
+from scheduler import PRIORITY_HIGH, PRIORITY_NORMAL
+from storage import StorageBudget, StorageFullError
+from telegram_downloader import (
+    close_http_client,
+    download_telegram_video,
+    shutdown_write_executor,
+    get_video_info as get_telegram_video_info,
+    get_video_path as get_telegram_video_path
+)
 from auth_manager import AuthManager
+from concurrency import ConcurrencyController
+from job_store import JobStore
+from logging_setup import setup_logging
+from probe import ProbePool
+from url_parser import parse_url
+from ydl_pool import warm_ffmpeg
+from webhook import WebhookHandler
+from update_processor import ChatOrderedUpdateProcessor
+from uploader import Uploader, UploadError
+from progress_dispatcher import ProgressDispatcher
+import metrics
 
-# Setup logging
-# Setup logging
-logging.basicConfig(
-    level=getattr(logging, Config.LOG_LEVEL.upper()),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(os.path.join(Config.LOG_DIR, Config.LOG_FILE))
-    ]
+# Setup logging (records are written by a background thread, see logging_setup.py)
+setup_logging(
+    Config.LOG_LEVEL,
+    os.path.join(Config.LOG_DIR, Config.LOG_FILE),
+    max_bytes=Config.LOG_MAX_BYTES,
+    backup_count=Config.LOG_BACKUP_COUNT,
+    debug_rate_limit=Config.LOG_DEBUG_RATE_LIMIT
 )
 logger = logging.getLogger(__name__)
 
 # Initialize download manager
 download_manager = None
 auth_manager = None
+progress_dispatcher = None
+metrics_server = None
+concurrency_controller = None
+probe_pool = None
+uploader = None
+format_choices = {}  # (chat_id, message_id) of a format menu -> (plans, planned plan, on_chosen, timeout handle)
 
 
 def check_auth(func):
@@ -85,6 +116,99 @@ async def cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ Error processing cancellation.")
 
 
+async def format_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle a format picked from the menu shown before a download is queued."""
+    query = update.callback_query
+    await query.answer()
+    
+    try:
+        _, message_id, index = query.data.split("_")
+        resolve_format_choice((query.message.chat.id, int(message_id)), int(index))
+    except Exception as e:
+        logger.error(f"Error processing format callback: {e}")
+
+
+def resolve_format_choice(key: tuple, index: int):
+    """
+    Close a format menu and queue its download with the picked plan.
+    
+    Called from the button callback, or with index -1 (the planned format)
+    when FORMAT_CHOICE_TIMEOUT runs out; whichever comes first wins.
+    
+    Args:
+        key: (chat_id, message_id) of the menu
+        index: Index of the picked plan, -1 for the planned one
+    """
+    entry = format_choices.pop(key, None)
+    if entry is None:
+        return  # Already picked or timed out
+    plans, planned, on_chosen, timer = entry
+    timer.cancel()
+    on_chosen(plans[index] if 0 <= index < len(plans) else planned)
+
+
+def current_format_budget() -> int:
+    """Bytes a new download may take, from the configured limit, free disk space and free bandwidth."""
+    disk_available = download_manager.storage.available() if download_manager.storage is not None else None
+    
+    active = download_manager.get_queue_status()['active']
+    throughput = download_manager.throughput()
+    if Config.BANDWIDTH_CAPACITY > 0:
+        # What the running downloads leave free, but at least a fair share of the link
+        capacity = Config.BANDWIDTH_CAPACITY
+        bandwidth = max(capacity - throughput, capacity / (active + 1))
+    else:
+        # Without a known capacity, expect the per-download rate measured so far
+        bandwidth = throughput / active if active and throughput else None
+    
+    return format_budget(Config.FORMAT_MAX_BYTES, disk_available, bandwidth, Config.FORMAT_MAX_SECONDS)
+
+
+async def offer_formats(message, plans: list, planned: dict, on_chosen) -> bool:
+    """
+    Offer the video's formats as buttons on a message, without waiting for a pick.
+    
+    The handler returns right away, so the chat's other updates aren't held
+    up by the menu; on_chosen is called once, from the button callback or
+    with the planned plan after FORMAT_CHOICE_TIMEOUT seconds.
+    
+    Args:
+        message: Message the menu is shown on
+        plans: Candidate plans of the video (see format_planner.candidate_plans())
+        planned: Plan picked for the current budgets, used if nobody picks in time
+        on_chosen: Called with the plan to download
+    
+    Returns:
+        bool: False if there was nothing to choose from (on_chosen is not called)
+    """
+    # A few alternatives are enough: each height once, best first
+    shown, heights = [], set()
+    for index, plan in enumerate(plans):
+        if plan['height'] and plan['height'] not in heights and (not plan['merge'] or shutil.which('ffmpeg')):
+            heights.add(plan['height'])
+            shown.append(index)
+    shown = shown[:4]
+    if not shown:
+        return False
+    
+    key = (message.chat.id, message.message_id)
+    buttons = [[InlineKeyboardButton(f"▶️ Auto: {planned['label']}", callback_data=f"fmt_{message.message_id}_-1")]]
+    buttons += [
+        [InlineKeyboardButton(plans[index]['label'], callback_data=f"fmt_{message.message_id}_{index}")]
+        for index in shown
+    ]
+    timer = asyncio.get_running_loop().call_later(Config.FORMAT_CHOICE_TIMEOUT, resolve_format_choice, key, -1)
+    format_choices[key] = (plans, planned, on_chosen, timer)
+    try:
+        await message.edit_text("🎞 Choose a format:", reply_markup=InlineKeyboardMarkup(buttons))
+    except Exception as e:
+        logger.warning(f"Could not show the format menu: {e}")
+        format_choices.pop(key, None)
+        timer.cancel()
+        return False
+    return True
+
+
 async def auth_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle authentication command."""
     if not auth_manager.is_auth_enabled():
@@ -112,32 +236,101 @@ async def auth_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @check_auth
 async def queue_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show current download queue status."""
-    status = download_manager.get_queue_status()
+    status = download_manager.get_queue_status(user_id=update.effective_user.id)
     
     message = (
         f"📊 **Download Queue Status**\n\n"
         f"Active downloads: {status['active']}/{status['max']}\n"
         f"Waiting in queue: {status['waiting']}\n"
-        f"Total queued: {status['total']}"
+        f"Total queued: {status['total']}\n\n"
+        f"Your active downloads: {status['user_active']}\n"
+        f"Your queued downloads: {len(status['user_queued'])}"
     )
+    for task_id, position in status['user_queued'][:10]:
+        message += f"\n• Task {task_id}: position {position}/{status['waiting']}"
+    if len(status['user_queued']) > 10:
+        message += f"\n• ... and {len(status['user_queued']) - 10} more"
+    
+    postprocessing = status.get('postprocessing')
+    if postprocessing:
+        message += (
+            f"\n\n⚙️ Converting: {postprocessing['running']}/{postprocessing['max']}, "
+            f"{postprocessing['waiting']} downloaded and waiting"
+        )
+    
+    storage = status.get('storage')
+    if storage:
+        gb = 1024 ** 3
+        message += (
+            f"\n\n💾 Disk: {storage['free'] / gb:.1f}GB free, "
+            f"{storage['reserved'] / gb:.1f}GB reserved by {storage['reservations']} downloads "
+            f"(keeping {storage['min_free'] / gb:.1f}GB free)"
+        )
+        if storage['held']:
+            message += "\n⏸ Queue is waiting for disk space"
     
     await update.message.reply_text(message, parse_mode='Markdown')
 
 
+async def notify_queue_position(bot, chat_id: int, task_id: int):
+    """Tell the user where a task waits in the queue, if it has to wait."""
+    position = download_manager.get_position(task_id)
+    if position is None:
+        return
+    
+    status = download_manager.get_queue_status()
+    queue_msg = Config.BOT_QUEUE_MESSAGE.format(position=position, total=status['waiting'])
+    await bot.send_message(chat_id=chat_id, text=queue_msg, disable_notification=True)
+
+
 @check_auth
-async def handle_youtube_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_youtube_link(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str = None):
     """Handle YouTube link downloads with concurrent support."""
-    message_text = update.message.text
+    message_text = url or update.message.text
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     
+    parsed = parse_url(message_text)
+    if parsed is None:
+        await update.message.reply_text("Please send a valid YouTube link or video.")
+        return
+    # Equivalent links (youtu.be, shorts, tracking parameters) become the same job
+    message_text = parsed.canonical_url
+    claim = None  # Dedup key held while the link is probed and its format picked
+    handed_off = False  # Whether the claim went on to a queued download (or the format menu)
+    
     try:
+        # Single videos are known by their link alone: answer repeats without extracting
+        if parsed.content_key:
+            existing_task = download_manager.get_task_by_key(parsed.content_key)
+            if existing_task:
+                logger.info(f"Attaching user {user_id} to task {existing_task.task_id} for {parsed.content_key}")
+                asyncio.create_task(follow_download_and_notify(context.bot, chat_id, existing_task, message_text))
+                return
+            
+            if is_downloaded(parsed.content_key):
+                logger.info(f"Already downloaded for user {user_id}: {parsed.content_key}")
+                await update.message.reply_text(f"✅ Already downloaded!\n{message_text}")
+                if uploader:
+                    await uploader.send_cached(chat_id, parsed.content_key, caption=message_text)
+                return
+            
+            # Hold the key until the download is queued, so a repeat sent meanwhile
+            # attaches to it instead of probing and downloading again
+            if not download_manager.claim_key(parsed.content_key):
+                logger.info(f"Attaching user {user_id} to the pending request for {parsed.content_key}")
+                asyncio.create_task(follow_claimed_download(context.bot, chat_id, parsed.content_key, message_text))
+                return
+            claim = parsed.content_key
+        
         # Send initial processing message
         processing_msg = await update.message.reply_text("🔎 Processing link...")
 
-        # Get video/playlist info first (run in executor to avoid blocking)
-        loop = asyncio.get_running_loop()
-        video_info = await loop.run_in_executor(None, get_video_info, message_text)
+        # Get video/playlist info first; if that takes too long, download without it
+        try:
+            video_info = await probe_pool.probe(message_text)
+        except asyncio.TimeoutError:
+            video_info = None
         
         # Create display name
         if video_info:
@@ -149,162 +342,483 @@ async def handle_youtube_link(update: Update, context: ContextTypes.DEFAULT_TYPE
             # Fallback to truncated URL if info fetch fails
             display_name = message_text if len(message_text) <= 50 else message_text[:47] + "..."
         
-        # Get queue status before queueing
-        queue_status_before = download_manager.get_queue_status()
+        # Answer repeated links from the in-flight tasks and the download archive
+        # (without a probe result, the link's own key still identifies the video)
+        content_key = video_info.get('content_key') if video_info else parsed.content_key
+        if claim and content_key != claim:
+            # Resolved to other content than the link suggested, the claim doesn't cover it
+            download_manager.release_key(claim)
+            claim = None
+        if content_key:
+            existing_task = download_manager.get_task_by_key(content_key)
+            if existing_task:
+                try:
+                    await processing_msg.delete()
+                except:
+                    pass  # Ignore if already deleted or fails
+                
+                logger.info(f"Attaching user {user_id} to task {existing_task.task_id} for {content_key}")
+                asyncio.create_task(follow_download_and_notify(context.bot, chat_id, existing_task, display_name))
+                return
+            
+            if is_downloaded(content_key):
+                logger.info(f"Already downloaded for user {user_id}: {content_key}")
+                await processing_msg.edit_text(f"✅ Already downloaded!\n{display_name}")
+                if uploader:
+                    await uploader.send_cached(chat_id, content_key, caption=display_name)
+                return
         
-        # Notify user if they need to wait
-        if queue_status_before['active'] >= queue_status_before['max']:
-            position = queue_status_before['total'] + 1
-            total = position
-            queue_msg = Config.BOT_QUEUE_MESSAGE.format(position=position, total=total)
-            await update.message.reply_text(queue_msg, disable_notification=True)
+        # Spread playlist entries over the download slots
+        if (
+            Config.PLAYLIST_FANOUT
+            and video_info
+            and video_info['type'] == 'playlist'
+            and video_info.get('entries')
+        ):
+            try:
+                await processing_msg.delete()
+            except:
+                pass  # Ignore if already deleted or fails
+            
+            logger.info(
+                f"Queueing YouTube playlist for user {user_id}: {message_text} "
+                f"({len(video_info['entries'])} entries)"
+            )
+            asyncio.create_task(
+                download_playlist_and_notify(context.bot, chat_id, user_id, message_text, video_info, display_name)
+            )
+            return
         
-        logger.info(f"Queueing YouTube download for user {user_id}: {message_text}")
+        filesize = video_info.get('filesize') if video_info else None
         
-        # Progress tracking
-        last_update_time = [0]  # Use list to allow modification in nested function
-        progress_message_id = [None] # Store message ID for editing
-        task_id_container = [None] # Store task ID for cancel button
-
-        async def edit_progress_msg(chat_id, message_id, text, task_id=None):
-            logger.debug(f"edit_progress_msg called for task {task_id}, message {message_id}")
-            try:
-                reply_markup = None
-                if task_id:
-                     reply_markup = InlineKeyboardMarkup([
-                        [InlineKeyboardButton("🛑 Cancel", callback_data=f"cancel_{task_id}")]
-                    ])
-                
-                await context.bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    text=text,
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup,
-                    disable_web_page_preview=True
+        def start_download(plan):
+            """Queue the download, with the planned or picked format if there is one."""
+            format_spec, size = None, filesize
+            if plan:
+                logger.info(f"Planned format {plan['format']} ({plan['label']}) for {message_text}")
+                format_spec, size = plan['format'], plan['size'] or filesize
+            logger.info(f"Queueing YouTube download for user {user_id}: {message_text}")
+            asyncio.create_task(
+                queue_youtube_download(
+                    context.bot, processing_msg, chat_id, user_id, message_text, display_name, content_key,
+                    filesize=size, format_spec=format_spec
                 )
-            except Exception as e:
-                logger.error(f"Error editing progress message for task {task_id}: {e}")
-                pass
+            )
         
-        def progress_hook(d):
-            """Progress hook for yt-dlp - logs progress to console"""
-            if not Config.ENABLE_PROGRESS_NOTIFICATIONS:
+        # Pick the format that fits the size, disk and bandwidth budgets (audio-only
+        # downloads keep the configured format)
+        plan = None
+        if (
+            Config.FORMAT_PLANNER
+            and not Config.YT_DLP_AUDIO_ONLY
+            and video_info
+            and video_info.get('format_plans')
+        ):
+            plans = video_info['format_plans']
+            plan = plan_format(plans, current_format_budget())
+            # The menu queues the download itself once a format is picked
+            if plan and Config.FORMAT_CHOICE_TIMEOUT > 0 and await offer_formats(processing_msg, plans, plan, start_download):
+                handed_off = True
                 return
+        
+        start_download(plan)
+        handed_off = True
+        
+    except Exception as e:
+        logger.error(f"Error processing YouTube link: {e}")
+        await update.message.reply_text(Config.BOT_ERROR_MESSAGE)
+    finally:
+        # Answered without a download (or failed): let waiting repeats know
+        if claim and not handed_off:
+            download_manager.release_key(claim)
+
+
+async def follow_claimed_download(bot, chat_id: int, content_key: str, display_name: str):
+    """Attach a request to an identical one that is still being probed, once that one is queued."""
+    try:
+        task = await download_manager.wait_for_key(content_key)
+        if task is not None:
+            await follow_download_and_notify(bot, chat_id, task, display_name)
+        elif is_downloaded(content_key):
+            await bot.send_message(chat_id=chat_id, text=f"✅ Already downloaded!\n{display_name}")
+            if uploader:
+                await uploader.send_cached(chat_id, content_key, caption=display_name)
+        else:
+            await bot.send_message(chat_id=chat_id, text=Config.BOT_ERROR_MESSAGE, disable_notification=True)
+    except Exception as e:
+        logger.error(f"Error following the pending request for {content_key}: {e}")
+
+
+async def queue_youtube_download(bot, processing_msg, chat_id: int, user_id: int, url: str, display_name: str,
+                                 content_key: str = None, filesize: int = None, format_spec: str = None):
+    """Replace the "Processing link..." message (or format menu) with the queued download."""
+    try:
+        await processing_msg.delete()
+    except:
+        pass  # Ignore if already deleted or fails
+    
+    await download_youtube_and_notify(
+        bot, chat_id, user_id, url, display_name, content_key, filesize=filesize, format_spec=format_spec
+    )
+
+
+async def download_youtube_and_notify(
+    bot,
+    chat_id: int,
+    user_id: int,
+    url: str,
+    display_name: str,
+    content_key: str = None,
+    resumed: bool = False,
+    filesize: int = None,
+    format_spec: str = None
+):
+    """Queue a single YouTube download, report its progress and notify on completion."""
+    # Progress tracking
+    progress_message_id = [None] # Store message ID for editing
+    task_id_container = [None] # Store task ID for cancel button
+    keyboard_container = [None] # Cancel button kept on the progress message
+    
+    def progress_hook(d):
+        """Progress hook for yt-dlp - logs progress to console"""
+        if not Config.ENABLE_PROGRESS_NOTIFICATIONS:
+            return
+        
+        logger.debug(f"Progress hook called for user {user_id}, task {task_id_container[0]}, status: {d.get('status')}")
+        
+        if d['status'] == 'downloading':
+            # Cancellation is enforced by the download manager's hook;
+            # the progress dispatcher throttles and coalesces the edits
             
-            logger.debug(f"Progress hook called for user {user_id}, task {task_id_container[0]}, status: {d.get('status')}")
+            # Extract progress information
+            percent = d.get('_percent_str', 'N/A').strip()
+            speed = d.get('_speed_str', 'N/A').strip()
+            eta = d.get('_eta_str', 'N/A').strip()
             
-            if d['status'] == 'downloading':
-                # Check for cancellation
-                if task_id_container[0]:
-                    task = download_manager.get_task(task_id_container[0])
-                    if task and task.cancelled:
-                        raise CancelledError("Download cancelled")
-                
-                current_time = time.time()
-                
-                # Throttle updates based on PROGRESS_UPDATE_INTERVAL
-                if current_time - last_update_time[0] < Config.PROGRESS_UPDATE_INTERVAL:
-                    return
-                
-                last_update_time[0] = current_time
-                
-                # Extract progress information
-                percent = d.get('_percent_str', 'N/A').strip()
-                speed = d.get('_speed_str', 'N/A').strip()
-                eta = d.get('_eta_str', 'N/A').strip()
-                
-                # Log progress
-                logger.debug(f"Download progress for user {user_id}: {percent} | Speed: {speed} | ETA: {eta}")
-                
-                # Send progress to user if message ID is available
-                if progress_message_id[0] and Config.ENABLE_PROGRESS_NOTIFICATIONS:
-                    progress_text = (
-                        f"📥 **Downloading...**\n"
-                        f"{display_name}\n\n"
-                        f"📊 Progress: {percent}\n"
-                        f"🚀 Speed: {speed}\n"
-                        f"⏳ ETA: {eta}"
-                    )
-                    
-                    # Schedule async edit in the main loop
-                    asyncio.run_coroutine_threadsafe(
-                        edit_progress_msg(chat_id, progress_message_id[0], progress_text, task_id_container[0]),
-                        loop
-                    )
-        
-        # Create download function wrapper
-        def download_func():
-            download_video(message_text, progress_hook=progress_hook)
-        
-        # Helper to delete processing message
+            # Log progress
+            logger.debug(f"Download progress for user {user_id}: {percent} | Speed: {speed} | ETA: {eta}")
+            
+            progress_text = (
+                f"📥 **Downloading...**\n"
+                f"{display_name}\n\n"
+                f"📊 Progress: {percent}\n"
+                f"🚀 Speed: {speed}\n"
+                f"⏳ ETA: {eta}"
+            )
+        elif d.get('postprocessor') == POSTPROCESS_STAGE and d['status'] == 'started':
+            progress_text = f"⏳ **Downloaded**\n{display_name}\n\nWaiting for a free converter"
+        elif d.get('postprocessor') == POSTPROCESS_STAGE and d['status'] == 'processing':
+            progress_text = f"⚙️ **Converting...**\n{display_name}\n\nMerging and converting with ffmpeg"
+        elif d.get('postprocessor') == FINALIZE_POSTPROCESSOR and d['status'] == 'started':
+            # Moving out of the temp directory, a full copy if it is on another filesystem
+            progress_text = f"📦 **Finalizing...**\n{display_name}\n\nMoving the file into the library"
+        else:
+            return
+        
+        # Send progress to user if message ID is available
+        if progress_message_id[0]:
+            progress_dispatcher.update(
+                chat_id, progress_message_id[0], progress_text,
+                reply_markup=keyboard_container[0], parse_mode='Markdown'
+            )
+            
+            # Mirror progress to requests attached to this download
+            task = download_manager.get_task(task_id_container[0])
+            for watcher_chat_id, watcher_message_id in (task.watchers if task else []):
+                progress_dispatcher.update(watcher_chat_id, watcher_message_id, progress_text, parse_mode='Markdown')
+    
+    # Create download function (picklable, so it can run in a worker process)
+    download_func = functools.partial(download_video, url, format_spec=format_spec, handoff=handoff_info(url))
+    
+    try:
+        # Queue and execute download
+        task_id, future = await download_manager.submit_download(
+            download_func=download_func,
+            task_type='youtube',
+            url=url,
+            progress_callback=progress_hook,
+            user_id=user_id,
+            chat_id=chat_id,
+            payload={
+                'display_name': display_name, 'content_key': content_key,
+                'filesize': filesize, 'format': format_spec,
+            },
+            dedup_key=content_key,
+            size_estimate=filesize
+        )
+        task_id_container[0] = task_id
+        
+        # Notify user if they need to wait
+        await notify_queue_position(bot, chat_id, task_id)
+        
+        # Send download start notification (silent) with title
+        status = download_manager.get_queue_status()
+        start_msg = f"🎬 Starting download...\n{display_name}\n📊 Queue: {status['active']}/{status['max']} active"
+        if resumed:
+            start_msg = f"♻️ Resumed after restart\n{start_msg}"
+        
+        # Add cancel button
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🛑 Cancel", callback_data=f"cancel_{task_id}")]
+        ])
+        keyboard_container[0] = keyboard
+        
+        # Send start message with cancel button
+        start_msg_obj = await bot.send_message(
+            chat_id=chat_id,
+            text=start_msg,
+            reply_markup=keyboard,
+            disable_notification=True
+        )
+        progress_message_id[0] = start_msg_obj.message_id
+        logger.info(f"Set progress_message_id={progress_message_id[0]} for YouTube task {task_id}")
+        
+        # Wait for download completion
+        try:
+            paths = await future
+        finally:
+            progress_dispatcher.forget(chat_id, progress_message_id[0])
+        
+        # Send completion notification (silent) with title
+        complete_msg = f"✅ Download complete!\n{display_name}"
+        await bot.send_message(
+            chat_id=chat_id,
+            text=complete_msg,
+            disable_notification=True
+        )
+        if uploader and paths:
+            await upload_and_notify(bot, chat_id, paths, content_key, display_name)
+    except CancelledError:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"❌ Download cancelled.\n{display_name}",
+            disable_notification=True
+        )
+    except StorageFullError as e:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"❌ {e}\n{display_name}",
+            disable_notification=True
+        )
+    except Exception as e:
+        logger.error(f"Error in download task: {e}")
+        await bot.send_message(
+            chat_id=chat_id,
+            text=Config.BOT_ERROR_MESSAGE,
+            disable_notification=True
+        )
+
+
+async def upload_and_notify(bot, chat_id: int, paths: list, content_key: str, display_name: str):
+    """Send downloaded files to the chat (from the file_id cache if possible), reporting upload progress."""
+    status_text = f"📤 Sending to chat...\n{display_name}"
+    status_msg = await bot.send_message(chat_id=chat_id, text=status_text, disable_notification=True)
+    
+    def progress_callback(sent, total):
+        progress_dispatcher.update(
+            chat_id, status_msg.message_id, f"{status_text}\n\n📊 Progress: {sent * 100 / total:.1f}%"
+        )
+    
+    try:
+        await uploader.deliver(chat_id, paths, content_key, caption=display_name, progress_callback=progress_callback)
+    except (UploadError, BadRequest) as e:
+        logger.error(f"Could not send {paths} to chat {chat_id}: {e}")
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"⚠️ Downloaded, but could not send it to this chat.\n{display_name}",
+            disable_notification=True
+        )
+    finally:
+        progress_dispatcher.forget(chat_id, status_msg.message_id)
         try:
-            await processing_msg.delete()
+            await status_msg.delete()
         except:
             pass  # Ignore if already deleted or fails
 
-        # Send download start notification (silent) with title
+
+async def follow_download_and_notify(bot, chat_id: int, task, display_name: str):
+    """Attach a request to a task already downloading the same content."""
+    try:
+        follow_msg = await bot.send_message(
+            chat_id=chat_id,
+            text=f"⏳ Already downloading (Task {task.task_id}), following it...\n{display_name}",
+            disable_notification=True
+        )
+        task.watchers.append((chat_id, follow_msg.message_id))
+        
+        # Wait for the original download
+        try:
+            paths = await task.future
+        finally:
+            progress_dispatcher.forget(chat_id, follow_msg.message_id)
+        
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"✅ Download complete!\n{display_name}",
+            disable_notification=True
+        )
+        if uploader and paths and task.task_type == 'youtube':
+            await upload_and_notify(bot, chat_id, paths, task.dedup_key, display_name)
+    except CancelledError:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"❌ Download cancelled.\n{display_name}",
+            disable_notification=True
+        )
+    except StorageFullError as e:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"❌ {e}\n{display_name}",
+            disable_notification=True
+        )
+    except Exception as e:
+        logger.error(f"Error in followed download task {task.task_id}: {e}")
+        await bot.send_message(
+            chat_id=chat_id,
+            text=Config.BOT_ERROR_MESSAGE,
+            disable_notification=True
+        )
+
+
+async def download_playlist_and_notify(
+    bot,
+    chat_id: int,
+    user_id: int,
+    url: str,
+    video_info: dict,
+    display_name: str,
+    resumed: bool = False,
+    label: str = 'playlist'
+):
+    """
+    Queue every playlist entry as a child task and report aggregated progress.
+    
+    Also used for batches of links (label='batch'), whose entries are
+    downloaded the same way under one progress message.
+    """
+    # Skip entries that are already downloaded or being downloaded by another task
+    entries = [
+        entry for entry in video_info['entries']
+        if not entry.get('content_key') or not (
+            is_downloaded(entry['content_key']) or download_manager.get_task_by_key(entry['content_key'])
+        )
+    ]
+    skipped = len(video_info['entries']) - len(entries)
+    if not entries:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"✅ Already downloaded!\n{display_name}",
+            disable_notification=True
+        )
+        return
+    
+    # Progress tracking, shared by all entries of the playlist
+    entry_progress = [0.0] * len(entries)  # Percent per entry
+    progress_message_id = [None]
+    keyboard_container = [None]
+    
+    def make_progress_hook(index):
+        def progress_hook(d):
+            """Progress hook for one playlist entry - updates the playlist message"""
+            if d['status'] == 'downloading':
+                total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+                if total_bytes:
+                    entry_progress[index] = min(100.0, d.get('downloaded_bytes', 0) * 100 / total_bytes)
+            elif d['status'] == 'finished':
+                entry_progress[index] = 100.0
+            
+            if not Config.ENABLE_PROGRESS_NOTIFICATIONS or not progress_message_id[0]:
+                return
+            
+            finished = sum(1 for percent in entry_progress if percent >= 100)
+            overall = sum(entry_progress) / len(entry_progress)
+            progress_text = (
+                f"📥 Downloading {label}...\n"
+                f"{display_name}\n\n"
+                f"📊 Progress: {overall:.1f}%\n"
+                f"✅ Videos: {finished}/{len(entries)}"
+            )
+            
+            progress_dispatcher.update(
+                chat_id, progress_message_id[0], progress_text, reply_markup=keyboard_container[0]
+            )
+        return progress_hook
+    
+    def make_download_func(entry):
+        # Picklable, so it can run in a worker process
+        return functools.partial(
+            download_video, entry['url'], extra_info=entry['extra_info'], handoff=handoff_info(entry['url'])
+        )
+    
+    try:
+        parent_id, future, _ = await download_manager.submit_group(
+            jobs=[
+                (entry['url'], make_download_func(entry), make_progress_hook(index), entry)
+                for index, entry in enumerate(entries)
+            ],
+            task_type='youtube',
+            url=url,
+            user_id=user_id,
+            chat_id=chat_id,
+            payload={'display_name': display_name, 'label': label}
+        )
+        
+        # Add cancel button for the whole playlist
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🛑 Cancel", callback_data=f"cancel_{parent_id}")]
+        ])
+        keyboard_container[0] = keyboard
         status = download_manager.get_queue_status()
-        start_msg = f"🎬 Starting download...\n{display_name}\n📊 Queue: {status['active'] + 1}/{status['max']} active"
+        start_msg = f"🎬 Starting {label} download...\n{display_name}\n📊 Queue: {status['active']}/{status['max']} active"
+        if skipped:
+            start_msg += f"\n⏭ {skipped} videos already downloaded or in progress"
+        if resumed:
+            start_msg = f"♻️ Resumed after restart\n{start_msg}"
+        start_msg_obj = await bot.send_message(
+            chat_id=chat_id,
+            text=start_msg,
+            reply_markup=keyboard,
+            disable_notification=True
+        )
+        progress_message_id[0] = start_msg_obj.message_id
+        logger.info(f"Set progress_message_id={progress_message_id[0]} for playlist task {parent_id}")
         
-        # Create async task for download and completion notification
-        async def download_and_notify():
-            try:
-                # Queue and execute download
-                task_id, future = await download_manager.submit_download(
-                    download_func=download_func,
-                    task_type='youtube',
-                    url=message_text,
-                    user_id=user_id,
-                    chat_id=chat_id
-                )
-                task_id_container[0] = task_id
-                
-                # Add cancel button
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🛑 Cancel", callback_data=f"cancel_{task_id}")]
-                ])
-                
-                # Send start message with cancel button
-                start_msg_obj = await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=start_msg,
-                    reply_markup=keyboard,
-                    disable_notification=True
-                )
-                progress_message_id[0] = start_msg_obj.message_id
-                logger.info(f"Set progress_message_id={progress_message_id[0]} for YouTube task {task_id}")
-                
-                # Wait for download completion
-                await future
-                
-                # Send completion notification (silent) with title
-                complete_msg = f"✅ Download complete!\n{display_name}"
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=complete_msg,
-                    disable_notification=True
-                )
-            except CancelledError:
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"❌ Download cancelled.\n{display_name}",
-                    disable_notification=True
-                )
-            except Exception as e:
-                logger.error(f"Error in download task: {e}")
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=Config.BOT_ERROR_MESSAGE,
-                    disable_notification=True
-                )
+        # Wait for all entries
+        try:
+            summary = await future
+        finally:
+            progress_dispatcher.forget(chat_id, progress_message_id[0])
         
-        # Start download task without waiting (fire-and-forget)
-        asyncio.create_task(download_and_notify())
+        complete_msg = f"✅ Download complete!\n{display_name}\n🎞 {summary['completed']}/{len(entries)} videos"
+        if summary['failed']:
+            complete_msg += f"\n⚠️ {summary['failed']} failed"
+        if summary['no_space']:
+            complete_msg += f" ({summary['no_space']} too large for the free disk space)"
+        await bot.send_message(
+            chat_id=chat_id,
+            text=complete_msg,
+            disable_notification=True
+        )
         
+        # Send each finished entry to the chat, one after the other
+        if uploader:
+            for entry, paths in zip(entries, summary['paths']):
+                if paths:
+                    entry_name = f"🎥 {entry.get('title') or entry['url']}"
+                    await upload_and_notify(bot, chat_id, paths, entry.get('content_key'), entry_name)
+    except CancelledError:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"❌ Download cancelled.\n{display_name}",
+            disable_notification=True
+        )
     except Exception as e:
-        logger.error(f"Error processing YouTube link: {e}")
-        await update.message.reply_text(Config.BOT_ERROR_MESSAGE)
+        logger.error(f"Error in {label} download task: {e}")
+        await bot.send_message(
+            chat_id=chat_id,
+            text=Config.BOT_ERROR_MESSAGE,
+            disable_notification=True
+        )
 
 
 @check_auth
@@ -323,122 +837,448 @@ async def handle_telegram_video(update: Update, context: ContextTypes.DEFAULT_TY
             await update.message.reply_text(Config.BOT_TELEGRAM_VIDEO_TOO_LARGE)
             return
         
-        # Get queue status before queueing
-        queue_status_before = download_manager.get_queue_status()
-        
-        # Notify user if they need to wait
-        if queue_status_before['active'] >= queue_status_before['max']:
-            position = queue_status_before['total'] + 1
-            total = position
-            queue_msg = Config.BOT_QUEUE_MESSAGE.format(position=position, total=total)
-            await update.message.reply_text(queue_msg, disable_notification=True)
+        # Answer repeated videos from the in-flight tasks and the download directory
+        content_key = f"telegram {video.file_unique_id}"
+        existing_task = download_manager.get_task_by_key(content_key)
+        if existing_task:
+            logger.info(f"Attaching user {user_id} to task {existing_task.task_id} for {content_key}")
+            asyncio.create_task(
+                follow_download_and_notify(context.bot, chat_id, existing_task, "📹 Telegram video")
+            )
+            return
+        if os.path.exists(get_telegram_video_path(video)):
+            await update.message.reply_text("✅ Already downloaded!\n📹 Telegram video")
+            return
         
-        video_info = get_video_info(video)
+        video_info = get_telegram_video_info(video)
         logger.info(f"Queueing Telegram video download for user {user_id}: {video_info}")
         
-        # Create download function wrapper
-        async def download_func_async():
-            await download_telegram_video(video, context)
+        # Start download task without waiting (fire-and-forget)
+        asyncio.create_task(download_telegram_and_notify(context.bot, chat_id, user_id, video))
         
-        def download_func():
-            # Run async function in sync context
-            import asyncio
-            try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            try:
-                loop.run_until_complete(download_func_async())
-            finally:
-                if not loop.is_running():
-                    loop.close()
+    except ValueError as e:
+        # Size limit error already handled above, but catch any other ValueError
+        logger.error(f"Error processing Telegram video: {e}")
+        await update.message.reply_text(str(e))
+        logger.error(f"Error processing Telegram video: {e}")
+        await update.message.reply_text(Config.BOT_ERROR_MESSAGE)
+
+
+async def download_telegram_and_notify(
+    bot,
+    chat_id: int,
+    user_id: int,
+    video: Video,
+    resumed: bool = False
+):
+    """Queue a Telegram video download, report its progress and notify on completion."""
+    # Coroutine job, runs on the event loop under the manager's slot limits
+    download_func = functools.partial(download_telegram_video, video)
+    
+    video_size_mb = video.file_size / (1024 * 1024)
+    
+    # Progress tracking
+    progress_message_id = [None]
+    task_id_container = [None]
+    keyboard_container = [None]
+    
+    def progress_hook(d):
+        """Progress hook for the Telegram download - updates the progress message"""
+        if not Config.ENABLE_PROGRESS_NOTIFICATIONS or not progress_message_id[0]:
+            return
+        
+        if d['status'] == 'downloading':
+            total = d.get('total_bytes') or video.file_size
+            percent = d.get('downloaded_bytes', 0) * 100 / total if total else 0
+            speed = f"{d['speed'] / (1024 * 1024):.1f}MiB/s" if d.get('speed') else 'N/A'
+            eta = f"{d['eta']:.0f}s" if d.get('eta') is not None else 'N/A'
+            progress_text = (
+                f"📥 Downloading Telegram video...\n"
+                f"📹 Size: {video_size_mb:.1f}MB\n\n"
+                f"📊 Progress: {percent:.1f}%\n"
+                f"🚀 Speed: {speed}\n"
+                f"⏳ ETA: {eta}"
+            )
+        elif d.get('postprocessor') == FINALIZE_POSTPROCESSOR and d['status'] == 'started':
+            progress_text = f"📦 Finalizing...\n📹 Size: {video_size_mb:.1f}MB\n\nMoving the file into the library"
+        else:
+            return
+        progress_dispatcher.update(
+            chat_id, progress_message_id[0], progress_text, reply_markup=keyboard_container[0]
+        )
+        
+        # Mirror progress to requests attached to this download
+        task = download_manager.get_task(task_id_container[0])
+        for watcher_chat_id, watcher_message_id in (task.watchers if task else []):
+            progress_dispatcher.update(watcher_chat_id, watcher_message_id, progress_text)
+    
+    # Small videos may jump ahead of long YouTube downloads
+    priority = PRIORITY_HIGH if video.file_size <= Config.SMALL_JOB_MAX_SIZE else PRIORITY_NORMAL
+    
+    try:
+        # Queue and execute download
+        task_id, future = await download_manager.submit_download(
+            download_func=download_func,
+            task_type='telegram',
+            url=video.file_id,
+            user_id=user_id,
+            chat_id=chat_id,
+            progress_callback=progress_hook,
+            payload={'video': video.to_dict()},
+            dedup_key=f"telegram {video.file_unique_id}",
+            priority=priority,
+            size_estimate=video.file_size
+        )
+        task_id_container[0] = task_id
+        
+        # Notify user if they need to wait
+        await notify_queue_position(bot, chat_id, task_id)
         
         # Queue status
         status = download_manager.get_queue_status()
-        video_size_mb = video.file_size / (1024 * 1024)
-        start_msg = f"📥 Telegram video queued...\n📹 Size: {video_size_mb:.1f}MB\n📊 Queue: {status['active'] + 1}/{status['max']} active"
+        start_msg = f"📥 Telegram video queued...\n📹 Size: {video_size_mb:.1f}MB\n📊 Queue: {status['active']}/{status['max']} active"
+        if resumed:
+            start_msg = f"♻️ Resumed after restart\n{start_msg}"
+        
+        # Add cancel button
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🛑 Cancel", callback_data=f"cancel_{task_id}")]
+        ])
+        keyboard_container[0] = keyboard
         
-        # Progress tracking (for Telegram videos, mainly for cancel button)
-        progress_message_id = [None] # Store message ID for editing
-        task_id_container = [None] # Store task ID for cancel button
+        # Send start message with cancel button
+        start_msg_obj = await bot.send_message(
+            chat_id=chat_id,
+            text=start_msg,
+            reply_markup=keyboard,
+            disable_notification=True
+        )
+        progress_message_id[0] = start_msg_obj.message_id
+        logger.info(f"Set progress_message_id={progress_message_id[0]} for Telegram task {task_id}")
         
-        # Create async task for download and completion notification
-        async def download_and_notify():
+        # Wait for download completion
+        try:
+            await future
+        finally:
+            progress_dispatcher.forget(chat_id, progress_message_id[0])
+        
+        # Send completion notification (silent) with video info
+        complete_msg = f"✅ Download complete!\n📹 Telegram video ({video_size_mb:.1f}MB)"
+        await bot.send_message(
+            chat_id=chat_id,
+            text=complete_msg,
+            disable_notification=True
+        )
+    except CancelledError:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"❌ Download cancelled.\n📹 Telegram video ({video_size_mb:.1f}MB)",
+            disable_notification=True
+        )
+    except StorageFullError as e:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"❌ {e}\n📹 Telegram video ({video_size_mb:.1f}MB)",
+            disable_notification=True
+        )
+    except Exception as e:
+        logger.error(f"Error in Telegram video download task: {e}")
+        await bot.send_message(
+            chat_id=chat_id,
+            text=Config.BOT_ERROR_MESSAGE,
+            disable_notification=True
+        )
+
+
+async def post_init(application):
+    """Start the progress dispatcher, metrics endpoint, concurrency tuning and uploader, then resume unfinished jobs."""
+    global progress_dispatcher, metrics_server, concurrency_controller, uploader
+    progress_dispatcher = ProgressDispatcher(
+        application.bot,
+        max_edits_per_second=Config.PROGRESS_EDITS_PER_SECOND,
+        min_interval=Config.PROGRESS_UPDATE_INTERVAL
+    )
+    progress_dispatcher.start()
+    
+    # The webhook is served by the same HTTP server
+    webhook_mode = Config.UPDATE_MODE == 'webhook'
+    if Config.METRICS_ENABLED or webhook_mode:
+        try:
+            metrics_server = await metrics.start_http_server(Config.METRICS_PORT, serve_metrics=Config.METRICS_ENABLED)
+        except OSError as e:
+            logger.error(f"Could not start HTTP endpoint on port {Config.METRICS_PORT}: {e}")
+            if webhook_mode:
+                raise
+    
+    if Config.AUTO_TUNE_CONCURRENCY:
+        concurrency_controller = ConcurrencyController(
+            download_manager,
+            min_downloads=Config.AUTO_TUNE_MIN_DOWNLOADS,
+            max_downloads=Config.AUTO_TUNE_MAX_DOWNLOADS,
+            min_fragments=Config.AUTO_TUNE_MIN_FRAGMENTS,
+            max_fragments=Config.AUTO_TUNE_MAX_FRAGMENTS,
+            interval=Config.AUTO_TUNE_INTERVAL,
+            disk_latency=Config.AUTO_TUNE_DISK_LATENCY
+        )
+        concurrency_controller.start()
+    
+    if Config.UPLOAD_TO_CHAT:
+        uploader = Uploader(
+            application.bot, download_manager.job_store, Config.TELEGRAM_UPLOAD_MAX_SIZE, Config.TEMP_DOWNLOAD_DIR
+        )
+    
+    await resume_jobs(application)
+
+
+async def post_shutdown(application):
+    """Stop the progress dispatcher, metrics endpoint and concurrency tuning, close the HTTP clients and write threads."""
+    if concurrency_controller:
+        await concurrency_controller.stop()
+    if progress_dispatcher:
+        await progress_dispatcher.stop()
+    if probe_pool:
+        probe_pool.shutdown()
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    if uploader:
+        await uploader.close()
+    await close_http_client()
+    shutdown_write_executor()
+
+
+async def run_webhook(application):
+    """
+    Run the application on updates Telegram POSTs to WEBHOOK_URL, until SIGINT or SIGTERM.
+    
+    Mirrors Application.run_polling() (post_init, start, stop, shutdown,
+    post_shutdown), with the webhook route served by the metrics HTTP server.
+    Switching back to polling deletes the webhook again.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    secret_token = Config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    path = Config.WEBHOOK_PATH or urlsplit(Config.WEBHOOK_URL).path or '/'
+    metrics.add_route('POST', path, WebhookHandler(application, secret_token))
+    
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.bot.set_webhook(
+            url=Config.WEBHOOK_URL,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=Config.WEBHOOK_MAX_CONNECTIONS
+        )
+        logger.info(f"Receiving updates at {Config.WEBHOOK_URL} (served on port {Config.METRICS_PORT}, path {path})")
+        await application.start()
+        await stop_event.wait()
+        logger.info("Stopping bot...")
+        await application.stop()
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+async def resume_jobs(application):
+    """Re-enqueue jobs that were queued or running when the bot last stopped."""
+    job_store = download_manager.job_store
+    if job_store is None:
+        return
+    
+    jobs = job_store.unfinished_jobs()
+    if not jobs:
+        return
+    
+    # The journal rows are closed here; resumed jobs are journaled again under new IDs
+    job_store.set_state([job['id'] for job in jobs], 'resumed')
+    logger.info(f"Resuming {len(jobs)} unfinished jobs from the journal")
+    
+    bot = application.bot
+    children = {}
+    for job in jobs:
+        if job['parent_id'] is not None:
+            children.setdefault(job['parent_id'], []).append(job)
+    
+    for job in jobs:
+        payload = job['payload'] or {}
+        if job['parent_id'] is not None:
+            # Playlist entries are resumed together with their playlist
+            continue
+        elif job['task_type'] == 'playlist':
+            entries = [child['payload'] for child in children.get(job['id'], [])]
+            if not entries:
+                continue
+            coro = download_playlist_and_notify(
+                bot, job['chat_id'], job['user_id'], job['url'],
+                {'type': 'playlist', 'entries': entries}, payload.get('display_name', job['url']),
+                resumed=True, label=payload.get('label', 'playlist')
+            )
+        elif job['task_type'] == 'telegram':
+            video = Video.de_json(payload['video'], bot)
+            coro = download_telegram_and_notify(bot, job['chat_id'], job['user_id'], video, resumed=True)
+        else:
+            coro = download_youtube_and_notify(
+                bot, job['chat_id'], job['user_id'], job['url'],
+                payload.get('display_name', job['url']), payload.get('content_key'), resumed=True,
+                filesize=payload.get('filesize'), format_spec=payload.get('format')
+            )
+        asyncio.create_task(coro)
+
+
+async def probe_links(urls: list) -> list:
+    """
+    Extract the metadata of several links concurrently, BATCH_PROBE_CONCURRENCY at a time.
+    
+    Returns:
+        One result per link: the video info, None if extraction failed, or
+        False if the probe timed out
+    """
+    semaphore = asyncio.Semaphore(Config.BATCH_PROBE_CONCURRENCY)
+    
+    async def probe(url):
+        async with semaphore:
             try:
-                # Queue and execute download
-                task_id, future = await download_manager.submit_download(
-                    download_func=download_func,
-                    task_type='telegram',
-                    url=video.file_id,
-                    user_id=user_id,
-                    chat_id=chat_id
-                )
-                task_id_container[0] = task_id
-                
-                # Add cancel button
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🛑 Cancel", callback_data=f"cancel_{task_id}")]
-                ])
-                
-                # Send start message with cancel button
-                start_msg_obj = await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=start_msg,
-                    reply_markup=keyboard,
-                    disable_notification=True
-                )
-                progress_message_id[0] = start_msg_obj.message_id
-                logger.info(f"Set progress_message_id={progress_message_id[0]} for Telegram task {task_id}")
-                
-                # Wait for download completion
-                await future
-                
-                # Send completion notification (silent) with video info
-                complete_msg = f"✅ Download complete!\n📹 Telegram video ({video_size_mb:.1f}MB)"
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=complete_msg,
-                    disable_notification=True
-                )
-            except CancelledError:
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"❌ Download cancelled.\n📹 Telegram video ({video_size_mb:.1f}MB)",
-                    disable_notification=True
-                )
-            except Exception as e:
-                logger.error(f"Error in Telegram video download task: {e}")
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=Config.BOT_ERROR_MESSAGE,
-                    disable_notification=True
-                )
+                return await probe_pool.probe(url)
+            except asyncio.TimeoutError:
+                return False
+    
+    return await asyncio.gather(*(probe(url) for url in urls))
+
+
+@check_auth
+async def handle_link_batch(update: Update, context: ContextTypes.DEFAULT_TYPE, urls: list):
+    """Handle several YouTube links at once: one batch job with a single progress message."""
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    
+    try:
+        if len(urls) > Config.BATCH_MAX_LINKS:
+            await update.message.reply_text(
+                f"⚠️ Only the first {Config.BATCH_MAX_LINKS} of {len(urls)} links will be downloaded."
+            )
+            urls = urls[:Config.BATCH_MAX_LINKS]
         
-        # Start download task without waiting (fire-and-forget)
-        asyncio.create_task(download_and_notify())
+        processing_msg = await update.message.reply_text(f"🔎 Processing {len(urls)} links...")
+        video_infos = await probe_links(urls)
         
-    except ValueError as e:
-        # Size limit error already handled above, but catch any other ValueError
-        logger.error(f"Error processing Telegram video: {e}")
-        await update.message.reply_text(str(e))
-        logger.error(f"Error processing Telegram video: {e}")
+        # Flatten playlists into their entries and drop links to the same video
+        entries = []
+        failed = []
+        seen = set()
+        for url, video_info in zip(urls, video_infos):
+            if video_info is None:
+                failed.append(url)
+                continue
+            if video_info is False:
+                # Slow probe: download it without metadata
+                candidates = [{'url': url, 'title': url, 'content_key': None, 'filesize': None, 'extra_info': {}}]
+            elif video_info['type'] == 'playlist' and Config.PLAYLIST_FANOUT:
+                candidates = video_info.get('entries') or []
+            else:
+                candidates = [{
+                    'url': url,
+                    'title': video_info['title'],
+                    'content_key': video_info.get('content_key'),
+                    'filesize': video_info.get('filesize'),
+                    'extra_info': {},
+                }]
+            for entry in candidates:
+                key = entry.get('content_key') or entry['url']
+                if key not in seen:
+                    seen.add(key)
+                    entries.append(entry)
+        
+        if failed:
+            failed_msg = f"⚠️ Could not read {len(failed)} of {len(urls)} links:\n" + "\n".join(failed[:5])
+            if len(failed) > 5:
+                failed_msg += f"\n... and {len(failed) - 5} more"
+            await processing_msg.edit_text(failed_msg, disable_web_page_preview=True)
+        else:
+            try:
+                await processing_msg.delete()
+            except:
+                pass  # Ignore if already deleted or fails
+        if not entries:
+            return
+        
+        logger.info(f"Queueing batch for user {user_id}: {len(urls)} links, {len(entries)} videos")
+        display_name = f"📦 {len(entries)} videos from {len(urls)} links"
+        asyncio.create_task(
+            download_playlist_and_notify(
+                context.bot, chat_id, user_id, f"batch of {len(urls)} links",
+                {'type': 'playlist', 'entries': entries}, display_name, label='batch'
+            )
+        )
+    
+    except Exception as e:
+        logger.error(f"Error processing link batch: {e}")
         await update.message.reply_text(Config.BOT_ERROR_MESSAGE)
 
 
+def extract_message_urls(message) -> list:
+    """Find all YouTube links of a message: in its text or caption and behind text links."""
+    urls = extract_urls(message.text or message.caption or '')
+    if message.text:
+        entities = message.parse_entities([MessageEntity.TEXT_LINK])
+    else:
+        entities = message.parse_caption_entities([MessageEntity.TEXT_LINK])
+    for entity in entities:
+        parsed = parse_url(entity.url) if entity.url else None
+        if parsed and parsed.canonical_url not in urls:
+            urls.append(parsed.canonical_url)
+    return urls
+
+
+async def handle_links(update: Update, context: ContextTypes.DEFAULT_TYPE, urls: list):
+    """Download a single link directly, several as one batch."""
+    if len(urls) == 1:
+        await handle_youtube_link(update, context, urls[0])
+    else:
+        await handle_link_batch(update, context, urls)
+
+
 @check_auth
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle incoming text messages (YouTube links)."""
-    message_text = update.message.text
+    urls = extract_message_urls(update.message)
     
-    # Check if message contains a YouTube link
-    if is_valid_youtube_url(message_text):
-        await handle_youtube_link(update, context)
+    if urls:
+        await handle_links(update, context, urls)
     else:
         await update.message.reply_text("Please send a valid YouTube link or video.")
 
 
+@check_auth
+async def handle_link_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle text files with YouTube links, e.g. exported lists: download them all as a batch."""
+    document = update.message.document
+    if document.file_size and document.file_size > Config.BATCH_FILE_MAX_SIZE:
+        await update.message.reply_text(
+            f"❌ File is too large (max {Config.BATCH_FILE_MAX_SIZE // 1024}KB for link lists)"
+        )
+        return
+    
+    try:
+        file = await document.get_file()
+        content = await file.download_as_bytearray()
+    except Exception as e:
+        logger.error(f"Error reading link file {document.file_name}: {e}")
+        await update.message.reply_text(Config.BOT_ERROR_MESSAGE)
+        return
+    
+    urls = extract_urls(content.decode('utf-8', errors='replace'))
+    if urls:
+        await handle_links(update, context, urls)
+    else:
+        await update.message.reply_text(f"No YouTube links found in {document.file_name or 'the file'}.")
+
+
 async def error(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Log errors caused by updates."""
     logger.error(f"Update {update} caused error: {context.error}")
@@ -454,9 +1294,62 @@ def main():
         logger.error(f"Configuration error: {e}")
         raise
     
+    # Keep partial downloads on the download filesystem, so finishing a file is a rename
+    if Config.TEMP_ON_DOWNLOAD_FILESYSTEM:
+        temp_dir = resolve_temp_dir(Config.TEMP_DOWNLOAD_DIR, Config.DOWNLOAD_DIR, Config.TEMP_STAGING_DIR)
+        if temp_dir != Config.TEMP_DOWNLOAD_DIR:
+            Config.TEMP_DOWNLOAD_DIR = temp_dir
+            # Process backend workers load their Config from the environment
+            os.environ["TEMP_DOWNLOAD_DIR"] = temp_dir
+    
+    # Initialize the job journal so queued downloads survive restarts
+    job_store = JobStore(Config.JOB_JOURNAL_FILE) if Config.JOB_JOURNAL else None
+    
+    # Reserve disk space for downloads before they start
+    storage = None
+    if Config.STORAGE_ADMISSION:
+        on_evict = None
+        if job_store is not None:
+            def on_evict(paths):
+                # Evicted videos must be downloadable again: drop them from the archive
+                forget_downloaded(job_store.pop_files(paths))
+        elif Config.STORAGE_EVICT_DIR and Config.DOWNLOAD_ARCHIVE:
+            logger.warning(
+                "STORAGE_EVICT_DIR without JOB_JOURNAL: evicted videos stay in the download "
+                "archive and won't be downloaded again"
+            )
+        storage = StorageBudget(
+            Config.DOWNLOAD_DIR,
+            min_free=Config.STORAGE_MIN_FREE,
+            default_reservation=Config.STORAGE_DEFAULT_RESERVATION,
+            evict_dir=Config.STORAGE_EVICT_DIR or None,
+            evict_min_age=Config.STORAGE_EVICT_MIN_AGE_HOURS * 3600,
+            recheck_interval=Config.STORAGE_RECHECK_INTERVAL,
+            max_bypass=Config.STORAGE_MAX_BYPASS,
+            on_evict=on_evict
+        )
+    
     # Initialize download manager
-    download_manager = get_download_manager(max_concurrent=Config.MAX_CONCURRENT_DOWNLOADS)
+    download_manager = get_download_manager(
+        max_concurrent=Config.MAX_CONCURRENT_DOWNLOADS,
+        job_store=job_store,
+        max_per_user=Config.MAX_DOWNLOADS_PER_USER,
+        backend=Config.EXECUTOR_BACKEND,
+        max_jobs_per_worker=Config.MAX_JOBS_PER_WORKER,
+        temp_dir=Config.TEMP_DOWNLOAD_DIR,
+        max_concurrent_limit=Config.AUTO_TUNE_MAX_DOWNLOADS if Config.AUTO_TUNE_CONCURRENCY else None,
+        storage=storage,
+        postprocess_workers=Config.POSTPROCESS_WORKERS,
+        postprocess_backlog=Config.POSTPROCESS_BACKLOG,
+        warmup=warm_ffmpeg
+    )
     logger.info(f"Download manager initialized with max_concurrent={Config.MAX_CONCURRENT_DOWNLOADS}")
+    metrics.register_download_manager(download_manager)
+    
+    # Metadata probes get their own bounded pool
+    global probe_pool
+    probe_pool = ProbePool(get_video_info, max_workers=Config.PROBE_WORKERS, timeout=Config.PROBE_TIMEOUT)
+    metrics.register_probe_pool(probe_pool)
     
     # Initialize auth manager
     global auth_manager
@@ -466,24 +1359,55 @@ def main():
     else:
         logger.info("Authentication disabled (no password set).")
     
-    application = ApplicationBuilder().token(Config.BOT_TOKEN).build()
+    # Handle chats in parallel, each chat's updates in order
+    update_processor = ChatOrderedUpdateProcessor(max(1, Config.CONCURRENT_UPDATES), Config.UPDATE_BACKLOG)
+    metrics.register_update_processor(update_processor)
+    
+    builder = (
+        ApplicationBuilder()
+        .token(Config.BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(update_processor)
+        .update_queue(update_processor.make_queue())
+        # Bot API latency and flood-wait metrics
+        .request(metrics.InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(metrics.InstrumentedRequest(connection_pool_size=1))
+    )
+    if Config.TELEGRAM_LOCAL_MODE:
+        # Self-hosted Bot API server: large files, delivered as local paths
+        builder = (
+            builder
+            .base_url(f"{Config.TELEGRAM_API_URL}/bot")
+            .base_file_url(f"{Config.TELEGRAM_API_URL}/file/bot")
+            .local_mode(True)
+        )
+        logger.info(f"Using local Bot API server at {Config.TELEGRAM_API_URL}")
+    application = builder.build()
 
     # Register command handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("queue", queue_status))
     application.add_handler(CommandHandler("auth", auth_command))
+    application.add_handler(CallbackQueryHandler(format_callback, pattern='^fmt_'))
     application.add_handler(CallbackQueryHandler(cancel_callback))
     
     # Register message handlers
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.VIDEO, handle_telegram_video))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("txt") | filters.Document.MimeType("text/plain"), handle_link_file
+    ))
     
     # Register error handler
     application.add_error_handler(error)
 
     # Start the Bot
-    logger.info("Starting bot...")
-    application.run_polling()
+    logger.info(f"Starting bot ({Config.UPDATE_MODE})...")
+    if Config.UPDATE_MODE == 'webhook':
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
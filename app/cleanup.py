@@ -0,0 +1,144 @@
+import glob
+import os
+import re
+import signal
+import logging
+from typing import Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Helper processes yt-dlp starts for merging, post-processing and some downloads
+HELPER_PROCESS_NAMES = {'ffmpeg', 'ffprobe', 'avconv'}
+
+# Suffixes yt-dlp appends to a file while it is in progress
+_PARTIAL_SUFFIX_RE = re.compile(r'(\.part(-Frag\d+)?|\.ytdl)$')
+# Format part (".f137", ".fhls-1080p") and merge (".temp") infixes before the extension
+_FORMAT_INFIX_RE = re.compile(r'\.(f\d[\w-]*|f(hls|dash|http)-[\w-]+|temp)$')
+
+
+def file_stem(path: str) -> str:
+    """
+    Strip in-progress suffixes, the format infix and the extension from a
+    yt-dlp file name.
+
+    'Title.f137.mp4.part' -> 'Title', 'Title.temp.mkv' -> 'Title'
+    """
+    path = _PARTIAL_SUFFIX_RE.sub('', path)
+    path = os.path.splitext(path)[0]
+    return _FORMAT_INFIX_RE.sub('', path)
+
+
+def _mentions_stem(arg: str, stems: Set[str]) -> bool:
+    """Check whether a command line argument names a file with one of the stems."""
+    if arg.startswith('file:'):
+        arg = arg[len('file:'):]
+    name = os.path.basename(arg)
+    return any(name.startswith(stem + '.') for stem in stems)
+
+
+def _parent_pid(pid: int) -> Optional[int]:
+    """Read the parent PID of a process from /proc, None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            stat = f.read()
+        # The command name is in parentheses and may contain spaces
+        return int(stat.rsplit(')', 1)[1].split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _is_descendant(pid: int, ancestor: int) -> bool:
+    """Check whether pid is a (grand)child of ancestor."""
+    seen = set()
+    while pid and pid not in seen:
+        seen.add(pid)
+        pid = _parent_pid(pid)
+        if pid == ancestor:
+            return True
+    return False
+
+
+def kill_helper_processes(paths: Iterable[str]) -> List[int]:
+    """
+    Kill ffmpeg-like child processes working on any of the given files.
+
+    Only descendants of this process are considered, so helpers started by
+    worker threads and worker processes are found, but nothing else on the
+    machine is touched. Linux only (uses /proc); a no-op elsewhere.
+
+    Args:
+        paths: Files of the job (any yt-dlp name variant, see file_stem())
+
+    Returns:
+        PIDs that were killed
+    """
+    stems = {os.path.basename(file_stem(path)) for path in paths if path}
+    stems.discard('')
+    if not stems or not os.path.isdir('/proc'):
+        return []
+
+    own_pid = os.getpid()
+    killed = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        try:
+            with open(f"/proc/{pid}/cmdline", 'rb') as f:
+                argv = [arg.decode('utf-8', 'replace') for arg in f.read().split(b'\0') if arg]
+        except OSError:
+            continue
+        if not argv or os.path.basename(argv[0]) not in HELPER_PROCESS_NAMES:
+            continue
+        if not any(_mentions_stem(arg, stems) for arg in argv[1:]):
+            continue
+        if not _is_descendant(pid, own_pid):
+            continue
+
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed.append(pid)
+        except OSError as e:
+            logger.debug(f"Could not kill helper process {pid}: {e}")
+
+    if killed:
+        logger.info(f"Killed helper processes {killed}")
+    return killed
+
+
+def remove_partial_files(paths: Iterable[str], temp_dir: str, keep: Optional[Set[str]] = None) -> List[str]:
+    """
+    Delete the leftovers of an aborted download from the temp directory.
+
+    Removes '<stem>.*' files (.part, .part-FragN, .ytdl, .temp.*, format
+    parts) next to each given path, but only inside temp_dir so finished
+    files in the download directory are never touched.
+
+    Args:
+        paths: Files of the job (any yt-dlp name variant)
+        temp_dir: Directory partial files live in
+        keep: Paths that must not be removed (e.g. files of other tasks)
+
+    Returns:
+        Paths that were removed
+    """
+    temp_dir = os.path.realpath(temp_dir)
+    keep = keep or set()
+    removed = []
+    for stem in {file_stem(path) for path in paths if path}:
+        directory = os.path.realpath(os.path.dirname(stem) or '.')
+        if os.path.commonpath([directory, temp_dir]) != temp_dir:
+            continue
+
+        for candidate in glob.glob(glob.escape(stem) + '.*'):
+            if candidate in keep or not os.path.isfile(candidate):
+                continue
+            try:
+                os.remove(candidate)
+                removed.append(candidate)
+            except OSError as e:
+                logger.warning(f"Could not remove partial file {candidate}: {e}")
+
+    if removed:
+        logger.info(f"Removed {len(removed)} partial files from {temp_dir}")
+    return removed
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Minimum relative throughput gain for an increase to count as worthwhile
+MIN_GAIN = 0.05
+# Size of the write used to probe disk latency
+DISK_PROBE_SIZE = 1024 * 1024
+
+
+class ConcurrencyController:
+    """
+    Tunes the number of download slots and yt-dlp's fragment concurrency at runtime.
+
+    Every interval it samples the aggregate download throughput reported by
+    the progress hooks, the number of jobs that failed with HTTP 403/429
+    (throttling) and the latency of a small fsync'ed write to the temp
+    directory, then adjusts the limits AIMD-style:
+
+    - throttling or a slow disk halves both limits (multiplicative decrease)
+    - if the previous increase did not raise throughput by MIN_GAIN, it is
+      undone (gradient check)
+    - otherwise, while there is demand, one limit grows by one (additive
+      increase): slots while tasks are waiting, fragments per job when all
+      tasks are running
+
+    Limits always stay within the configured bounds.
+    """
+
+    def __init__(
+        self,
+        download_manager,
+        min_downloads: int,
+        max_downloads: int,
+        min_fragments: int,
+        max_fragments: int,
+        interval: float = 15,
+        disk_latency: float = 0.5
+    ):
+        """
+        Initialize the controller.
+
+        Args:
+            download_manager: DownloadManager whose limits are tuned
+            min_downloads: Lower bound of download slots
+            max_downloads: Upper bound of download slots
+            min_fragments: Lower bound of concurrent fragments per job
+            max_fragments: Upper bound of concurrent fragments per job
+            interval: Seconds between two adjustments
+            disk_latency: Probe write latency (seconds) above which the disk counts as saturated
+        """
+        self.download_manager = download_manager
+        self.min_downloads = min_downloads
+        self.max_downloads = max(min_downloads, max_downloads)
+        self.min_fragments = min_fragments
+        self.max_fragments = max(min_fragments, max_fragments)
+        self.interval = interval
+        self.disk_latency = disk_latency
+
+        self.downloads = self._clamp(download_manager.max_concurrent, min_downloads, self.max_downloads)
+        self.fragments = self._clamp(Config.CONCURRENT_FRAGMENT_DOWNLOADS, min_fragments, self.max_fragments)
+
+        self._last_bytes = download_manager.bytes_downloaded
+        self._last_errors = download_manager.throttle_errors
+        self._last_time = time.monotonic()
+        self._last_rate = 0.0
+        self._last_step: Optional[str] = None  # 'downloads' or 'fragments' if the last tick increased it
+        self._worker: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _clamp(value: int, low: int, high: int) -> int:
+        return max(low, min(high, value))
+
+    def start(self) -> None:
+        """Apply the initial limits and start tuning on the running event loop."""
+        self._apply()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+        logger.info(
+            f"Concurrency auto-tuning started: downloads {self.min_downloads}-{self.max_downloads}, "
+            f"fragments {self.min_fragments}-{self.max_fragments}, every {self.interval}s"
+        )
+
+    async def stop(self) -> None:
+        """Stop tuning; the current limits stay in effect."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def _apply(self) -> None:
+        self.download_manager.set_limits(max_concurrent=self.downloads, concurrent_fragments=self.fragments)
+
+    def _probe_disk(self) -> float:
+        """Time a small synchronous write to the temp directory."""
+        directory = self.download_manager.temp_dir or Config.TEMP_DOWNLOAD_DIR
+        data = b'\0' * DISK_PROBE_SIZE
+        started = time.monotonic()
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.disk-probe-') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return time.monotonic() - started
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Concurrency controller tick failed: {e}")
+
+    async def tick(self) -> None:
+        """Sample the signals and adjust the limits once."""
+        manager = self.download_manager
+        now = time.monotonic()
+        elapsed = max(now - self._last_time, 1e-6)
+        rate = (manager.bytes_downloaded - self._last_bytes) / elapsed
+        errors = manager.throttle_errors - self._last_errors
+        self._last_time, self._last_bytes, self._last_errors = now, manager.bytes_downloaded, manager.throttle_errors
+
+        try:
+            disk_latency = await asyncio.to_thread(self._probe_disk)
+        except OSError as e:
+            logger.debug(f"Disk probe failed: {e}")
+            disk_latency = 0.0
+
+        previous = (self.downloads, self.fragments)
+        waiting = manager.scheduler.waiting_count
+        active = manager.scheduler.active_count
+
+        if errors or disk_latency > self.disk_latency:
+            # Congestion: back off multiplicatively
+            self.downloads = self._clamp(self.downloads // 2, self.min_downloads, self.max_downloads)
+            self.fragments = self._clamp(self.fragments // 2, self.min_fragments, self.max_fragments)
+            reason = f"{errors} throttled jobs" if errors else f"disk latency {disk_latency:.2f}s"
+            self._last_step = None
+        elif self._last_step and rate < self._last_rate * (1 + MIN_GAIN):
+            # The last increase did not pay off, undo it
+            if self._last_step == 'downloads':
+                self.downloads = self._clamp(self.downloads - 1, self.min_downloads, self.max_downloads)
+            else:
+                self.fragments = self._clamp(self.fragments - 1, self.min_fragments, self.max_fragments)
+            reason = f"no gain from more {self._last_step}"
+            self._last_step = None
+        elif waiting and self.downloads < self.max_downloads:
+            self.downloads += 1
+            reason = f"{waiting} tasks waiting"
+            self._last_step = 'downloads'
+        elif active and not waiting and self.fragments < self.max_fragments:
+            self.fragments += 1
+            reason = "all tasks running"
+            self._last_step = 'fragments'
+        else:
+            self._last_step = None
+            reason = None
+
+        self._last_rate = rate
+        if (self.downloads, self.fragments) != previous:
+            self._apply()
+            logger.info(
+                f"Concurrency: downloads {previous[0]}->{self.downloads}, fragments {previous[1]}->{self.fragments} "
+                f"({reason}; {rate / 1e6:.1f} MB/s)"
+            )
@@ -4,11 +4,42 @@ from typing import Optional
 class Config:
     # Telegram Bot Configuration
     BOT_TOKEN: str = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN")
+    # Self-hosted telegram-bot-api server (e.g. http://telegram-bot-api:8081); empty = cloud Bot API.
+    # The server runs with --local, and its working directory must be mounted at the same path in
+    # this container, so files are taken from disk instead of being downloaded over HTTP.
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
+    TELEGRAM_LOCAL_MODE: bool = bool(TELEGRAM_API_URL)
+    # Where the local server's working directory is mounted here, if not at the server's own path
+    # (to hard-link, mount it inside the DOWNLOAD_DIR mount, e.g. DOWNLOAD_DIR/.telegram-bot-api)
+    TELEGRAM_API_SERVER_DIR: str = os.getenv("TELEGRAM_API_SERVER_DIR", "/var/lib/telegram-bot-api")
+    TELEGRAM_API_DATA_DIR: str = os.getenv("TELEGRAM_API_DATA_DIR", "")
+    # getFile waits until a local server has fetched the whole file (seconds)
+    TELEGRAM_GET_FILE_TIMEOUT: int = int(os.getenv("TELEGRAM_GET_FILE_TIMEOUT", "600" if TELEGRAM_LOCAL_MODE else "30"))
     
     # Download Configuration
     DOWNLOAD_DIR: str = os.getenv("DOWNLOAD_DIR", "./downloads")
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "5000000000"))  # 5GB default
     TEMP_DOWNLOAD_DIR: str = os.getenv("TEMP_DOWNLOAD_DIR", os.path.join(DOWNLOAD_DIR, "tmp"))
+    # If TEMP_DOWNLOAD_DIR is on another filesystem than DOWNLOAD_DIR, finished files would be copied
+    # across; stage partial downloads in TEMP_STAGING_DIR (on DOWNLOAD_DIR's filesystem) instead
+    TEMP_ON_DOWNLOAD_FILESYSTEM: bool = os.getenv("TEMP_ON_DOWNLOAD_FILESYSTEM", "true").lower() == "true"
+    TEMP_STAGING_DIR: str = os.getenv("TEMP_STAGING_DIR", os.path.join(DOWNLOAD_DIR, ".tmp"))
+    
+    # Disk space admission: downloads reserve their expected size before they start and wait
+    # in the queue while the reservation would leave less than STORAGE_MIN_FREE bytes free
+    STORAGE_ADMISSION: bool = os.getenv("STORAGE_ADMISSION", "true").lower() == "true"
+    STORAGE_MIN_FREE: int = int(os.getenv("STORAGE_MIN_FREE", "2147483648"))  # 2GB
+    STORAGE_DEFAULT_RESERVATION: int = int(os.getenv("STORAGE_DEFAULT_RESERVATION", "524288000"))  # 500MB, size unknown
+    STORAGE_RECHECK_INTERVAL: int = int(os.getenv("STORAGE_RECHECK_INTERVAL", "30"))  # Seconds, while the queue waits
+    # Smaller tasks that may start ahead of one waiting for space before the queue waits for it
+    STORAGE_MAX_BYPASS: int = int(os.getenv("STORAGE_MAX_BYPASS", "10"))
+    # Files under this directory may be deleted (least recently used first) to make room; empty = never
+    STORAGE_EVICT_DIR: str = os.getenv("STORAGE_EVICT_DIR", "")
+    STORAGE_EVICT_MIN_AGE_HOURS: float = float(os.getenv("STORAGE_EVICT_MIN_AGE_HOURS", "168"))  # Files unused for a week
+    
+    # Job journal Configuration (queued downloads are resumed after a restart)
+    JOB_JOURNAL: bool = os.getenv("JOB_JOURNAL", "true").lower() == "true"
+    JOB_JOURNAL_FILE: str = os.getenv("JOB_JOURNAL_FILE", os.path.join(DOWNLOAD_DIR, ".jobs.sqlite3"))
     
     # yt-dlp Configuration
     YT_DLP_FORMAT: str = os.getenv("YT_DLP_FORMAT", "best")
@@ -16,22 +47,84 @@ class Config:
     YT_DLP_AUDIO_ONLY: bool = os.getenv("YT_DLP_AUDIO_ONLY", "false").lower() == "true"
     YT_DLP_PLAYLIST: bool = os.getenv("YT_DLP_PLAYLIST", "false").lower() == "true"
     YT_DLP_OUTPUT_TEMPLATE: str = os.getenv("YT_DLP_OUTPUT_TEMPLATE", "%(title)s.%(ext)s")
+    # yt-dlp download archive; videos listed there are answered without downloading again
+    DOWNLOAD_ARCHIVE: str = os.getenv("DOWNLOAD_ARCHIVE", os.path.join(DOWNLOAD_DIR, ".download_archive"))
+    # How long metadata extracted for a link is reused by the download step (seconds).
+    # Keep this well below the lifetime of signed format URLs; 0 disables the handoff.
+    EXTRACTION_CACHE_TTL: int = int(os.getenv("EXTRACTION_CACHE_TTL", "300"))
+    # Metadata probes of new links run on their own pool; slow ones are queued without metadata
+    PROBE_WORKERS: int = int(os.getenv("PROBE_WORKERS", "4"))
+    PROBE_TIMEOUT: int = int(os.getenv("PROBE_TIMEOUT", "20"))  # Seconds, 0 = wait indefinitely
+    # yt-dlp's cache (YouTube player code, signature functions), kept across jobs and restarts
+    YT_DLP_CACHE_DIR: str = os.getenv("YT_DLP_CACHE_DIR", os.path.join(DOWNLOAD_DIR, ".yt-dlp-cache"))
+    # Idle YoutubeDL instances kept per option set for reuse (0 = new instance per call)
+    YDL_POOL_SIZE: int = int(os.getenv("YDL_POOL_SIZE", "4"))
+    YDL_POOL_MAX_USES: int = int(os.getenv("YDL_POOL_MAX_USES", "50"))  # Instances are replaced after N jobs
+    
+    # Format planning (opt-in): pick each video's format from its format list, within a per-job
+    # byte budget, the free disk space and what the free bandwidth moves in FORMAT_MAX_SECONDS.
+    # The configured format (YT_DLP_FORMAT/YT_DLP_QUALITY) is the highest it picks
+    FORMAT_PLANNER: bool = os.getenv("FORMAT_PLANNER", "false").lower() == "true"
+    FORMAT_MAX_BYTES: int = int(os.getenv("FORMAT_MAX_BYTES", "0"))  # 0 = no limit
+    FORMAT_MAX_SECONDS: int = int(os.getenv("FORMAT_MAX_SECONDS", "0"))  # 0 = ignore bandwidth
+    BANDWIDTH_CAPACITY: int = int(os.getenv("BANDWIDTH_CAPACITY", "0"))  # Link bytes/s, 0 = use measured throughput
+    # Seconds users get to pick another format from buttons before the planned one is used (0 = no buttons)
+    FORMAT_CHOICE_TIMEOUT: int = int(os.getenv("FORMAT_CHOICE_TIMEOUT", "5"))
     
     # Concurrency Configuration
     MAX_CONCURRENT_DOWNLOADS: int = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "3"))
     CONCURRENT_FRAGMENT_DOWNLOADS: int = int(os.getenv("CONCURRENT_FRAGMENT_DOWNLOADS", "4"))
+    # Cap on one user's running downloads; 0 = none (round-robin already keeps users fair,
+    # and a lone user can use every slot)
+    MAX_DOWNLOADS_PER_USER: int = int(os.getenv("MAX_DOWNLOADS_PER_USER", "0"))
+    # Executor backend for yt-dlp jobs: 'thread' (in the bot process) or 'process' (worker processes)
+    EXECUTOR_BACKEND: str = os.getenv("EXECUTOR_BACKEND", "thread").lower()
+    MAX_JOBS_PER_WORKER: int = int(os.getenv("MAX_JOBS_PER_WORKER", "20"))  # Process workers are replaced after N jobs
+    # ffmpeg merging/conversion runs outside the download slots, this many jobs at a time (0 = inside the slot)
+    POSTPROCESS_WORKERS: int = int(os.getenv("POSTPROCESS_WORKERS", str(os.cpu_count() or 1)))
+    # Downloaded jobs that may wait for a post-processing slot (0 = one per download slot)
+    POSTPROCESS_BACKLOG: int = int(os.getenv("POSTPROCESS_BACKLOG", "0"))
+    SMALL_JOB_MAX_SIZE: int = int(os.getenv("SMALL_JOB_MAX_SIZE", "52428800"))  # 50MB, smaller jobs get priority
+    # Adjust download slots and fragment concurrency at runtime within the bounds below
+    AUTO_TUNE_CONCURRENCY: bool = os.getenv("AUTO_TUNE_CONCURRENCY", "false").lower() == "true"
+    AUTO_TUNE_MIN_DOWNLOADS: int = int(os.getenv("AUTO_TUNE_MIN_DOWNLOADS", "1"))
+    AUTO_TUNE_MAX_DOWNLOADS: int = int(os.getenv("AUTO_TUNE_MAX_DOWNLOADS", "8"))
+    AUTO_TUNE_MIN_FRAGMENTS: int = int(os.getenv("AUTO_TUNE_MIN_FRAGMENTS", "1"))
+    AUTO_TUNE_MAX_FRAGMENTS: int = int(os.getenv("AUTO_TUNE_MAX_FRAGMENTS", "16"))
+    AUTO_TUNE_INTERVAL: float = float(os.getenv("AUTO_TUNE_INTERVAL", "15"))  # Seconds between adjustments
+    # A 1MB fsync'ed write to the temp directory slower than this (seconds) counts as disk saturation
+    AUTO_TUNE_DISK_LATENCY: float = float(os.getenv("AUTO_TUNE_DISK_LATENCY", "0.5"))
     
     # Progress Notification Configuration
     ENABLE_PROGRESS_NOTIFICATIONS: bool = os.getenv("ENABLE_PROGRESS_NOTIFICATIONS", "true").lower() == "true"
     PROGRESS_UPDATE_INTERVAL: int = int(os.getenv("PROGRESS_UPDATE_INTERVAL", "5"))  # Logs progress to console
+    # Cap of progress message edits per second across all chats (Telegram allows about 30 messages/s)
+    PROGRESS_EDITS_PER_SECOND: float = float(os.getenv("PROGRESS_EDITS_PER_SECOND", "20"))
     
     # Telegram Video Download Configuration
     AUTO_DOWNLOAD_TELEGRAM_VIDEOS: bool = os.getenv("AUTO_DOWNLOAD_TELEGRAM_VIDEOS", "true").lower() == "true"
-    TELEGRAM_VIDEO_MAX_SIZE: int = int(os.getenv("TELEGRAM_VIDEO_MAX_SIZE", "20971520"))  # 20MB default
+    # 20MB with the cloud Bot API, 2GB with a local Bot API server
+    TELEGRAM_VIDEO_MAX_SIZE: int = int(os.getenv(
+        "TELEGRAM_VIDEO_MAX_SIZE", "2097152000" if TELEGRAM_LOCAL_MODE else "20971520"
+    ))
+    # Threads writing Telegram downloads to disk (chunk writes, local server copies and moves)
+    TELEGRAM_WRITE_WORKERS: int = int(os.getenv("TELEGRAM_WRITE_WORKERS", "2"))
+    # Send finished YouTube downloads back to the chat; repeats reuse the uploaded file
+    UPLOAD_TO_CHAT: bool = os.getenv("UPLOAD_TO_CHAT", "false").lower() == "true"
+    # Larger files are split with ffmpeg. 50MB with the cloud Bot API, 2000MB with a local Bot API server
+    TELEGRAM_UPLOAD_MAX_SIZE: int = int(os.getenv(
+        "TELEGRAM_UPLOAD_MAX_SIZE", "2097152000" if TELEGRAM_LOCAL_MODE else "52428800"
+    ))
     
     # Enhanced naming Configuration
     ENHANCED_NAMING: bool = os.getenv("ENHANCED_NAMING", "true").lower() == "true"
     PLAYLIST_FOLDER: bool = os.getenv("PLAYLIST_FOLDER", "true").lower() == "true"
+    # Download playlist entries as separate tasks spread over the download slots
+    PLAYLIST_FANOUT: bool = os.getenv("PLAYLIST_FANOUT", "true").lower() == "true"
+    # Messages and .txt files with several links are downloaded as one batch
+    BATCH_MAX_LINKS: int = int(os.getenv("BATCH_MAX_LINKS", "50"))
+    BATCH_PROBE_CONCURRENCY: int = int(os.getenv("BATCH_PROBE_CONCURRENCY", "4"))  # Links probed at the same time
+    BATCH_FILE_MAX_SIZE: int = int(os.getenv("BATCH_FILE_MAX_SIZE", "1048576"))  # 1MB
     
     # Bot Configuration
     BOT_START_MESSAGE: str = os.getenv("BOT_START_MESSAGE", "Welcome to YouTube Downloader Bot!\n\nSend me a YouTube link or video and I'll download it for you.")
@@ -42,7 +135,10 @@ class Config:
     BOT_DOWNLOAD_START_MESSAGE: str = os.getenv("BOT_DOWNLOAD_START_MESSAGE", "Starting download... ({active}/{max} active)")
     BOT_PROGRESS_MESSAGE: str = os.getenv("BOT_PROGRESS_MESSAGE", "📥 Downloading: {percent}% | Speed: {speed} | ETA: {eta}")
     BOT_DOWNLOAD_COMPLETE_MESSAGE: str = os.getenv("BOT_DOWNLOAD_COMPLETE_MESSAGE", "✅ Download complete!")
-    BOT_TELEGRAM_VIDEO_TOO_LARGE: str = os.getenv("BOT_TELEGRAM_VIDEO_TOO_LARGE", "❌ Video is too large (max 20MB for Telegram videos)")
+    BOT_TELEGRAM_VIDEO_TOO_LARGE: str = os.getenv(
+        "BOT_TELEGRAM_VIDEO_TOO_LARGE",
+        f"❌ Video is too large (max {TELEGRAM_VIDEO_MAX_SIZE // (1024 * 1024)}MB for Telegram videos)"
+    )
     
     # Auth Messages
     BOT_AUTH_RESTRICTED: str = os.getenv("BOT_AUTH_RESTRICTED", "⛔ Access restricted.\nPlease authenticate using: `/auth <password>`")
@@ -57,10 +153,30 @@ class Config:
     BOT_ACCESS_PASSWORD: Optional[str] = os.getenv("BOT_ACCESS_PASSWORD")
     ALLOWED_USERS_FILE: str = os.getenv("ALLOWED_USERS_FILE", "allowed_users.json")
     
+    # Metrics Configuration (Prometheus text format at http://<host>:METRICS_PORT/metrics)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "80"))
+    
+    # Update delivery: 'polling' (getUpdates) or 'webhook' (Telegram POSTs updates to
+    # WEBHOOK_URL, served on METRICS_PORT next to /metrics and /healthz)
+    UPDATE_MODE: str = os.getenv("UPDATE_MODE", "polling").lower()
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")  # Public HTTPS URL, e.g. https://bot.example.com/telegram
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "")  # Local path if a proxy rewrites it, default: WEBHOOK_URL's path
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")  # Random per start if empty
+    WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    # Updates processed at the same time; those of one chat always run in order
+    CONCURRENT_UPDATES: int = int(os.getenv("CONCURRENT_UPDATES", "32"))
+    # Unfinished updates before the bot stops taking new ones (0 = 4x CONCURRENT_UPDATES)
+    UPDATE_BACKLOG: int = int(os.getenv("UPDATE_BACKLOG", "0"))
+    
     # Logging Configuration
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     LOG_DIR: str = os.getenv("LOG_DIR", "./logs")
     LOG_FILE: str = os.getenv("LOG_FILE", "bot.log")
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", "10485760"))  # 10MB, then the log file is rotated
+    LOG_BACKUP_COUNT: int = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    # DEBUG messages per second allowed from one source line (progress hooks log on every callback), 0 = no limit
+    LOG_DEBUG_RATE_LIMIT: float = float(os.getenv("LOG_DEBUG_RATE_LIMIT", "1"))
     
     @classmethod
     def validate(cls):
@@ -68,6 +184,11 @@ class Config:
         if not cls.BOT_TOKEN or cls.BOT_TOKEN == "YOUR_BOT_TOKEN":
             raise ValueError("BOT_TOKEN must be set in environment variables")
         
+        if cls.UPDATE_MODE not in ("polling", "webhook"):
+            raise ValueError("UPDATE_MODE must be 'polling' or 'webhook'")
+        if cls.UPDATE_MODE == "webhook" and not cls.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL must be set in webhook mode")
+        
         # Ensure download directory exists
         os.makedirs(cls.DOWNLOAD_DIR, exist_ok=True)
         os.makedirs(cls.TEMP_DOWNLOAD_DIR, exist_ok=True)
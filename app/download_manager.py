@@ -1,13 +1,29 @@
 import os
+import re
+import threading
+import time
+import inspect
 import logging
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from typing import Callable, Optional
-from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime
 
+from cleanup import kill_helper_processes, remove_partial_files
+from config import Config
+from executors import POSTPROCESS_STAGE, AsyncBackend, ThreadBackend, create_backend
+from job_store import JobStore
+import metrics
+from scheduler import FairScheduler, PRIORITY_NORMAL
+from storage import StorageBudget, StorageFullError
+
 logger = logging.getLogger(__name__)
 
+# Seconds over which the aggregate download rate is measured
+RATE_WINDOW = 5.0
+# Failures that mean the origin is throttling us
+THROTTLE_ERROR_RE = re.compile(r'HTTP Error (403|429)\b')
+
 
 class CancelledError(Exception):
     """Raised when a download task is cancelled."""
@@ -20,67 +36,395 @@ class DownloadTask:
     url: str
     user_id: int
     chat_id: int
-    task_type: str  # 'youtube' or 'telegram'
+    task_type: str  # 'youtube', 'telegram' or 'playlist'
     queued_at: datetime
     task_id: int
     future: asyncio.Future = None
     cancelled: bool = False
+    parent_id: Optional[int] = None  # Set on playlist entries
+    children: List[int] = field(default_factory=list)  # Set on playlist parents
+    priority: int = PRIORITY_NORMAL
+    dedup_key: Optional[str] = None  # Extractor + video ID of the content
+    backend: Any = None  # Executor backend running the task, once started
+    files: Set[str] = field(default_factory=set)  # Files reported by yt-dlp, for cleanup on cancel
+    watchers: List[Tuple[int, int]] = field(default_factory=list)  # (chat_id, message_id) of attached requests
+    size_estimate: Optional[int] = None  # Expected download size in bytes, if known
 
 
 class DownloadManager:
     """
     Manages concurrent downloads with configurable limits.
-    Uses asyncio.Semaphore to limit concurrent downloads and ThreadPoolExecutor
-    to run blocking yt-dlp calls without blocking the event loop.
+    Uses a FairScheduler to admit tasks to a limited number of download slots
+    (priority first, then per-user round-robin) and an executor backend
+    (worker threads or worker processes, see executors.py) to run blocking
+    yt-dlp calls without blocking the event loop. Async download functions
+    run as coroutines on the event loop under the same slot limits.
+    With a StorageBudget, tasks are only admitted once disk space for them
+    is reserved; until then they wait (smaller tasks behind them may start),
+    and a task that can't fit even with nothing else reserved fails with
+    StorageFullError.
+    With postprocess_workers, a job's ffmpeg post-processing is a second
+    stage: the task gives its download slot to the next one once its files
+    are on disk, and waits for one of postprocess_workers slots to merge or
+    convert them. Its disk reservation is kept until it finishes.
     """
     
-    def __init__(self, max_concurrent: int):
+    def __init__(
+        self,
+        max_concurrent: int,
+        job_store: Optional[JobStore] = None,
+        max_per_user: int = 0,
+        backend: str = 'thread',
+        max_jobs_per_worker: int = 0,
+        temp_dir: Optional[str] = None,
+        max_concurrent_limit: Optional[int] = None,
+        storage: Optional[StorageBudget] = None,
+        postprocess_workers: int = 0,
+        postprocess_backlog: int = 0,
+        warmup: Optional[Callable[[], None]] = None
+    ):
         """
         Initialize the download manager.
         
         Args:
             max_concurrent: Maximum number of concurrent downloads allowed
+            job_store: Optional journal recording every task's state
+            max_per_user: Maximum concurrent downloads of a single user (0 = no limit)
+            backend: Default executor backend, 'thread' or 'process'
+            max_jobs_per_worker: Recycle process workers after this many jobs (0 = never)
+            temp_dir: Directory partial files are written to; cancelled tasks'
+                leftovers are removed from it
+            max_concurrent_limit: Highest max_concurrent set_limits() may set later,
+                used to size the executor pools (defaults to max_concurrent)
+            storage: Optional disk space budget tasks reserve their size from
+            postprocess_workers: Jobs post-processing at the same time, outside
+                their download slots (0 = post-process within the download slot)
+            postprocess_backlog: Jobs that may wait for post-processing after
+                giving their download slot back (0 = the number of download slots)
+            warmup: Picklable function run by the executors ahead of the first
+                job (e.g. ydl_pool.warm_ffmpeg)
         """
         self.max_concurrent = max_concurrent
-        self.semaphore = asyncio.Semaphore(max_concurrent)
-        self.executor = ThreadPoolExecutor(max_workers=max_concurrent)
+        self.scheduler = FairScheduler(max_concurrent, max_per_user)
+        self.temp_dir = temp_dir
+        self.storage = storage
+        self._storage_recheck: Optional[asyncio.Task] = None
+        self._evicted_for: Set[int] = set()  # Held tasks eviction already tried to make room for
+        if storage is not None:
+            self.scheduler.admission_check = self._reserve_storage
+            self.scheduler.max_bypass = storage.max_bypass
+        # Cancelled jobs give their slot back before their worker has wound
+        # down, so the pools get headroom for jobs that are still stopping
+        slots_limit = max(max_concurrent, max_concurrent_limit or 0)
+        pool_size = slots_limit * 2
+        self.postprocess_workers = postprocess_workers
+        if postprocess_workers > 0:
+            # Jobs in the post-processing stage keep their worker but not their slot
+            postprocess_backlog = postprocess_backlog or slots_limit
+            pool_size += postprocess_workers + postprocess_backlog
+        self.backend = create_backend(
+            backend, pool_size, max_jobs_per_worker, postprocess_workers, postprocess_backlog, warmup
+        )
+        # Jobs that can't leave the bot process always run on threads
+        self.thread_backend = self.backend if isinstance(self.backend, ThreadBackend) else ThreadBackend(pool_size)
+        self.async_backend = AsyncBackend()
+        self.job_store = job_store
+        self.tasks = {}  # task_id -> DownloadTask, every task not finished yet
         self.active_downloads = {}  # task_id -> DownloadTask
-        self.queue_counter = 0
-        self.task_id_counter = 0
-        logger.info(f"DownloadManager initialized with max_concurrent={max_concurrent}")
+        self.inflight_keys = {}  # dedup key -> task_id of the task downloading it
+        self.claimed_keys = {}  # dedup key -> future of its task, for requests not queued yet
+        self.postprocessing = {}  # task_id -> 'waiting' or 'running', tasks past their download
+        self.bytes_downloaded = 0  # Bytes received by all jobs, for throughput sampling
+        self._rate = 0.0  # Aggregate bytes/s over the last RATE_WINDOW
+        self._rate_sample = (time.monotonic(), 0)  # (time, bytes_downloaded) the rate is measured from
+        self._rate_lock = threading.Lock()  # Progress arrives from worker and reader threads at once
+        self.throttle_errors = 0  # Jobs that failed with HTTP 403/429
+        # Continue after the journal's IDs so journaled jobs keep unique IDs
+        self.task_id_counter = job_store.max_job_id() if job_store else 0
+        logger.info(
+            f"DownloadManager initialized with max_concurrent={max_concurrent}, "
+            f"max_per_user={max_per_user}, backend={backend}"
+        )
     
-    def get_queue_status(self) -> dict:
+    def get_queue_status(self, user_id: Optional[int] = None) -> dict:
         """
         Get current queue status.
         
+        Args:
+            user_id: If given, also report this user's tasks
+        
         Returns:
-            dict with 'active', 'max', and 'waiting' counts
+            dict with 'active', 'max', 'waiting' and 'total' counts, with
+            postprocess_workers 'postprocessing' (running, waiting and max
+            counts of the post-processing stage), and with a storage budget
+            'storage' (free, reserved and min_free bytes, the number of
+            reservations and whether the queue is held). With
+            user_id, also 'user_active' (count) and 'user_queued' (list of
+            (task_id, position) tuples in queue order).
         """
-        active_count = len(self.active_downloads)
-        waiting_count = max(0, self.queue_counter - active_count)
+        active_count = self.scheduler.active_count
+        waiting_count = self.scheduler.waiting_count
         
-        return {
+        status = {
             'active': active_count,
             'max': self.max_concurrent,
             'waiting': waiting_count,
-            'total': self.queue_counter
+            'total': active_count + waiting_count
         }
+        if self.postprocess_workers > 0:
+            states = list(self.postprocessing.values())
+            status['postprocessing'] = {
+                'running': states.count('running'),
+                'waiting': states.count('waiting'),
+                'max': self.postprocess_workers,
+            }
+        if self.storage is not None:
+            status['storage'] = dict(self.storage.status(), held=self.scheduler.held)
+        
+        if user_id is not None:
+            positions = self.scheduler.positions()
+            status['user_active'] = sum(
+                1 for task in self.active_downloads.values() if task.user_id == user_id
+            )
+            status['user_queued'] = sorted(
+                (
+                    (task_id, position) for task_id, position in positions.items()
+                    if self.tasks[task_id].user_id == user_id
+                ),
+                key=lambda item: item[1]
+            )
+        
+        return status
+    
+    def get_position(self, task_id: int) -> Optional[int]:
+        """Get the 1-based queue position of a waiting task, None if not waiting."""
+        return self.scheduler.positions().get(task_id)
+
+    def _journal(self, task_id: int, state: str) -> None:
+        """Record a task state change in the job journal, if enabled."""
+        if self.job_store is None:
+            return
+        try:
+            self.job_store.set_state(task_id, state)
+        except Exception as e:
+            logger.error(f"Failed to journal task {task_id} as {state}: {e}")
+    
+    def _record_files(self, task: DownloadTask, result: Any) -> None:
+        """Remember which video a finished task's files hold (see StorageBudget's on_evict)."""
+        if self.job_store is None or not task.dedup_key or not isinstance(result, list) or not result:
+            return
+        try:
+            self.job_store.add_files(task.dedup_key, result)
+        except Exception as e:
+            logger.error(f"Failed to record the files of task {task.task_id}: {e}")
+    
+    def _abort_running(self, task: DownloadTask) -> None:
+        """Free a cancelled task's slot right away and stop its helper processes."""
+        if self.active_downloads.pop(task.task_id, None) is None:
+            return
+        
+        self._release_slot(task.task_id)
+        self._journal(task.task_id, 'cancelled')
+        if task.dedup_key and self.inflight_keys.get(task.dedup_key) == task.task_id:
+            del self.inflight_keys[task.dedup_key]
+        if not task.future.done():
+            task.future.set_exception(CancelledError("Download cancelled"))
+        
+        if task.files:
+            kill_helper_processes(task.files)
+        logger.info(f"Task {task.task_id} aborted, slot released")
+    
+    def _reserve_storage(self, task_id: int) -> bool:
+        """
+        Scheduler admission check: reserve disk space for a waiting task.
+        
+        Raises:
+            StorageFullError: If the task doesn't fit although nothing else is
+                reserved and eviction (if enabled) was already tried
+        """
+        task = self.tasks.get(task_id)
+        if task is None or self.storage.try_reserve(task_id, task.size_estimate):
+            self._evicted_for.discard(task_id)
+            return True
+        
+        size = task.size_estimate or self.storage.default_reservation
+        needed = size - self.storage.available()
+        if not self.storage.reserved and (not self.storage.evict_dir or task_id in self._evicted_for):
+            # No running task will give space back: waiting can't help
+            self._evicted_for.discard(task_id)
+            raise StorageFullError(
+                f"Not enough disk space: the download needs about {size / 1024 ** 3:.1f}GB, "
+                f"{needed / 1024 ** 3:.1f}GB more than is free"
+            )
+        
+        if self._storage_recheck is None or self._storage_recheck.done():
+            logger.warning(f"Holding task {task_id}: it needs {needed} more bytes of disk space")
+            self._storage_recheck = asyncio.get_running_loop().create_task(self._recheck_storage(task_id, needed))
+        return False
+    
+    async def _recheck_storage(self, task_id: int, needed: int) -> None:
+        """Make room by eviction, or wait for space to be freed, then retry admission."""
+        freed = await asyncio.to_thread(self.storage.evict, needed) if self.storage.evict_dir else 0
+        self._evicted_for.add(task_id)
+        if not freed:
+            await asyncio.sleep(self.storage.recheck_interval)
+        self.scheduler.dispatch()
+    
+    def _release_slot(self, task_id: int) -> None:
+        """Give back a task's disk reservation and slot, admitting the next task."""
+        if self.storage is not None:
+            self.storage.release(task_id)
+        self.scheduler.release(task_id)
+    
+    def _track_postprocessing(self, task: DownloadTask, d: dict, loop: asyncio.AbstractEventLoop) -> None:
+        """Follow a task through the post-processing stage; called from the job's worker."""
+        status = d.get('status')
+        if status == 'started':
+            self.postprocessing[task.task_id] = 'waiting'
+            # The last file is on disk: the next task can have the download slot
+            if d.get('release_slot', True):
+                loop.call_soon_threadsafe(self.scheduler.release, task.task_id)
+        elif status == 'processing':
+            self.postprocessing[task.task_id] = 'running'
+        elif status == 'finished':
+            self.postprocessing.pop(task.task_id, None)
+    
+    def _record_progress(self, task: DownloadTask, d: dict, timings: dict) -> None:
+        """Feed a job's progress and post-processor events into the metrics."""
+        status = d.get('status')
+        postprocessor = d.get('postprocessor')
+        now = time.monotonic()
+        if postprocessor:
+            if status == 'started':
+                timings[postprocessor] = now
+            elif status == 'finished' and postprocessor in timings:
+                metrics.POSTPROCESS_TIME.observe(now - timings.pop(postprocessor), postprocessor=postprocessor)
+            return
+        
+        if 'first_byte' not in timings:
+            timings['first_byte'] = now
+            metrics.EXTRACTION_TIME.observe(now - timings['started'], stage='job')
+        # downloaded_bytes restarts for every file of a job (e.g. video and audio)
+        downloaded = d.get('downloaded_bytes') or 0
+        last = timings.get('downloaded_bytes', 0)
+        written = downloaded - last if downloaded >= last else downloaded
+        timings['downloaded_bytes'] = downloaded
+        with self._rate_lock:
+            self.bytes_downloaded += written
+            sampled_at, sampled_bytes = self._rate_sample
+            if now - sampled_at >= RATE_WINDOW:
+                self._rate = (self.bytes_downloaded - sampled_bytes) / (now - sampled_at)
+                self._rate_sample = (now, self.bytes_downloaded)
+        if self.storage is not None:
+            self.storage.consume(task.task_id, written)
+        if status == 'finished':
+            size = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            metrics.DOWNLOADED_BYTES.inc(size, task_type=task.task_type)
+            if size and d.get('elapsed'):
+                metrics.DOWNLOAD_SPEED.observe(size / d['elapsed'], task_type=task.task_type)
+    
+    def throughput(self) -> float:
+        """Current aggregate download rate of all jobs in bytes/s (0 when idle)."""
+        with self._rate_lock:
+            sampled_at, rate = self._rate_sample[0], self._rate
+        if time.monotonic() - sampled_at > 2 * RATE_WINDOW:
+            return 0.0
+        return rate
+    
+    def set_limits(self, max_concurrent: Optional[int] = None, concurrent_fragments: Optional[int] = None) -> None:
+        """
+        Change the concurrency limits at runtime.
 
+        Args:
+            max_concurrent: New number of download slots; running tasks keep
+                their slots when it shrinks
+            concurrent_fragments: New number of fragments each yt-dlp job
+                downloads in parallel, used by jobs started from now on
+        """
+        if max_concurrent is not None and max_concurrent != self.max_concurrent:
+            self.max_concurrent = max_concurrent
+            self.scheduler.set_max_concurrent(max_concurrent)
+        if concurrent_fragments is not None:
+            Config.CONCURRENT_FRAGMENT_DOWNLOADS = concurrent_fragments
+            if hasattr(self.backend, 'config_overrides'):
+                self.backend.config_overrides['CONCURRENT_FRAGMENT_DOWNLOADS'] = concurrent_fragments
+    
+    def _track_files(self, task: DownloadTask, d: dict) -> None:
+        """Remember the files a job reports, so they can be cleaned up on cancel."""
+        info = d.get('info_dict') or {}
+        for path in (d.get('filename'), d.get('tmpfilename'), d.get('filepath'), info.get('filepath')):
+            if path:
+                task.files.add(path)
+    
     def get_task(self, task_id: int) -> Optional[DownloadTask]:
-        """Get a task by ID."""
-        return self.active_downloads.get(task_id)
+        """Get a queued or active task by ID."""
+        return self.tasks.get(task_id)
 
+    def get_task_by_key(self, dedup_key: str) -> Optional[DownloadTask]:
+        """Get the queued or active task downloading the given content, if any."""
+        task_id = self.inflight_keys.get(dedup_key)
+        return self.get_task(task_id) if task_id is not None else None
+
+    def claim_key(self, dedup_key: str) -> bool:
+        """
+        Reserve a dedup key for a request that is still being prepared (probed,
+        or waiting for a format pick), so identical requests wait for it
+        instead of starting their own download.
+        
+        The claim ends when submit_download() queues a task with the key, or
+        with release_key() if the request ends without a download.
+        
+        Returns:
+            bool: False if a queued/active task or another request already holds the key
+        """
+        if dedup_key in self.inflight_keys or dedup_key in self.claimed_keys:
+            return False
+        self.claimed_keys[dedup_key] = asyncio.get_running_loop().create_future()
+        return True
+    
+    def release_key(self, dedup_key: str) -> None:
+        """Drop a claim that ends without a download; its waiters get None."""
+        claim = self.claimed_keys.pop(dedup_key, None)
+        if claim is not None and not claim.done():
+            claim.set_result(None)
+    
+    async def wait_for_key(self, dedup_key: str) -> Optional[DownloadTask]:
+        """
+        Wait for a claimed key's request to be queued.
+        
+        Returns:
+            The task downloading the content, or None if the claim was
+            released without a download
+        """
+        claim = self.claimed_keys.get(dedup_key)
+        if claim is None:
+            return self.get_task_by_key(dedup_key)
+        return await asyncio.shield(claim)
+    
     def cancel_task(self, task_id: int) -> bool:
         """
-        Mark a task as cancelled.
+        Cancel a task in any phase.
+        Cancelling a playlist parent cancels all of its entries.
+        
+        Queued tasks leave the queue. Running tasks give their slot back and
+        fail their future right away; their helper processes (ffmpeg) are
+        killed and the job itself aborts at its next progress or
+        post-processing hook, after which its partial files are removed.
         
         Returns:
-            bool: True if task was found and marked, False otherwise
+            bool: True if task was found and cancelled, False otherwise
         """
         task = self.get_task(task_id)
         if task:
-            task.cancelled = True
-            logger.info(f"Task {task_id} marked as cancelled")
+            for cancelled_task in [task] + [self.get_task(child_id) for child_id in task.children]:
+                if cancelled_task is None or cancelled_task.cancelled:
+                    continue
+                cancelled_task.cancelled = True
+                self.scheduler.remove(cancelled_task.task_id, CancelledError("Task cancelled before start"))
+                if cancelled_task.backend is not None:
+                    cancelled_task.backend.cancel(cancelled_task.task_id)
+                    self._abort_running(cancelled_task)
+            logger.info(f"Task {task_id} marked as cancelled ({len(task.children)} children)")
             return True
         return False
     
@@ -91,21 +435,44 @@ class DownloadManager:
         url: str,
         user_id: int,
         chat_id: int,
-        progress_callback: Optional[Callable] = None
+        progress_callback: Optional[Callable] = None,
+        parent_id: Optional[int] = None,
+        payload: Optional[Dict[str, Any]] = None,
+        dedup_key: Optional[str] = None,
+        priority: int = PRIORITY_NORMAL,
+        backend: Optional[str] = None,
+        size_estimate: Optional[int] = None
     ) -> tuple[int, asyncio.Future]:
         """
         Queue and execute a download with concurrency control.
         
         Args:
-            download_func: The blocking download function to execute
+            download_func: The download function to execute. It is called as
+                download_func(progress_hook=hook); the hook forwards to
+                progress_callback and aborts the job when it is cancelled.
+                Blocking functions run on the executor backend, coroutine
+                functions are awaited on the event loop.
             task_type: Type of download ('youtube' or 'telegram')
             url: URL or identifier for the download
             user_id: Telegram user ID
             chat_id: Telegram chat ID
-            progress_callback: Optional callback for progress updates
+            progress_callback: Optional callback for yt-dlp style progress dicts
+            parent_id: Task ID of the playlist this download belongs to
+            payload: JSON-serializable data needed to rebuild the task after a
+                restart, stored in the job journal
+            dedup_key: Identity of the downloaded content (extractor + video ID).
+                While the task is queued or active, get_task_by_key() returns it
+                so identical requests can attach instead of downloading again;
+                a claim_key() on it is handed over to the task.
+            priority: Scheduler priority class (PRIORITY_HIGH lets small jobs
+                jump ahead of the regular queue)
+            backend: 'thread' to force the in-process thread pool (for jobs
+                that can't be pickled), None for the manager's default backend.
+                Ignored for coroutine functions.
+            size_estimate: Expected download size in bytes, reserved from the
+                storage budget before the task starts (None = default reservation)
         """
-        # Increment queue counter and assign task ID
-        self.queue_counter += 1
+        # Assign task ID
         self.task_id_counter += 1
         task_id = self.task_id_counter
         
@@ -116,75 +483,271 @@ class DownloadManager:
             task_type=task_type,
             queued_at=datetime.now(),
             task_id=task_id,
-            future=asyncio.get_event_loop().create_future()
+            future=asyncio.get_event_loop().create_future(),
+            parent_id=parent_id,
+            priority=priority,
+            dedup_key=dedup_key,
+            size_estimate=size_estimate
         )
+        self.tasks[task_id] = task
+        if dedup_key:
+            self.inflight_keys[dedup_key] = task_id
+            # Requests waiting on a claim of the key attach to this task
+            claim = self.claimed_keys.pop(dedup_key, None)
+            if claim is not None and not claim.done():
+                claim.set_result(task)
+        admission = self.scheduler.enqueue(task_id, user_id, priority)
+        if self.job_store is not None:
+            try:
+                self.job_store.add_job(task_id, task_type, url, user_id, chat_id, parent_id, payload)
+            except Exception as e:
+                logger.error(f"Failed to journal task {task_id}: {e}")
         
         logger.info(
             f"Download queued: task_id={task_id}, type={task_type}, "
-            f"user={user_id}, queue_position={self.queue_counter}"
+            f"user={user_id}, priority={priority}, queue_position={self.get_position(task_id) or 0}"
         )
         
         async def _execute_download():
             try:
-                # Acquire semaphore (wait if at limit)
-                async with self.semaphore:
+                # Wait for a download slot
+                await admission
+                try:
                     # check for cancellation before starting
                     if task.cancelled:
                          logger.info(f"Task {task_id} cancelled before start")
                          raise CancelledError("Task cancelled before start")
                     
+                    metrics.QUEUE_WAIT.observe(
+                        (datetime.now() - task.queued_at).total_seconds(), task_type=task_type
+                    )
+                    
                     # Add to active downloads
                     self.active_downloads[task_id] = task
+                    self._journal(task_id, 'active')
                     logger.info(
                         f"Download started: task_id={task_id}, "
                         f"active={len(self.active_downloads)}/{self.max_concurrent}"
                     )
                     
-                    # Run blocking download function in thread pool
-                    loop = asyncio.get_event_loop()
-                    await loop.run_in_executor(self.executor, download_func)
+                    timings = {'started': time.monotonic()}
+                    loop = asyncio.get_running_loop()
+                    
+                    def on_progress(d):
+                        if d.get('postprocessor') == POSTPROCESS_STAGE:
+                            self._track_postprocessing(task, d, loop)
+                        else:
+                            self._track_files(task, d)
+                            self._record_progress(task, d, timings)
+                        if progress_callback and not task.cancelled:
+                            progress_callback(d)
+                    
+                    # Run coroutine jobs on the event loop, blocking ones on the executor backend
+                    if inspect.iscoroutinefunction(download_func):
+                        task.backend = self.async_backend
+                    elif backend == 'thread':
+                        task.backend = self.thread_backend
+                    else:
+                        task.backend = self.backend
+                    try:
+                        result = await task.backend.run(task_id, download_func, on_progress)
+                    except Exception:
+                        if task.cancelled:
+                            # Whatever yt-dlp wrapped the abort in, report a cancellation
+                            raise CancelledError("Download cancelled")
+                        raise
+                    finally:
+                        if task.cancelled and task.files and self.temp_dir:
+                            # The job has stopped writing, drop its partial files
+                            keep = set().union(*(other.files for other in self.active_downloads.values()))
+                            await asyncio.to_thread(remove_partial_files, task.files, self.temp_dir, keep)
                     
                     logger.info(f"Download completed: task_id={task_id}")
+                    self._journal(task_id, 'done')
+                    self._record_files(task, result)
+                    metrics.JOBS.inc(task_type=task_type, outcome='done')
                     if not task.future.done():
-                        task.future.set_result(True)
+                        task.future.set_result(result)
+                finally:
+                    self._release_slot(task_id)
                     
             except Exception as e:
                 logger.error(f"Download failed: task_id={task_id}, error={e}")
+                outcome = 'cancelled' if isinstance(e, CancelledError) else 'failed'
+                if outcome == 'failed' and THROTTLE_ERROR_RE.search(str(e)):
+                    self.throttle_errors += 1
+                self._journal(task_id, outcome)
+                metrics.JOBS.inc(task_type=task_type, outcome=outcome)
                 if not task.future.done():
                     task.future.set_exception(e)
-                raise
             finally:
                 # Remove from active downloads
                 if task_id in self.active_downloads:
                     del self.active_downloads[task_id]
-                self.queue_counter = max(0, self.queue_counter - 1)
+                self.postprocessing.pop(task_id, None)
+                self._evicted_for.discard(task_id)
+                self.tasks.pop(task_id, None)
+                if dedup_key and self.inflight_keys.get(dedup_key) == task_id:
+                    del self.inflight_keys[dedup_key]
 
         # Start execution in background
         asyncio.create_task(_execute_download())
         
         return task_id, task.future
     
+    async def submit_group(
+        self,
+        jobs: List[Tuple[str, Callable, Optional[Callable], Optional[Dict[str, Any]]]],
+        task_type: str,
+        url: str,
+        user_id: int,
+        chat_id: int,
+        payload: Optional[Dict[str, Any]] = None
+    ) -> tuple[int, asyncio.Future, List[int]]:
+        """
+        Queue several downloads (e.g. playlist entries) under one parent task.
+        
+        Each job is scheduled as its own task so the entries are spread over
+        all download slots. The parent is never executed itself; its future
+        resolves once every child has finished.
+        
+        Args:
+            jobs: List of (url, download_func, progress_callback, payload) tuples,
+                one per child task (see submit_download()); the payload's
+                'content_key' and 'filesize' become the dedup key and size estimate
+            task_type: Type of the child downloads
+            url: URL of the whole group (e.g. the playlist link)
+            user_id: Telegram user ID
+            chat_id: Telegram chat ID
+            payload: Journal payload of the parent task
+        
+        Returns:
+            Tuple of (parent task ID, parent future, child task IDs).
+            The parent future resolves to a dict with 'completed', 'failed'
+            and 'cancelled' counts (and 'no_space', the failed children that
+            couldn't fit on disk) and 'paths', each job's result in job
+            order (None if it didn't complete), or raises CancelledError if
+            the parent was cancelled.
+        """
+        self.task_id_counter += 1
+        parent_id = self.task_id_counter
+        
+        parent = DownloadTask(
+            url=url,
+            user_id=user_id,
+            chat_id=chat_id,
+            task_type='playlist',
+            queued_at=datetime.now(),
+            task_id=parent_id,
+            future=asyncio.get_event_loop().create_future()
+        )
+        self.tasks[parent_id] = parent
+        if self.job_store is not None:
+            try:
+                self.job_store.add_job(parent_id, 'playlist', url, user_id, chat_id, payload=payload)
+            except Exception as e:
+                logger.error(f"Failed to journal task {parent_id}: {e}")
+        
+        child_futures = []
+        for child_url, download_func, progress_callback, child_payload in jobs:
+            child_id, child_future = await self.submit_download(
+                download_func=download_func,
+                task_type=task_type,
+                url=child_url,
+                user_id=user_id,
+                chat_id=chat_id,
+                progress_callback=progress_callback,
+                parent_id=parent_id,
+                payload=child_payload,
+                dedup_key=(child_payload or {}).get('content_key'),
+                size_estimate=(child_payload or {}).get('filesize')
+            )
+            parent.children.append(child_id)
+            child_futures.append(child_future)
+        
+        logger.info(f"Group queued: task_id={parent_id}, children={len(parent.children)}")
+        
+        async def _wait_for_children():
+            results = await asyncio.gather(*child_futures, return_exceptions=True)
+            self.tasks.pop(parent_id, None)
+            
+            summary = {'completed': 0, 'failed': 0, 'cancelled': 0, 'no_space': 0, 'paths': []}
+            for result in results:
+                if isinstance(result, CancelledError):
+                    summary['cancelled'] += 1
+                elif isinstance(result, BaseException):
+                    summary['failed'] += 1
+                    if isinstance(result, StorageFullError):
+                        summary['no_space'] += 1
+                else:
+                    summary['completed'] += 1
+                summary['paths'].append(None if isinstance(result, BaseException) else result)
+            
+            logger.info(
+                f"Group finished: task_id={parent_id}, completed={summary['completed']}, "
+                f"failed={summary['failed']}, cancelled={summary['cancelled']}, no_space={summary['no_space']}"
+            )
+            self._journal(parent_id, 'cancelled' if parent.cancelled else 'done')
+            if parent.cancelled:
+                parent.future.set_exception(CancelledError("Group cancelled"))
+            else:
+                parent.future.set_result(summary)
+        
+        asyncio.create_task(_wait_for_children())
+        
+        return parent_id, parent.future, list(parent.children)
+    
     def shutdown(self):
-        """Shutdown the thread pool executor"""
+        """Shutdown the executor backends"""
         logger.info("Shutting down DownloadManager")
-        self.executor.shutdown(wait=True)
+        self.async_backend.shutdown()
+        self.thread_backend.shutdown()
+        if self.backend is not self.thread_backend:
+            self.backend.shutdown()
+        if self.job_store is not None:
+            self.job_store.close()
 
 
 # Global singleton instance
 _download_manager: Optional[DownloadManager] = None
 
 
-def get_download_manager(max_concurrent: int = 3) -> DownloadManager:
+def get_download_manager(
+    max_concurrent: int = 3,
+    job_store: Optional[JobStore] = None,
+    max_per_user: int = 0,
+    backend: str = 'thread',
+    max_jobs_per_worker: int = 0,
+    temp_dir: Optional[str] = None,
+    max_concurrent_limit: Optional[int] = None,
+    storage: Optional[StorageBudget] = None,
+    postprocess_workers: int = 0,
+    postprocess_backlog: int = 0,
+    warmup: Optional[Callable[[], None]] = None
+) -> DownloadManager:
     """
     Get or create the global DownloadManager singleton.
     
     Args:
         max_concurrent: Maximum concurrent downloads (only used on first call)
+        job_store: Optional job journal (only used on first call)
+        max_per_user: Maximum concurrent downloads per user (only used on first call)
+        backend: Executor backend, 'thread' or 'process' (only used on first call)
+        max_jobs_per_worker: Process worker recycling interval (only used on first call)
+        temp_dir: Directory of partial downloads (only used on first call)
+        max_concurrent_limit: Upper bound for runtime slot changes (only used on first call)
+        storage: Disk space budget (only used on first call)
+        postprocess_workers: Post-processing stage slots (only used on first call)
+        postprocess_backlog: Post-processing stage queue length (only used on first call)
+        warmup: Executor warm-up function (only used on first call)
     
     Returns:
         DownloadManager instance
     """
     global _download_manager
     if _download_manager is None:
-        _download_manager = DownloadManager(max_concurrent)
+        _download_manager = DownloadManager(
+            max_concurrent, job_store, max_per_user, backend, max_jobs_per_worker, temp_dir,
+            max_concurrent_limit, storage, postprocess_workers, postprocess_backlog, warmup
+        )
     return _download_manager
@@ -0,0 +1,387 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Progress fields forwarded from worker processes. yt-dlp's progress dict also
+# carries the whole info_dict, which is large and not always picklable.
+PROGRESS_KEYS = (
+    'status', 'filename', 'tmpfilename', 'downloaded_bytes', 'total_bytes',
+    'total_bytes_estimate', 'elapsed', 'eta', 'speed', 'fragment_index',
+    'fragment_count', 'postprocessor', '_percent_str', '_speed_str', '_eta_str',
+    'release_slot',
+)
+# Post-processor name of the step from a job's download to its CPU-bound
+# post-processing (merging, conversion), see PostProcessSlots
+POSTPROCESS_STAGE = 'PostProcessStage'
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when its task has been cancelled."""
+    pass
+
+
+class PostProcessSlots:
+    """
+    Slots of the post-processing stage that follows a job's download.
+
+    Merging and converting with ffmpeg is CPU-bound, so it is limited to
+    max_workers jobs at a time instead of running in as many jobs as there
+    are download slots. A job reports an event with postprocessor
+    POSTPROCESS_STAGE and status 'started' once its files are on disk, and
+    status 'finished' when its post-processing is over (see ydl_pool).
+    The backend's hook then calls enter() and leave() for it.
+
+    enter() first takes a place in the stage's queue of max_workers +
+    backlog jobs, while the job still holds its download slot, so downloads
+    slow down when conversion falls behind. It then reports 'started' (the
+    download manager gives the download slot to the next task, unless the
+    job's event has release_slot false because it downloads more files
+    afterwards), waits for one of the max_workers running slots and reports
+    'processing'.
+    """
+
+    def __init__(self, max_workers: int, backlog: int, semaphore_factory: Callable = threading.BoundedSemaphore):
+        """
+        Args:
+            max_workers: Jobs post-processing at the same time
+            backlog: Jobs that may wait for a running slot after freeing their download slot
+            semaphore_factory: Creates the semaphores (a multiprocessing manager's
+                BoundedSemaphore to share the slots with worker processes)
+        """
+        self.max_workers = max_workers
+        self._queued = semaphore_factory(max_workers + backlog)
+        self._running = semaphore_factory(max_workers)
+
+    @staticmethod
+    def _take(semaphore, is_cancelled: Callable[[], bool]) -> None:
+        while not semaphore.acquire(timeout=0.5):
+            if is_cancelled():
+                raise JobCancelled("Download cancelled")
+
+    def enter(
+        self,
+        is_cancelled: Callable[[], bool],
+        report: Callable[[Dict[str, Any]], None],
+        release_slot: bool = True
+    ) -> None:
+        """Wait for a post-processing slot; raises JobCancelled if the job is cancelled meanwhile."""
+        self._take(self._queued, is_cancelled)
+        try:
+            report({'status': 'started', 'postprocessor': POSTPROCESS_STAGE, 'release_slot': release_slot})
+            self._take(self._running, is_cancelled)
+        except BaseException:
+            self._queued.release()
+            raise
+        report({'status': 'processing', 'postprocessor': POSTPROCESS_STAGE})
+
+    def leave(self, report: Callable[[Dict[str, Any]], None]) -> None:
+        """Give the slot taken by enter() back."""
+        self._running.release()
+        self._queued.release()
+        report({'status': 'finished', 'postprocessor': POSTPROCESS_STAGE})
+
+    def handle(
+        self,
+        d: Dict[str, Any],
+        is_cancelled: Callable[[], bool],
+        report: Callable[[Dict[str, Any]], None]
+    ) -> None:
+        """Handle a job's POSTPROCESS_STAGE event in its hook."""
+        if d.get('status') == 'started':
+            if is_cancelled():
+                raise JobCancelled("Download cancelled")
+            self.enter(is_cancelled, report, d.get('release_slot', True))
+        elif d.get('status') == 'finished':
+            # Also after a cancelled or failed post-processing, which entered the stage
+            self.leave(report)
+
+
+def sanitize_progress(d: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a yt-dlp progress dict to plain values that can cross processes."""
+    event = {key: d[key] for key in PROGRESS_KEYS if key in d}
+    # Post-processor events name their file only in the info_dict
+    filepath = (d.get('info_dict') or {}).get('filepath')
+    if filepath:
+        event['filepath'] = filepath
+    return event
+
+
+class ThreadBackend:
+    """
+    Runs blocking jobs on a ThreadPoolExecutor inside the bot process.
+
+    Progress callbacks are called from the worker thread.
+    """
+
+    def __init__(self, max_workers: int, postprocess: Optional[PostProcessSlots] = None):
+        """
+        Args:
+            max_workers: Number of worker threads
+            postprocess: Slots limiting the jobs' post-processing (None = no limit)
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.postprocess = postprocess
+        self._cancelled = set()
+
+    async def run(self, task_id: int, func: Callable, progress_callback: Optional[Callable] = None) -> Any:
+        """
+        Run func(progress_hook=...) in the pool and wait for its result.
+
+        The hook passed to func raises JobCancelled once cancel() was called
+        for the task, which aborts yt-dlp at its next progress update.
+        """
+        def report(d):
+            if progress_callback:
+                progress_callback(d)
+
+        def progress_hook(d):
+            if d.get('postprocessor') == POSTPROCESS_STAGE:
+                # Without post-processing slots, the job just carries on
+                if self.postprocess:
+                    self.postprocess.handle(d, lambda: task_id in self._cancelled, report)
+                return
+            if task_id in self._cancelled:
+                raise JobCancelled("Download cancelled")
+            report(d)
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, lambda: func(progress_hook=progress_hook))
+        finally:
+            self._cancelled.discard(task_id)
+
+    def cancel(self, task_id: int) -> None:
+        """Ask a running job to stop."""
+        self._cancelled.add(task_id)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+class AsyncBackend:
+    """
+    Runs coroutine jobs (async download functions) directly on the event loop.
+
+    Used for I/O-bound jobs such as Telegram file downloads that already use
+    the bot's async HTTP client; they don't need a worker thread at all.
+    Progress callbacks are called on the event loop.
+    """
+
+    def __init__(self):
+        # task_id -> (asyncio task, cancel flag); the flag outlives the task so
+        # work the job handed to a thread still sees the cancellation
+        self._jobs: Dict[int, Tuple[asyncio.Task, threading.Event]] = {}
+
+    async def run(self, task_id: int, func: Callable, progress_callback: Optional[Callable] = None) -> Any:
+        """
+        Await func(progress_hook=...) as its own asyncio task.
+
+        cancel() cancels that asyncio task, so the job stops at its next await;
+        the hook also raises JobCancelled, which stops work running in threads.
+        """
+        cancelled = threading.Event()
+
+        def progress_hook(d):
+            if cancelled.is_set():
+                raise JobCancelled("Download cancelled")
+            if progress_callback:
+                progress_callback(d)
+
+        job = asyncio.ensure_future(func(progress_hook=progress_hook))
+        self._jobs[task_id] = (job, cancelled)
+        try:
+            return await job
+        except asyncio.CancelledError:
+            if cancelled.is_set():
+                raise JobCancelled("Download cancelled")
+            raise
+        finally:
+            self._jobs.pop(task_id, None)
+
+    def cancel(self, task_id: int) -> None:
+        """Stop a running job."""
+        if task_id in self._jobs:
+            job, cancelled = self._jobs[task_id]
+            cancelled.set()
+            job.cancel()
+
+    def shutdown(self) -> None:
+        for job, _ in self._jobs.values():
+            job.cancel()
+
+
+# Worker-process globals, set by _init_worker()
+_worker_events = None
+_worker_cancelled = None
+_worker_postprocess = None
+
+
+def _init_worker(events, cancelled, postprocess, warmup) -> None:
+    """Initializer of ProcessBackend workers: keep the IPC channels around and warm up."""
+    global _worker_events, _worker_cancelled, _worker_postprocess
+    _worker_events = events
+    _worker_cancelled = cancelled
+    _worker_postprocess = postprocess
+    if warmup is not None:
+        try:
+            warmup()
+        except Exception as e:
+            logger.warning(f"Worker warm-up failed: {e}")
+
+
+def _run_job(task_id: int, func: Callable, config_overrides: Dict[str, Any]) -> Any:
+    """Run a job in a worker process, forwarding progress to the bot process."""
+    if config_overrides:
+        # Settings changed at runtime in the bot process (see ProcessBackend.config_overrides)
+        from config import Config
+        for name, value in config_overrides.items():
+            setattr(Config, name, value)
+    last_cancel_check = [0.0]
+
+    def report(d):
+        _worker_events.put((task_id, sanitize_progress(d)))
+
+    def progress_hook(d):
+        if d.get('postprocessor') == POSTPROCESS_STAGE:
+            if _worker_postprocess:
+                _worker_postprocess.handle(d, lambda: _worker_cancelled.get(task_id), report)
+            return
+        # The cancel flags live in the manager process; don't ask on every
+        # download callback, but always before a post-processor starts
+        now = time.monotonic()
+        if 'postprocessor' in d or now - last_cancel_check[0] >= 0.5:
+            last_cancel_check[0] = now
+            if _worker_cancelled.get(task_id):
+                raise JobCancelled("Download cancelled")
+        report(d)
+
+    return func(progress_hook=progress_hook)
+
+
+class ProcessBackend:
+    """
+    Runs jobs in separate worker processes so yt-dlp's Python work and
+    post-processing don't compete with the bot's event loop for the GIL.
+
+    Jobs must be picklable (e.g. functools.partial of a module-level function).
+    Progress events travel back over a queue and are delivered to the task's
+    progress callback from a reader thread; cancellation is signalled through
+    a shared dict. Workers exit after max_jobs_per_worker jobs to limit memory
+    growth and are replaced by fresh ones.
+
+    Workers import Config once, so settings the bot changes at runtime are
+    put in config_overrides and applied in the worker before each job.
+    Post-processing slots are shared by all workers through the manager.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_jobs_per_worker: int = 0,
+        postprocess_workers: int = 0,
+        postprocess_backlog: int = 0,
+        warmup: Optional[Callable[[], None]] = None
+    ):
+        """
+        Args:
+            max_workers: Number of worker processes
+            max_jobs_per_worker: Recycle workers after this many jobs (0 = never)
+            postprocess_workers: Jobs post-processing at the same time (0 = no limit)
+            postprocess_backlog: Jobs waiting for post-processing after their download
+            warmup: Picklable function each worker runs when it starts (e.g. ydl_pool.warm_ffmpeg)
+        """
+        context = multiprocessing.get_context('spawn')
+        self._manager = context.Manager()
+        self._events = context.Queue()
+        self._cancelled = self._manager.dict()
+        self._callbacks: Dict[int, Callable] = {}
+        self.config_overrides: Dict[str, Any] = {}
+        self.postprocess = (
+            PostProcessSlots(postprocess_workers, postprocess_backlog, self._manager.BoundedSemaphore)
+            if postprocess_workers > 0 else None
+        )
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._events, self._cancelled, self.postprocess, warmup),
+            max_tasks_per_child=max_jobs_per_worker or None
+        )
+
+        self._reader = threading.Thread(target=self._read_events, name="ProcessBackendEvents", daemon=True)
+        self._reader.start()
+
+    def _read_events(self) -> None:
+        """Deliver progress events from the workers to the registered callbacks."""
+        while True:
+            item = self._events.get()
+            if item is None:
+                return
+
+            task_id, event = item
+            callback = self._callbacks.get(task_id)
+            if callback is None:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                # Exceptions can't reach the worker; cancellation uses cancel()
+                logger.debug(f"Progress callback for task {task_id} raised: {e}")
+
+    async def run(self, task_id: int, func: Callable, progress_callback: Optional[Callable] = None) -> Any:
+        """Run func(progress_hook=...) in a worker process and wait for its result."""
+        if progress_callback:
+            self._callbacks[task_id] = progress_callback
+        try:
+            return await asyncio.wrap_future(self.executor.submit(
+                _run_job, task_id, func, dict(self.config_overrides)
+            ))
+        finally:
+            self._callbacks.pop(task_id, None)
+            self._cancelled.pop(task_id, None)
+
+    def cancel(self, task_id: int) -> None:
+        """Ask a running job to stop."""
+        self._cancelled[task_id] = True
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+        self._events.put(None)
+        self._manager.shutdown()
+
+
+def create_backend(
+    name: str,
+    max_workers: int,
+    max_jobs_per_worker: int = 0,
+    postprocess_workers: int = 0,
+    postprocess_backlog: int = 0,
+    warmup: Optional[Callable[[], None]] = None
+):
+    """
+    Create an executor backend by name.
+
+    Args:
+        name: 'thread' or 'process'
+        max_workers: Number of worker threads/processes
+        max_jobs_per_worker: Recycle process workers after this many jobs (0 = never)
+        postprocess_workers: Jobs post-processing at the same time (0 = no limit)
+        postprocess_backlog: Jobs waiting for post-processing after their download
+        warmup: Function run once ahead of the first job (in every process worker)
+    """
+    if name == 'process':
+        return ProcessBackend(max_workers, max_jobs_per_worker, postprocess_workers, postprocess_backlog, warmup)
+    if name != 'thread':
+        logger.warning(f"Unknown executor backend '{name}', using threads")
+    postprocess = PostProcessSlots(postprocess_workers, postprocess_backlog) if postprocess_workers > 0 else None
+    backend = ThreadBackend(max_workers, postprocess)
+    if warmup is not None:
+        backend.executor.submit(warmup)
+    return backend
@@ -0,0 +1,121 @@
+import errno
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+# Name under which moves across filesystems are reported, like yt-dlp's own MoveFiles post-processor
+FINALIZE_POSTPROCESSOR = 'MoveFiles'
+
+
+def same_filesystem(path_a: str, path_b: str) -> bool:
+    """Check whether two existing paths are on the same filesystem (a rename between them is free)."""
+    try:
+        return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+    except OSError:
+        return False
+
+
+def resolve_temp_dir(temp_dir: str, home_dir: str, staging_dir: str) -> str:
+    """
+    Pick the directory partial downloads are written to.
+
+    Finished files are moved from the temp directory to home_dir. Across
+    filesystems that move is a full copy, so if temp_dir is on another
+    filesystem than home_dir, staging_dir (on home_dir's filesystem) is used
+    instead and the move becomes a rename.
+
+    Returns:
+        temp_dir, or staging_dir if temp_dir is on another filesystem
+    """
+    os.makedirs(temp_dir, exist_ok=True)
+    os.makedirs(home_dir, exist_ok=True)
+    if same_filesystem(temp_dir, home_dir):
+        return temp_dir
+
+    os.makedirs(staging_dir, exist_ok=True)
+    if not same_filesystem(staging_dir, home_dir):
+        logger.warning(f"{staging_dir} is not on the filesystem of {home_dir}, keeping {temp_dir}")
+        return temp_dir
+    logger.info(f"{temp_dir} is on another filesystem than {home_dir}, staging downloads in {staging_dir}")
+    return staging_dir
+
+
+def _copy_range(src_fd: int, dst_fd: int, count: int) -> int:
+    """Copy up to count bytes in the kernel, falling back to sendfile and then read/write."""
+    try:
+        return os.copy_file_range(src_fd, dst_fd, count)
+    except (AttributeError, OSError) as e:
+        # Not available, or not between these filesystems (EXDEV on older kernels)
+        if isinstance(e, OSError) and e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+    try:
+        return os.sendfile(dst_fd, src_fd, None, count)
+    except (AttributeError, OSError) as e:
+        if isinstance(e, OSError) and e.errno not in (errno.ENOSYS, errno.EINVAL):
+            raise
+    data = os.read(src_fd, count)
+    return os.write(dst_fd, data) if data else 0
+
+
+def move_file(src: str, dst: str, progress_hook: Optional[Callable[[dict], None]] = None) -> None:
+    """
+    Move a file, renaming it on the same filesystem and copying it in the kernel otherwise.
+
+    Blocking; run it in a thread. A copy is written next to dst under a
+    temporary name and renamed into place when complete, so a half-copied
+    file never shows up under dst. Copies report yt-dlp style post-processor
+    events (postprocessor 'MoveFiles', status started/processing/finished)
+    to progress_hook, so callers can show a "finalizing" phase.
+
+    Raises:
+        OSError: If the move fails, including EIO if the source ends before
+            its original size was copied (the partial copy is removed)
+    """
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    total = os.path.getsize(src)
+    started = time.monotonic()
+
+    def report(status: str, copied: int) -> None:
+        if progress_hook:
+            progress_hook({
+                'status': status,
+                'postprocessor': FINALIZE_POSTPROCESSOR,
+                'filepath': dst,
+                'downloaded_bytes': copied,
+                'total_bytes': total,
+                'elapsed': time.monotonic() - started,
+            })
+
+    report('started', 0)
+    partial = dst + '.moving'
+    copied = 0
+    try:
+        with open(src, 'rb') as src_file, open(partial, 'wb') as dst_file:
+            while copied < total:
+                count = _copy_range(src_file.fileno(), dst_file.fileno(), min(COPY_CHUNK_SIZE, total - copied))
+                if count == 0:
+                    # The source shrank or ended early: never publish a truncated copy
+                    raise OSError(errno.EIO, f"Copy of {src} ended at {copied} of {total} bytes", src)
+                copied += count
+                report('processing', copied)
+        if copied != total:
+            raise OSError(errno.EIO, f"Copied {copied} of {total} bytes of {src}", src)
+        os.replace(partial, dst)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+    os.remove(src)
+    report('finished', copied)
@@ -0,0 +1,146 @@
+import shutil
+from typing import Any, Dict, List, Optional
+
+# Formats that are not media (storyboard images)
+_SKIPPED_PROTOCOLS = ('mhtml',)
+
+
+def format_size(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    """Size of one format: exact, approximate, or from its bitrate (kbit/s) and the duration."""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * 1000 / 8 * duration
+    return int(size) if size else None
+
+
+def _has_video(fmt: Dict[str, Any]) -> bool:
+    return fmt.get('vcodec') not in (None, 'none') or (fmt.get('height') or 0) > 0
+
+
+def _has_audio(fmt: Dict[str, Any]) -> bool:
+    return fmt.get('acodec') not in (None, 'none')
+
+
+def _label(height: Optional[int], ext: Optional[str], size: Optional[int]) -> str:
+    name = f"{height}p" if height else "audio"
+    size_text = f", {size / (1024 * 1024):.0f}MB" if size else ""
+    return f"{name} ({ext or '?'}{size_text})"
+
+
+def candidate_plans(info: Dict[str, Any], max_height: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    List the ways a video can be downloaded, best first.
+
+    Every plan is a progressive format (video and audio in one file, no
+    merge) or a video-only format plus the best audio-only format (merged
+    by ffmpeg afterwards), and at most one plan of each kind is kept per
+    height. An audio-only plan comes last.
+
+    Args:
+        info: Extraction result with a 'formats' list (before format selection)
+        max_height: Highest resolution to plan for (the configured format's);
+            None (unknown) plans nothing but the audio-only format
+
+    Returns:
+        JSON-serializable plans: {'format': yt-dlp format selector,
+        'height', 'size' (bytes, None if unknown), 'merge' (needs ffmpeg),
+        'label'}
+    """
+    duration = info.get('duration')
+    formats = [
+        fmt for fmt in info.get('formats') or []
+        if fmt.get('format_id') and fmt.get('protocol') not in _SKIPPED_PROTOCOLS
+    ]
+    audio = [fmt for fmt in formats if _has_audio(fmt) and not _has_video(fmt)]
+    # Video-only formats are paired with the best audio-only format
+    best_audio = max(audio, key=lambda fmt: (fmt.get('abr') or fmt.get('tbr') or 0), default=None)
+
+    best: Dict[tuple, tuple] = {}  # (height, merge) -> (plan, bitrate)
+    for fmt in formats:
+        if not _has_video(fmt):
+            continue
+        height = fmt.get('height') or 0
+        if max_height is None or height > max_height:
+            continue
+        size = format_size(fmt, duration)
+        if _has_audio(fmt):
+            plan = {'format': fmt['format_id'], 'height': height, 'size': size, 'merge': False, 'ext': fmt.get('ext')}
+        elif best_audio is not None:
+            audio_size = format_size(best_audio, duration)
+            plan = {
+                'format': f"{fmt['format_id']}+{best_audio['format_id']}",
+                'height': height,
+                'size': size + audio_size if size and audio_size else None,
+                'merge': True,
+                'ext': fmt.get('ext'),
+            }
+        else:
+            continue
+        # Per height and kind, keep the highest bitrate
+        key = (height, plan['merge'])
+        rate = fmt.get('tbr') or size or 0
+        if key not in best or rate > best[key][1]:
+            best[key] = (plan, rate)
+
+    plans = [plan for plan, _ in sorted(best.values(), key=lambda item: (-item[0]['height'], item[0]['merge']))]
+    if best_audio is not None:
+        plans.append({
+            'format': best_audio['format_id'], 'height': 0, 'size': format_size(best_audio, duration),
+            'merge': False, 'ext': best_audio.get('ext'),
+        })
+    for plan in plans:
+        plan['label'] = _label(plan['height'], plan.pop('ext'), plan['size'])
+    return plans
+
+
+def format_budget(
+    max_bytes: int = 0,
+    disk_available: Optional[int] = None,
+    bandwidth: Optional[float] = None,
+    max_seconds: float = 0
+) -> Optional[int]:
+    """
+    Bytes one job may download: the smallest of the configured limit, the
+    free disk space and what the free bandwidth moves in max_seconds.
+
+    Returns:
+        The budget, or None if nothing limits the job
+    """
+    limits = []
+    if max_bytes > 0:
+        limits.append(max_bytes)
+    if disk_available is not None:
+        limits.append(max(0, disk_available))
+    if bandwidth and max_seconds > 0:
+        limits.append(int(bandwidth * max_seconds))
+    return min(limits) if limits else None
+
+
+def plan_format(plans: List[Dict[str, Any]], budget: Optional[int]) -> Optional[Dict[str, Any]]:
+    """
+    Pick the best plan that fits the budget.
+
+    The highest resolution wins; at equal resolution a progressive format
+    is preferred, as it needs no ffmpeg merge. Without ffmpeg only
+    progressive formats are considered. Plans of unknown size are only
+    used if no plan has a known size. If nothing fits, the smallest video
+    plan is returned, so the job still gets the cheapest download.
+
+    Returns:
+        The chosen plan, or None if there are no video plans
+    """
+    videos = [plan for plan in plans if plan['height']]
+    if not shutil.which('ffmpeg'):
+        videos = [plan for plan in videos if not plan['merge']]
+    if not videos:
+        return None
+    if budget is None:
+        return min(videos, key=lambda plan: (-plan['height'], plan['merge']))
+
+    sized = [plan for plan in videos if plan['size']]
+    if not sized:
+        return min(videos, key=lambda plan: (-plan['height'], plan['merge']))
+    fitting = [plan for plan in sized if plan['size'] <= budget]
+    if not fitting:
+        return min(sized, key=lambda plan: plan['size'])
+    return min(fitting, key=lambda plan: (-plan['height'], plan['merge'], -plan['size']))
@@ -0,0 +1,190 @@
+import json
+import os
+import sqlite3
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Journal states of a job that has not finished yet
+UNFINISHED_STATES = ('queued', 'active')
+
+
+class JobStore:
+    """
+    Durable journal of download jobs backed by SQLite in WAL mode.
+
+    Every task submitted to the DownloadManager is recorded with enough
+    information (the payload) to rebuild it, and its state is updated as it
+    moves through queued -> active -> done/failed/cancelled. Jobs still queued
+    or active after a crash or restart are picked up again on startup.
+    
+    It also remembers the Telegram file_ids of videos uploaded back to
+    chats, so repeat requests are answered without uploading again, and
+    which video each downloaded file holds, so evicting a file can take
+    its video out of the download archive.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (and create if needed) the journal database.
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # The connection is shared by the event loop and executor threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                parent_id INTEGER,
+                task_type TEXT NOT NULL,
+                url TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                payload TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                content_key TEXT NOT NULL,
+                part INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (content_key, part)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                content_key TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        logger.info(f"JobStore opened at {path}")
+
+    def add_job(
+        self,
+        job_id: int,
+        task_type: str,
+        url: str,
+        user_id: int,
+        chat_id: int,
+        parent_id: Optional[int] = None,
+        payload: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Record a newly queued job."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs "
+                "(id, parent_id, task_type, url, user_id, chat_id, state, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (
+                    job_id, parent_id, task_type, url, user_id, chat_id,
+                    json.dumps(payload) if payload is not None else None, now, now
+                )
+            )
+
+    def set_state(self, job_ids: Union[int, Iterable[int]], state: str) -> None:
+        """Update the state of one or more jobs."""
+        if isinstance(job_ids, int):
+            job_ids = [job_ids]
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+                [(state, now, job_id) for job_id in job_ids]
+            )
+
+    def unfinished_jobs(self) -> List[Dict[str, Any]]:
+        """Return jobs that were queued or active, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE state IN ({', '.join('?' for _ in UNFINISHED_STATES)}) ORDER BY id",
+                UNFINISHED_STATES
+            ).fetchall()
+
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job['payload'] = json.loads(job['payload']) if job['payload'] else None
+            jobs.append(job)
+        return jobs
+
+    def get_uploads(self, content_key: str) -> List[Tuple[str, str]]:
+        """Return the (kind, file_id) of each uploaded part of a video, in order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, file_id FROM uploads WHERE content_key = ? ORDER BY part", (content_key,)
+            ).fetchall()
+        return [(row['kind'], row['file_id']) for row in rows]
+
+    def set_uploads(self, content_key: str, uploads: List[Tuple[str, str]]) -> None:
+        """Record the (kind, file_id) of each uploaded part of a video."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM uploads WHERE content_key = ?", (content_key,))
+                self._conn.executemany(
+                    "INSERT INTO uploads (content_key, part, kind, file_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(content_key, part, kind, file_id, now) for part, (kind, file_id) in enumerate(uploads)]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def add_files(self, content_key: str, paths: List[str]) -> None:
+        """Record the downloaded files of a video."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, content_key, created_at) VALUES (?, ?, ?)",
+                [(os.path.abspath(path), content_key, now) for path in paths]
+            )
+
+    def pop_files(self, paths: List[str]) -> List[str]:
+        """Forget deleted files and return the content keys of the videos they held."""
+        paths = [os.path.abspath(path) for path in paths]
+        placeholders = ', '.join('?' for _ in paths)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT content_key FROM files WHERE path IN ({placeholders})", paths
+            ).fetchall()
+            self._conn.execute(f"DELETE FROM files WHERE path IN ({placeholders})", paths)
+        return [row['content_key'] for row in rows]
+
+    def max_job_id(self) -> int:
+        """Highest job ID in the journal, so new IDs never collide with old ones."""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM jobs").fetchone()
+        return row[0] or 0
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,108 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drop records of a call site beyond a rate, below a level.
+
+    A call site is a logger name plus source line, so the hot DEBUG messages
+    in progress hooks are limited without affecting other messages. Each
+    call site may log `rate` records per second; the first record let
+    through after a drop tells how many records were suppressed.
+    """
+
+    def __init__(self, rate: float, max_level: int = logging.DEBUG):
+        """
+        Args:
+            rate: Records per second allowed per call site
+            max_level: Records above this level are never dropped
+        """
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+        self._lock = threading.Lock()
+        # (logger name, line) -> (time of the last record let through, records dropped since)
+        self._sites: Dict[Tuple[str, int], Tuple[float, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+
+        key = (record.name, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            last, dropped = self._sites.get(key, (0.0, 0))
+            if now - last < 1 / self.rate:
+                self._sites[key] = (last, dropped + 1)
+                return False
+            self._sites[key] = (now, 0)
+
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(
+    level: str,
+    log_file: str,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    debug_rate_limit: float = 0
+) -> QueueListener:
+    """
+    Route all logging through a queue to a background thread.
+
+    Loggers only put records on an in-memory queue; a QueueListener thread
+    formats them and writes them to the console and a size-rotated log file,
+    so logging never blocks the event loop or a download thread on disk I/O.
+
+    Args:
+        level: Root log level name, e.g. 'INFO'
+        log_file: Path of the log file (its directory is created)
+        max_bytes: Rotate the log file at this size
+        backup_count: Number of rotated files to keep
+        debug_rate_limit: DEBUG records per second allowed per call site (0 = no limit)
+
+    Returns:
+        The running QueueListener; it is stopped (and the queue flushed) at exit.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+    formatter = logging.Formatter(LOG_FORMAT)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    if debug_rate_limit > 0:
+        # Filter before enqueueing, so dropped records cost no formatting at all
+        queue_handler.addFilter(RateLimitFilter(debug_rate_limit))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    _listener = QueueListener(log_queue, console, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,361 @@
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Buckets for durations in seconds, from fast API calls to long downloads
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# Buckets for throughput in bytes/s (64KB/s .. 128MB/s)
+SPEED_BUCKETS = tuple(2 ** exponent for exponent in range(16, 28))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    """Render a Prometheus label set, e.g. {task_type="youtube"}."""
+    pairs = [
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base of the metric types: a name, help text and a fixed set of label names."""
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set."""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Current value of a label set, summed over the labels not given."""
+        with self._lock:
+            return sum(
+                value for key, value in self._values.items()
+                if all(key[self.labelnames.index(name)] == str(wanted) for name, wanted in labels.items())
+            )
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """
+    Current value per label set.
+
+    With a callback, the value is read when the metrics are scraped; the
+    callback returns a dict mapping label value tuples to values.
+    """
+    kind = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.debug(f"Gauge callback for {self.name} failed: {e}")
+                values = {}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> (per-bucket counts, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# Download pipeline
+QUEUE_WAIT = Histogram(
+    'ytdl_queue_wait_seconds', 'Time tasks waited for a download slot', ['task_type']
+)
+EXTRACTION_TIME = Histogram(
+    'ytdl_extraction_seconds',
+    'Time spent extracting metadata (stage=probe: link check, stage=job: until the first byte)',
+    ['stage']
+)
+DOWNLOAD_SPEED = Histogram(
+    'ytdl_download_speed_bytes_per_second', 'Average throughput of finished file downloads',
+    ['task_type'], buckets=SPEED_BUCKETS
+)
+DOWNLOADED_BYTES = Counter(
+    'ytdl_downloaded_bytes_total', 'Bytes of finished file downloads', ['task_type']
+)
+PROBES = Counter(
+    'ytdl_probes_total', 'Metadata probes by outcome (ok, failed, timeout)', ['outcome']
+)
+POSTPROCESS_TIME = Histogram(
+    'ytdl_postprocess_seconds', 'Time spent in yt-dlp post-processors', ['postprocessor']
+)
+JOBS = Counter(
+    'ytdl_jobs_total', 'Finished download tasks by outcome', ['task_type', 'outcome']
+)
+
+# Telegram Bot API
+TELEGRAM_LATENCY = Histogram(
+    'telegram_api_request_seconds', 'Latency of Bot API requests', ['method']
+)
+TELEGRAM_RESPONSES = Counter(
+    'telegram_api_responses_total', 'Bot API responses by HTTP status code', ['method', 'code']
+)
+TELEGRAM_FLOOD_WAITS = Counter(
+    'telegram_api_flood_waits_total', 'Bot API requests rejected with 429 Too Many Requests', ['method']
+)
+
+
+def register_download_manager(download_manager) -> None:
+    """Expose the download manager's slot, queue and disk space usage as gauges."""
+    Gauge(
+        'ytdl_slots', 'Download slots (state=active: in use, state=max: configured)', ['state'],
+        callback=lambda: {
+            ('active',): download_manager.scheduler.active_count,
+            ('max',): download_manager.scheduler.max_concurrent,
+        }
+    )
+    Gauge(
+        'ytdl_queue_waiting', 'Tasks waiting for a download slot',
+        callback=lambda: {(): download_manager.scheduler.waiting_count}
+    )
+
+    def backend_usage():
+        usage: Dict[Tuple[str, ...], float] = {}
+        for task in list(download_manager.active_downloads.values()):
+            if task.backend is not None:
+                key = (type(task.backend).__name__,)
+                usage[key] = usage.get(key, 0) + 1
+        return usage
+
+    Gauge('ytdl_executor_busy', 'Running jobs per executor backend', ['backend'], callback=backend_usage)
+
+    if download_manager.postprocess_workers > 0:
+        Gauge(
+            'ytdl_postprocess',
+            'Post-processing stage (state=running, state=waiting: downloaded, state=max: slots)', ['state'],
+            callback=lambda: {
+                (state,): value for state, value in download_manager.get_queue_status()['postprocessing'].items()
+            }
+        )
+
+    storage = download_manager.storage
+    if storage is not None:
+        Gauge(
+            'ytdl_storage_bytes',
+            'Download filesystem space (state=free: free now, state=reserved: still expected from running jobs)',
+            ['state'],
+            callback=lambda: {('free',): storage.free_bytes(), ('reserved',): storage.reserved}
+        )
+
+
+def register_probe_pool(probe_pool) -> None:
+    """Expose the probe pool's concurrency as a gauge."""
+    Gauge(
+        'ytdl_probes', 'Metadata probes (state=running, state=waiting: queued, state=max: pool size)', ['state'],
+        callback=lambda: {(state,): value for state, value in probe_pool.status().items()}
+    )
+
+
+def register_update_processor(update_processor) -> None:
+    """Expose the number of Telegram updates in progress as a gauge."""
+    Gauge(
+        'telegram_updates', 'Updates being handled (state=running) or waiting for their chat or a slot', ['state'],
+        callback=lambda: {(state,): value for state, value in update_processor.status().items()}
+    )
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records Bot API latency, status codes and flood waits."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1] if '/file/' not in url else 'file'
+        started = time.monotonic()
+        code = 'error'
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            return code, payload
+        finally:
+            TELEGRAM_LATENCY.observe(time.monotonic() - started, method=api_method)
+            TELEGRAM_RESPONSES.inc(method=api_method, code=code)
+            if code == 429:
+                TELEGRAM_FLOOD_WAITS.inc(method=api_method)
+
+
+# Extra routes served next to /metrics and /healthz: (method, path) -> handler.
+# Handlers receive the lower-cased request headers and the body and return
+# (status, content type, body).
+_routes: Dict[Tuple[str, str], Callable[[Dict[str, str], bytes], Awaitable[Tuple[str, str, str]]]] = {}
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def add_route(method: str, path: str, handler) -> None:
+    """Serve another endpoint on the HTTP server, e.g. the Telegram webhook."""
+    _routes[(method.upper(), path)] = handler
+
+
+async def _handle_http(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    serve_metrics: bool = True
+) -> None:
+    """Serve GET /metrics and /healthz, and the routes added with add_route()."""
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=10)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        parts = request_line.decode('latin-1').split()
+        method = parts[0].upper() if parts else ''
+        path = parts[1].split('?', 1)[0] if len(parts) >= 2 else ''
+        handler = _routes.get((method, path))
+        if handler is not None:
+            length = int(headers.get('content-length') or 0)
+            if length > MAX_BODY_SIZE:
+                status, content_type, body = '413 Payload Too Large', 'text/plain; charset=utf-8', 'too large\n'
+            else:
+                payload = await asyncio.wait_for(reader.readexactly(length), timeout=10) if length else b''
+                status, content_type, body = await handler(headers, payload)
+        elif path == '/metrics' and serve_metrics:
+            status, content_type, body = '200 OK', 'text/plain; version=0.0.4; charset=utf-8', REGISTRY.render()
+        elif path == '/healthz':
+            status, content_type, body = '200 OK', 'text/plain; charset=utf-8', 'ok\n'
+        else:
+            status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', 'not found\n'
+
+        data = body.encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode('latin-1') + data
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http_server(port: int, host: str = '0.0.0.0', serve_metrics: bool = True) -> asyncio.AbstractServer:
+    """Start the HTTP endpoint (/metrics unless serve_metrics is False) on the running event loop."""
+    server = await asyncio.start_server(functools.partial(_handle_http, serve_metrics=serve_metrics), host, port)
+    logger.info(f"HTTP endpoint listening on http://{host}:{port}")
+    return server
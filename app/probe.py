@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ProbePool:
+    """
+    Bounded thread pool for metadata extraction, with per-probe deadlines.
+
+    Probes run on their own threads instead of asyncio's default executor,
+    so a burst of links can't take the threads other blocking calls need.
+    A probe that misses its deadline (waiting time included) raises
+    asyncio.TimeoutError; if it hasn't started yet it is cancelled, a
+    running extraction is abandoned and ends on yt-dlp's socket timeout.
+    """
+
+    def __init__(self, probe_func: Callable[[str], Optional[Dict[str, Any]]], max_workers: int = 4, timeout: float = 20):
+        """
+        Initialize the probe pool.
+
+        Args:
+            probe_func: Blocking metadata extraction, e.g. utils.get_video_info
+            max_workers: Probes running at the same time
+            timeout: Seconds a caller waits for a probe (0 = no deadline)
+        """
+        self.probe_func = probe_func
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='probe')
+        self._lock = threading.Lock()
+        self.pending = 0  # Submitted and not finished, abandoned probes included
+        self.running = 0
+
+    def _run(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self.running += 1
+        started = time.monotonic()
+        try:
+            return self.probe_func(url)
+        finally:
+            metrics.EXTRACTION_TIME.observe(time.monotonic() - started, stage='probe')
+            with self._lock:
+                self.running -= 1
+                self.pending -= 1
+
+    def _cancelled(self, future) -> None:
+        if future.cancelled():
+            with self._lock:
+                self.pending -= 1
+
+    async def probe(self, url: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Extract the metadata of a link on the pool.
+
+        Args:
+            url: Link to probe
+            timeout: Deadline in seconds, overriding the pool's
+
+        Returns:
+            The probe function's result (None if extraction failed)
+
+        Raises:
+            asyncio.TimeoutError: If the probe missed its deadline
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(self._run, url)
+        future.add_done_callback(self._cancelled)
+        try:
+            # Cancelling the wrapper cancels the probe if it is still queued
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout or None)
+        except asyncio.TimeoutError:
+            metrics.PROBES.inc(outcome='timeout')
+            logger.warning(f"Probe of {url} missed its {timeout}s deadline")
+            raise
+        metrics.PROBES.inc(outcome='ok' if result else 'failed')
+        return result
+
+    def status(self) -> dict:
+        """Running and waiting probes, for metrics."""
+        with self._lock:
+            return {'running': self.running, 'waiting': self.pending - self.running, 'max': self.max_workers}
+
+    def shutdown(self) -> None:
+        """Drop waiting probes; running ones finish in the background."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
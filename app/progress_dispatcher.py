@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Edit:
+    """Latest wanted state of a progress message"""
+    text: str
+    reply_markup: Any = None
+    parse_mode: Optional[str] = None
+
+
+class ProgressDispatcher:
+    """
+    Sends progress message edits to Telegram from a single worker.
+
+    Progress hooks only record the latest text per message; older pending
+    states of the same message are overwritten, so the backlog never holds
+    more than one edit per message. The worker skips edits whose text did not
+    change, edits each message at most every min_interval seconds, caps the
+    total edit rate across all chats and pauses all edits when Telegram
+    answers with RetryAfter.
+    """
+
+    def __init__(self, bot, max_edits_per_second: float = 20, min_interval: float = 5):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            bot: telegram.Bot used for the edits
+            max_edits_per_second: Global cap of edits across all chats
+            min_interval: Minimum seconds between two edits of the same message
+        """
+        self.bot = bot
+        self.max_edits_per_second = max_edits_per_second
+        self.min_interval = min_interval
+
+        # Guards _pending, update() is called from executor and reader threads
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[Tuple[int, int], _Edit]" = OrderedDict()
+        self._sent_text: Dict[Tuple[int, int], str] = {}
+        self._last_edit: Dict[Tuple[int, int], float] = {}
+        self._paused_until = 0.0
+        self._next_slot = 0.0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the worker on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._worker = self._loop.create_task(self._run())
+        logger.info(
+            f"Progress dispatcher started (max {self.max_edits_per_second} edits/s, "
+            f"{self.min_interval}s per message)"
+        )
+
+    async def stop(self) -> None:
+        """Stop the worker, dropping edits that were not sent yet."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def update(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Any = None,
+        parse_mode: Optional[str] = None
+    ) -> None:
+        """
+        Set the text a progress message should show. Thread-safe, never blocks.
+
+        Args:
+            chat_id: Chat of the message
+            message_id: Message to edit
+            text: New message text
+            reply_markup: Inline keyboard to keep on the message
+            parse_mode: Telegram parse mode of text
+        """
+        if self._loop is None:
+            return
+
+        key = (chat_id, message_id)
+        with self._lock:
+            if key not in self._pending and self._sent_text.get(key) == text:
+                return
+            new = key not in self._pending
+            self._pending[key] = _Edit(text, reply_markup, parse_mode)
+        if new:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def forget(self, chat_id: int, message_id: int) -> None:
+        """Drop a finished message: discard its pending edit and bookkeeping."""
+        key = (chat_id, message_id)
+        with self._lock:
+            self._pending.pop(key, None)
+        self._sent_text.pop(key, None)
+        self._last_edit.pop(key, None)
+
+    def _next_edit(self, now: float):
+        """
+        Take the oldest pending edit whose message may be edited again.
+
+        Returns:
+            (key, edit, None) if one is ready, else (None, None, seconds to wait)
+        """
+        with self._lock:
+            wait = None
+            for key in self._pending:
+                ready_at = self._last_edit.get(key, 0.0) + self.min_interval
+                if ready_at <= now:
+                    return key, self._pending.pop(key), None
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+            return None, None, wait
+
+    async def _run(self) -> None:
+        """Worker: send pending edits within the rate limits."""
+        while True:
+            now = time.monotonic()
+
+            # Global budget: flood wait from Telegram and the edits/second cap
+            delay = max(self._paused_until, self._next_slot) - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            key, edit, wait = self._next_edit(now)
+            if key is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._next_slot = now + 1 / self.max_edits_per_second
+            self._last_edit[key] = now
+            await self._send(key, edit)
+
+    async def _send(self, key: Tuple[int, int], edit: _Edit) -> None:
+        """Edit one message, handling flood control."""
+        if self._sent_text.get(key) == edit.text:
+            return
+
+        chat_id, message_id = key
+        try:
+            await self.bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=message_id,
+                text=edit.text,
+                parse_mode=edit.parse_mode,
+                reply_markup=edit.reply_markup,
+                disable_web_page_preview=True
+            )
+            self._sent_text[key] = edit.text
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if hasattr(retry_after, 'total_seconds'):
+                retry_after = retry_after.total_seconds()
+            self._paused_until = time.monotonic() + retry_after
+            logger.warning(f"Flood control hit, pausing progress edits for {retry_after}s")
+            # Put the edit back unless a newer state arrived meanwhile
+            with self._lock:
+                if key not in self._pending:
+                    self._pending[key] = edit
+                    self._pending.move_to_end(key, last=False)
+        except BadRequest as e:
+            if 'not modified' in str(e).lower():
+                self._sent_text[key] = edit.text
+            else:
+                logger.error(f"Error editing progress message {message_id} in chat {chat_id}: {e}")
+        except Exception as e:
+            logger.error(f"Error editing progress message {message_id} in chat {chat_id}: {e}")
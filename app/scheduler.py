@@ -0,0 +1,225 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower runs first
+PRIORITY_HIGH = 0  # Small jobs (e.g. short Telegram videos) that may jump the queue
+PRIORITY_NORMAL = 1
+
+
+@dataclass
+class _Entry:
+    """A task waiting for a download slot"""
+    task_id: int
+    user_id: int
+    priority: int
+    future: asyncio.Future
+    bypassed: int = 0  # Tasks admitted past this one while it was held
+
+
+class FairScheduler:
+    """
+    Admits tasks to a fixed number of download slots.
+
+    Waiting tasks are ordered by priority class first. Within a class, users
+    are served round-robin so one user queueing many links cannot starve the
+    others, and each user's own tasks run in FIFO order. A user never holds
+    more than max_per_user slots at once.
+
+    An optional admission_check(task_id) can hold a task even when slots
+    are free (e.g. while disk space is low), or reject it by raising, which
+    fails its admission future. A held task keeps its place while tasks
+    behind it that pass the check are admitted, until max_bypass of them
+    went ahead; then the queue is held for it. dispatch() retries once the
+    condition may have changed.
+    """
+
+    def __init__(self, max_concurrent: int, max_per_user: int = 0, max_bypass: int = 0):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrent: Number of download slots
+            max_per_user: Maximum slots a single user may hold (0 = no limit)
+            max_bypass: Tasks admitted past a held task before the queue waits for it
+        """
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_bypass = max_bypass
+        # user_id -> priority -> waiting entries; users are kept in round-robin order
+        self._queues: "OrderedDict[int, Dict[int, Deque[_Entry]]]" = OrderedDict()
+        self._entries: Dict[int, _Entry] = {}  # task_id -> waiting entry
+        self._running: Dict[int, int] = {}  # task_id -> user_id
+        self._running_per_user: Dict[int, int] = {}
+        self.admission_check: Optional[Callable[[int], bool]] = None
+        self.held = False  # True while admission_check holds a task
+
+    @property
+    def active_count(self) -> int:
+        """Number of slots in use."""
+        return len(self._running)
+
+    @property
+    def waiting_count(self) -> int:
+        """Number of tasks waiting for a slot."""
+        return len(self._entries)
+
+    def enqueue(self, task_id: int, user_id: int, priority: int = PRIORITY_NORMAL) -> asyncio.Future:
+        """
+        Queue a task for a slot.
+
+        Returns:
+            Future resolved when the task is admitted. The caller must call
+            release() once the task no longer needs its slot.
+        """
+        entry = _Entry(
+            task_id=task_id,
+            user_id=user_id,
+            priority=priority,
+            future=asyncio.get_event_loop().create_future()
+        )
+        self._entries[task_id] = entry
+        self._queues.setdefault(user_id, {}).setdefault(priority, deque()).append(entry)
+        self._dispatch()
+        return entry.future
+
+    def remove(self, task_id: int, exc: BaseException) -> bool:
+        """
+        Drop a waiting task and fail its admission future with exc.
+
+        Returns:
+            bool: True if the task was waiting, False otherwise
+        """
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return False
+
+        user_queues = self._queues.get(entry.user_id, {})
+        queue = user_queues.get(entry.priority)
+        if queue is not None:
+            queue.remove(entry)
+            if not queue:
+                del user_queues[entry.priority]
+        if not user_queues:
+            self._queues.pop(entry.user_id, None)
+
+        if not entry.future.done():
+            entry.future.set_exception(exc)
+        return True
+
+    def release(self, task_id: int) -> None:
+        """Free the slot held by a task and admit the next waiting task."""
+        user_id = self._running.pop(task_id, None)
+        if user_id is None:
+            return
+        self._running_per_user[user_id] -= 1
+        if not self._running_per_user[user_id]:
+            del self._running_per_user[user_id]
+        self._dispatch()
+
+    def set_max_concurrent(self, max_concurrent: int) -> None:
+        """Resize the number of slots at runtime."""
+        self.max_concurrent = max_concurrent
+        self._dispatch()
+
+    def dispatch(self) -> None:
+        """Admit waiting tasks again, e.g. after the admission_check condition changed."""
+        self._dispatch()
+
+    def positions(self) -> Dict[int, int]:
+        """
+        Get the admission order of all waiting tasks.
+
+        Returns:
+            dict mapping task_id to its 1-based queue position
+        """
+        # Replay the selection on a copy of the queues; per-user caps only
+        # delay a user's tasks, the round-robin order stays the same
+        queues = OrderedDict(
+            (user_id, {priority: deque(queue) for priority, queue in user_queues.items()})
+            for user_id, user_queues in self._queues.items()
+        )
+        order: Dict[int, int] = {}
+        while True:
+            entry = self._pick(queues, ignore_caps=True)
+            if entry is None:
+                return order
+            order[entry.task_id] = len(order) + 1
+
+    def _pick(self, queues, ignore_caps: bool = False) -> Optional[_Entry]:
+        """Take the next entry to admit from queues, rotating the served user to the back."""
+        priorities = sorted({priority for user_queues in queues.values() for priority in user_queues})
+        for priority in priorities:
+            for user_id, user_queues in queues.items():
+                if priority not in user_queues:
+                    continue
+                if (
+                    not ignore_caps
+                    and self.max_per_user > 0
+                    and self._running_per_user.get(user_id, 0) >= self.max_per_user
+                ):
+                    continue
+
+                queue = user_queues[priority]
+                entry = queue.popleft()
+                if not queue:
+                    del user_queues[priority]
+                if user_queues:
+                    queues.move_to_end(user_id)
+                else:
+                    del queues[user_id]
+                return entry
+        return None
+
+    def _put_back(self, entry: _Entry) -> None:
+        """Return an entry taken by _pick() to the head of the queue."""
+        user_queues = self._queues.setdefault(entry.user_id, {})
+        user_queues.setdefault(entry.priority, deque()).appendleft(entry)
+        self._queues.move_to_end(entry.user_id, last=False)
+
+    def _dispatch(self) -> None:
+        """Admit waiting tasks while slots are free."""
+        held = []  # Entries that failed admission_check, in queue order
+        checked = False
+        try:
+            while len(self._running) < self.max_concurrent:
+                entry = self._pick(self._queues)
+                if entry is None:
+                    return
+                if not entry.future.done() and self.admission_check is not None:
+                    checked = True
+                    try:
+                        admitted = self.admission_check(entry.task_id)
+                    except Exception as e:
+                        logger.warning(f"Task {entry.task_id} rejected at admission: {e}")
+                        del self._entries[entry.task_id]
+                        entry.future.set_exception(e)
+                        continue
+                    if not admitted:
+                        held.append(entry)
+                        # Once enough tasks went ahead of a held one, wait for it
+                        if entry.bypassed >= self.max_bypass:
+                            return
+                        continue
+                del self._entries[entry.task_id]
+                if entry.future.done():
+                    # Waiter went away, don't spend a slot on it
+                    continue
+
+                self._running[entry.task_id] = entry.user_id
+                self._running_per_user[entry.user_id] = self._running_per_user.get(entry.user_id, 0) + 1
+                entry.future.set_result(None)
+                for held_entry in held:
+                    held_entry.bypassed += 1
+                logger.debug(f"Admitted task {entry.task_id} for user {entry.user_id} (priority {entry.priority})")
+        finally:
+            # With all slots busy nothing was checked, and the last verdict stands
+            if checked or not self._entries:
+                self.held = bool(held)
+            # Held entries go back to the head of the queue, in their order
+            for entry in reversed(held):
+                self._put_back(entry)
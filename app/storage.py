@@ -0,0 +1,182 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StorageFullError(Exception):
+    """A download can't fit on the download filesystem, even with nothing else reserved."""
+
+
+class StorageBudget:
+    """
+    Reserves disk space for downloads before they start.
+
+    A task is admitted only if the free space of the download filesystem,
+    minus what running tasks are still expected to write, stays above
+    min_free after its own reservation. Reservations shrink as the task's
+    bytes land on disk and are dropped when the task ends.
+
+    Optionally, files in an evict_dir (a managed cache area on the same
+    filesystem) can be deleted least recently used first to make room.
+
+    A task that doesn't fit waits; up to max_bypass smaller tasks queued
+    behind it may start in the meantime.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        min_free: int,
+        default_reservation: int = 0,
+        evict_dir: Optional[str] = None,
+        evict_min_age: float = 0,
+        recheck_interval: float = 30,
+        max_bypass: int = 10,
+        on_evict: Optional[Callable[[List[str]], None]] = None
+    ):
+        """
+        Initialize the storage budget.
+
+        Args:
+            path: Any path on the filesystem downloads are written to
+            min_free: Free bytes that must remain after all reservations
+            default_reservation: Bytes reserved for tasks of unknown size
+            evict_dir: Directory whose files may be deleted to make room (None = never evict)
+            evict_min_age: Only evict files not used for this many seconds
+            recheck_interval: Seconds between free space checks while tasks are held
+            max_bypass: Tasks that may start ahead of one waiting for space
+            on_evict: Called with the paths deleted by an eviction (from the evicting
+                thread), e.g. to take their videos out of the download archive
+        """
+        self.path = path
+        self.min_free = min_free
+        self.default_reservation = default_reservation
+        self.evict_dir = os.path.abspath(evict_dir) if evict_dir else None
+        self.evict_min_age = evict_min_age
+        self.recheck_interval = recheck_interval
+        self.max_bypass = max_bypass
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._reservations: Dict[int, int] = {}  # task_id -> bytes still expected
+
+    def free_bytes(self) -> int:
+        """Free bytes on the download filesystem."""
+        try:
+            return shutil.disk_usage(self.path).free
+        except OSError as e:
+            logger.error(f"Can't read free space of {self.path}: {e}")
+            return 0
+
+    @property
+    def reserved(self) -> int:
+        """Bytes running tasks are still expected to write."""
+        with self._lock:
+            return sum(self._reservations.values())
+
+    def available(self) -> int:
+        """Bytes that may still be reserved."""
+        return self.free_bytes() - self.reserved - self.min_free
+
+    def try_reserve(self, task_id: int, size: Optional[int]) -> bool:
+        """
+        Reserve space for a task if it fits.
+
+        Args:
+            task_id: Task the space is reserved for
+            size: Expected size in bytes, None if unknown (default_reservation is used)
+
+        Returns:
+            bool: True if the space was reserved
+        """
+        size = size or self.default_reservation
+        free = self.free_bytes()
+        with self._lock:
+            if free - sum(self._reservations.values()) - size < self.min_free:
+                return False
+            self._reservations[task_id] = size
+        return True
+
+    def consume(self, task_id: int, written: int) -> None:
+        """Shrink a task's reservation by bytes it has written to disk."""
+        with self._lock:
+            if task_id in self._reservations:
+                self._reservations[task_id] = max(0, self._reservations[task_id] - written)
+
+    def release(self, task_id: int) -> None:
+        """Drop a task's reservation."""
+        with self._lock:
+            self._reservations.pop(task_id, None)
+
+    def status(self) -> dict:
+        """Free space, reservations and watermark in bytes, for /queue."""
+        with self._lock:
+            reserved = sum(self._reservations.values())
+            count = len(self._reservations)
+        return {'free': self.free_bytes(), 'reserved': reserved, 'reservations': count, 'min_free': self.min_free}
+
+    def _eviction_candidates(self) -> List[Tuple[float, str, int]]:
+        """(last use, path, size) of evictable files, least recently used first."""
+        now = time.time()
+        candidates = []
+        for root, dirs, files in os.walk(self.evict_dir):
+            # Hidden files hold state (archives, journals, caches), not media
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for name in files:
+                if name.startswith('.') or name.endswith('.part'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # atime is not updated on noatime mounts, mtime then stands in
+                last_used = max(stat.st_atime, stat.st_mtime)
+                if now - last_used >= self.evict_min_age:
+                    candidates.append((last_used, path, stat.st_size))
+        candidates.sort()
+        return candidates
+
+    def evict(self, needed: int) -> int:
+        """
+        Delete least recently used files from evict_dir until needed bytes are freed.
+
+        Blocking; run it in a thread.
+
+        Returns:
+            int: Bytes freed
+        """
+        if not self.evict_dir or needed <= 0:
+            return 0
+
+        freed = 0
+        evicted = []
+        for _, path, size in self._eviction_candidates():
+            if freed >= needed:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not evict {path}: {e}")
+                continue
+            freed += size
+            evicted.append(path)
+            logger.info(f"Evicted {path} ({size} bytes) to free disk space")
+            # Drop directories (e.g. playlist folders) left empty
+            parent = os.path.dirname(path)
+            while parent != self.evict_dir and parent.startswith(self.evict_dir):
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    break
+                parent = os.path.dirname(parent)
+        if evicted and self.on_evict is not None:
+            try:
+                self.on_evict(evicted)
+            except Exception as e:
+                logger.error(f"Could not record the eviction of {len(evicted)} files: {e}")
+        return freed
@@ -1,24 +1,176 @@
 import os
+import re
+import asyncio
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import httpx
 from telegram import Video
 from telegram.ext import ContextTypes
 from config import Config
+from fileops import move_file
 
 logger = logging.getLogger(__name__)
 
+# Size of the chunks Telegram files are streamed to disk in
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Disk writes of Telegram downloads run here, not on the event loop and not in the
+# default executor that every asyncio.to_thread() caller shares
+_write_executor: Optional[ThreadPoolExecutor] = None
+
+# File URL python-telegram-bot builds around a local server path: <base_file_url><token>/<path>
+_FILE_URL_RE = re.compile(r'^https?://[^/]+(?:/[^/]+)*/file/bot[^/]+/(/.*)$')
+
+
+def get_video_path(video: Video, download_dir: str = None) -> str:
+    """
+    Get the path a Telegram video is downloaded to.
+    
+    The name is derived from file_unique_id, which is the same for every
+    copy of a file, so it also tells whether the video was downloaded before.
+    """
+    if download_dir is None:
+        download_dir = Config.DOWNLOAD_DIR
+    # Format: telegram_video_{unique_id}.mp4
+    return os.path.join(download_dir, f"telegram_video_{video.file_unique_id}.mp4")
+
+
+def _progress_event(filepath: str, tmpfilepath: str, downloaded: int, total: int, started: float) -> dict:
+    """Build a yt-dlp style progress dict for a Telegram download."""
+    elapsed = time.monotonic() - started
+    speed = downloaded / elapsed if elapsed > 0 else None
+    eta = (total - downloaded) / speed if speed and total else None
+    return {
+        'status': 'downloading',
+        'filename': filepath,
+        'tmpfilename': tmpfilepath,
+        'downloaded_bytes': downloaded,
+        'total_bytes': total,
+        'elapsed': elapsed,
+        'speed': speed,
+        'eta': eta,
+    }
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Shared HTTP client for file downloads, so connections are reused."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=10.0))
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client (on shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _get_write_executor() -> ThreadPoolExecutor:
+    """Bounded thread pool for the file writes of Telegram downloads."""
+    global _write_executor
+    if _write_executor is None:
+        _write_executor = ThreadPoolExecutor(
+            max_workers=max(1, Config.TELEGRAM_WRITE_WORKERS), thread_name_prefix='telegram-write'
+        )
+    return _write_executor
+
+
+def shutdown_write_executor() -> None:
+    """Stop the write threads (on shutdown), after the writes already submitted."""
+    global _write_executor
+    if _write_executor is not None:
+        _write_executor.shutdown(wait=True)
+        _write_executor = None
+
+
+async def _write(func: Callable, *args):
+    """Run a blocking file operation on the write executor."""
+    return await asyncio.get_running_loop().run_in_executor(_get_write_executor(), func, *args)
+
+
+def _local_file_path(file_path: str) -> str:
+    """Map a path on the local Bot API server to where its directory is mounted here."""
+    # python-telegram-bot only keeps the server's path if it exists here,
+    # otherwise it is prefixed with the file URL
+    match = _FILE_URL_RE.match(file_path)
+    if match:
+        file_path = match.group(1)
+    server_dir = Config.TELEGRAM_API_SERVER_DIR.rstrip('/')
+    if Config.TELEGRAM_API_DATA_DIR and file_path.startswith(server_dir + '/'):
+        return os.path.join(Config.TELEGRAM_API_DATA_DIR, file_path[len(server_dir) + 1:])
+    return file_path
+
+
+def _ingest_local_file(
+    source: str,
+    filepath: str,
+    tmpfilepath: str,
+    progress_hook: Optional[Callable[[dict], None]] = None
+) -> int:
+    """
+    Take a file the local Bot API server already stored on disk.
+    
+    Hard-links it into place when source and destination share a filesystem
+    (no data is copied), otherwise copies it in chunks through the temp
+    directory, reporting progress.
+    
+    Returns:
+        Size of the file in bytes
+    """
+    total = os.path.getsize(source)
+    try:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        os.link(source, filepath)
+        logger.debug(f"Hard-linked {source} to {filepath}")
+        return total
+    except OSError as e:
+        logger.debug(f"Can't hard-link {source} ({e}), copying")
+    
+    started = time.monotonic()
+    downloaded = 0
+    with open(source, 'rb') as src, open(tmpfilepath, 'wb') as dst:
+        while True:
+            chunk = src.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            dst.write(chunk)
+            downloaded += len(chunk)
+            if progress_hook:
+                progress_hook(_progress_event(filepath, tmpfilepath, downloaded, total, started))
+    move_file(tmpfilepath, filepath, progress_hook)
+    return total
+
 
 async def download_telegram_video(
     video: Video,
-    context: ContextTypes.DEFAULT_TYPE,
-    download_dir: str = None
+    context: ContextTypes.DEFAULT_TYPE = None,
+    download_dir: str = None,
+    progress_hook: Optional[Callable[[dict], None]] = None
 ) -> str:
     """
     Download a video from Telegram.
     
+    The file is streamed in chunks to TEMP_DOWNLOAD_DIR and moved to the
+    download directory once complete, reporting yt-dlp style progress dicts
+    to progress_hook along the way (a move across filesystems is reported
+    as a 'MoveFiles' post-processor, see fileops.move_file()). With a local Bot API server the file is
+    hard-linked (or copied) from the server's working directory instead.
+    
     Args:
         video: Telegram Video object
-        context: Telegram context for bot operations
+        context: Telegram context for bot operations (unused, the video is
+            bound to its bot)
         download_dir: Directory to save the video (defaults to Config.DOWNLOAD_DIR)
+        progress_hook: Optional callback for progress dicts
     
     Returns:
         Path to the downloaded video file
@@ -38,25 +190,51 @@ async def download_telegram_video(
     if download_dir is None:
         download_dir = Config.DOWNLOAD_DIR
     
-    # Ensure download directory exists
+    # Ensure download directories exist
     os.makedirs(download_dir, exist_ok=True)
+    os.makedirs(Config.TEMP_DOWNLOAD_DIR, exist_ok=True)
     
     try:
-        # Get file from Telegram
-        file = await video.get_file()
+        # Get file from Telegram (a local server downloads it first)
+        file = await video.get_file(read_timeout=Config.TELEGRAM_GET_FILE_TIMEOUT)
         
         # Generate filename (use file_unique_id to avoid collisions)
-        # Format: telegram_video_{unique_id}.mp4
-        filename = f"telegram_video_{video.file_unique_id}.mp4"
-        filepath = os.path.join(download_dir, filename)
+        filepath = get_video_path(video, download_dir)
+        tmpfilepath = os.path.join(Config.TEMP_DOWNLOAD_DIR, os.path.basename(filepath) + ".part")
         
         logger.info(
             f"Downloading Telegram video: file_id={video.file_id}, "
             f"size={video.file_size}, path={filepath}"
         )
         
-        # Download the file
-        await file.download_to_drive(filepath)
+        if Config.TELEGRAM_LOCAL_MODE:
+            # file_path is a path on the local server's disk
+            total = downloaded = await _write(
+                _ingest_local_file, _local_file_path(file.file_path), filepath, tmpfilepath, progress_hook
+            )
+        else:
+            # Stream the file to disk
+            started = time.monotonic()
+            downloaded = 0
+            client = _get_http_client()
+            async with client.stream('GET', file.file_path) as response:
+                response.raise_for_status()
+                total = int(response.headers.get('content-length') or file.file_size or video.file_size or 0)
+                f = await _write(open, tmpfilepath, 'wb')
+                try:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        # One write at a time per file, so chunks land in order
+                        await _write(f.write, chunk)
+                        downloaded += len(chunk)
+                        if progress_hook:
+                            progress_hook(_progress_event(filepath, tmpfilepath, downloaded, total, started))
+                finally:
+                    await _write(f.close)
+            
+            # Across filesystems this is a full copy
+            await _write(move_file, tmpfilepath, filepath, progress_hook)
+        if progress_hook:
+            progress_hook({'status': 'finished', 'filename': filepath, 'downloaded_bytes': downloaded, 'total_bytes': total})
         
         logger.info(f"Telegram video downloaded successfully: {filepath}")
         return filepath
@@ -0,0 +1,123 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates concurrently, but those of one chat in arrival order.
+
+    Each chat has a FIFO lock that its updates take before a processing slot,
+    so a chat waiting on a slow handler (e.g. a link probe) doesn't hold slots
+    other chats could use. At most max_concurrent_updates handlers run at
+    once. Button presses are not ordered: they act on messages already sent,
+    and a handler of the same chat may be waiting for them.
+
+    Intake is bounded as well: an UpdateQueue built with make_queue() only
+    accepts a new update while fewer than max_backlog are unfinished. When
+    handlers pile up behind a saturated probe pool, polling stops fetching
+    and webhook requests are answered late, so Telegram holds the updates
+    back instead of the bot buffering them without limit.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_backlog: int = 0):
+        """
+        Args:
+            max_concurrent_updates: Handlers running at the same time
+            max_backlog: Updates accepted but not finished before intake pauses
+                (0 = 4 times max_concurrent_updates)
+        """
+        super().__init__(max_concurrent_updates)
+        self.max_backlog = max_backlog or 4 * max_concurrent_updates
+        self.pending = 0
+        self.running = 0
+        self._capacity = asyncio.Condition()
+        self._chat_locks: Dict[Hashable, asyncio.Lock] = {}
+        self._chat_waiters: Dict[Hashable, int] = {}
+
+    @staticmethod
+    def _order_key(update: object) -> Optional[Hashable]:
+        """Chat (or user, for updates without a chat) whose updates must stay ordered."""
+        if not isinstance(update, Update) or update.callback_query:
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return ('user', update.effective_user.id)
+        return None
+
+    async def admit(self) -> None:
+        """Wait until the backlog has room for one more update and count it."""
+        async with self._capacity:
+            await self._capacity.wait_for(lambda: self.pending < self.max_backlog)
+            self.pending += 1
+
+    async def _finished(self) -> None:
+        async with self._capacity:
+            self.pending -= 1
+            self._capacity.notify()
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._order_key(update)
+        try:
+            if key is None:
+                async with self._semaphore:
+                    await self.do_process_update(update, coroutine)
+                return
+
+            lock = self._chat_locks.setdefault(key, asyncio.Lock())
+            self._chat_waiters[key] = self._chat_waiters.get(key, 0) + 1
+            try:
+                async with lock:
+                    async with self._semaphore:
+                        await self.do_process_update(update, coroutine)
+            finally:
+                self._chat_waiters[key] -= 1
+                if not self._chat_waiters[key]:
+                    del self._chat_waiters[key]
+                    del self._chat_locks[key]
+        finally:
+            # Only updates went through admit()
+            if isinstance(update, Update):
+                await self._finished()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def make_queue(self) -> 'UpdateQueue':
+        """Build the application's update queue, gated by this processor's backlog."""
+        return UpdateQueue(self)
+
+    def status(self) -> dict:
+        """Running and waiting updates, for metrics."""
+        return {'running': self.running, 'waiting': max(0, self.pending - self.running)}
+
+
+class UpdateQueue(asyncio.Queue):
+    """
+    Update queue whose put() waits for room in the processor's backlog.
+
+    Only updates are gated; the application's own stop signal always goes
+    through.
+    """
+
+    def __init__(self, processor: ChatOrderedUpdateProcessor):
+        super().__init__()
+        self.processor = processor
+
+    async def put(self, item: Any) -> None:
+        if isinstance(item, Update):
+            await self.processor.admit()
+        await super().put(item)
@@ -0,0 +1,312 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from telegram import Message
+from telegram.error import BadRequest
+
+from job_store import JobStore
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks files are read from disk and streamed to the Bot API in
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Split parts aim this far below the size limit, as cuts land on keyframes
+SPLIT_HEADROOM = 0.9
+
+
+class UploadError(Exception):
+    """A file could not be sent to the chat."""
+
+
+def _multipart_head(boundary: str, fields: Dict[str, str], file_field: str, filename: str) -> bytes:
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n')
+    safe_name = filename.replace('"', "'").replace('\r', ' ').replace('\n', ' ')
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{safe_name}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    )
+    return ''.join(parts).encode('utf-8')
+
+
+async def _stream_file(
+    path: str,
+    head: bytes,
+    tail: bytes,
+    progress_callback: Optional[Callable[[int, int], None]]
+) -> AsyncIterator[bytes]:
+    """Yield a multipart body, reading the file chunk by chunk in a thread."""
+    total = os.path.getsize(path)
+    sent = 0
+    yield head
+    with open(path, 'rb') as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+            sent += len(chunk)
+            if progress_callback:
+                progress_callback(sent, total)
+    yield tail
+
+
+async def _run(*args: str) -> Tuple[int, str]:
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    return process.returncode, (stdout or stderr).decode('utf-8', 'replace')
+
+
+async def split_video(path: str, max_size: int, work_dir: str) -> List[str]:
+    """
+    Cut a video into parts of at most max_size bytes with ffmpeg, without re-encoding.
+
+    Parts are cut at keyframes, so their sizes vary; if one comes out too
+    large, the file is cut again into shorter parts.
+
+    Returns:
+        Paths of the parts, in order, inside work_dir
+    """
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        raise UploadError("ffmpeg is needed to split files over the upload limit")
+
+    code, output = await _run(
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', path
+    )
+    try:
+        duration = float(json.loads(output)['format']['duration'])
+    except (ValueError, KeyError, TypeError):
+        raise UploadError(f"Could not read the duration of {path}")
+
+    size = os.path.getsize(path)
+    _, extension = os.path.splitext(path)
+    target = max_size * SPLIT_HEADROOM
+    for _ in range(3):
+        segment_time = max(1.0, duration * target / size)
+        for name in os.listdir(work_dir):
+            os.remove(os.path.join(work_dir, name))
+        pattern = os.path.join(work_dir, f"part%03d{extension}")
+        code, output = await _run(
+            'ffmpeg', '-v', 'error', '-y', '-i', path, '-map', '0', '-c', 'copy',
+            '-f', 'segment', '-segment_time', f"{segment_time:.3f}", '-reset_timestamps', '1', pattern
+        )
+        if code != 0:
+            raise UploadError(f"ffmpeg could not split {path}: {output.strip()[-200:]}")
+        parts = sorted(os.path.join(work_dir, name) for name in os.listdir(work_dir))
+        if parts and all(os.path.getsize(part) <= max_size for part in parts):
+            return parts
+        target /= 2
+    raise UploadError(f"Could not split {path} into parts under {max_size} bytes")
+
+
+class Uploader:
+    """
+    Sends downloaded videos back to the chat that asked for them.
+
+    Files are streamed from disk as multipart uploads, a chunk at a time,
+    so memory use doesn't grow with the file size. Files over max_size are
+    split into parts first. The file_ids Telegram returns are cached per
+    content key (in memory and in the job store, if any), so a repeat
+    request is answered by sending the file_ids again without uploading.
+    """
+
+    def __init__(
+        self,
+        bot,
+        job_store: Optional[JobStore] = None,
+        max_size: int = 50 * 1024 * 1024,
+        work_dir: Optional[str] = None
+    ):
+        """
+        Initialize the uploader.
+
+        Args:
+            bot: telegram.Bot used for sending cached files (and its API URL and token for uploads)
+            job_store: Persists file_ids across restarts (None = keep them in memory only)
+            max_size: Largest file the Bot API accepts (50MB, 2000MB for a local server)
+            work_dir: Where split parts are written (default: system temp dir)
+        """
+        self.bot = bot
+        self.job_store = job_store
+        self.max_size = max_size
+        self.work_dir = work_dir
+        self._file_ids: Dict[str, List[Tuple[str, str]]] = {}
+        self._uploads: Dict[str, asyncio.Future] = {}  # content key -> upload in progress
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            # Uploads of large files take a while to be answered
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0, read=600.0))
+        return self._client
+
+    async def close(self) -> None:
+        """Close the HTTP client (on shutdown)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def cached(self, content_key: str) -> List[Tuple[str, str]]:
+        """(kind, file_id) of each part of an uploaded video, empty if not uploaded yet."""
+        if content_key not in self._file_ids and self.job_store is not None:
+            uploads = self.job_store.get_uploads(content_key)
+            if uploads:
+                self._file_ids[content_key] = uploads
+        return self._file_ids.get(content_key, [])
+
+    async def forget(self, content_key: str) -> None:
+        """Drop the cached file_ids of a video, so it is uploaded again."""
+        self._file_ids.pop(content_key, None)
+        if self.job_store is not None:
+            await asyncio.to_thread(self.job_store.set_uploads, content_key, [])
+
+    async def send_cached(self, chat_id: int, content_key: str, caption: Optional[str] = None) -> bool:
+        """
+        Send a video by its cached file_ids, waiting for an upload of it in progress.
+
+        Returns:
+            bool: True if the video was sent
+        """
+        upload = self._uploads.get(content_key)
+        if upload is not None:
+            await asyncio.shield(upload)
+
+        uploads = self.cached(content_key)
+        if not uploads:
+            return False
+        for index, (kind, file_id) in enumerate(uploads):
+            part_caption = caption if index == 0 else None
+            send = self.bot.send_video if kind == 'video' else self.bot.send_document
+            try:
+                await send(chat_id, file_id, caption=part_caption, disable_notification=True)
+            except BadRequest as e:
+                if index > 0:
+                    raise
+                # The file is gone on Telegram's side, upload it again next time
+                logger.warning(f"Cached file_id of {content_key} was rejected: {e}")
+                await self.forget(content_key)
+                return False
+        logger.info(f"Sent {content_key} to chat {chat_id} from {len(uploads)} cached file_id(s)")
+        return True
+
+    async def deliver(
+        self,
+        chat_id: int,
+        paths: List[str],
+        content_key: Optional[str] = None,
+        caption: Optional[str] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> None:
+        """
+        Send downloaded files to a chat, from the file_id cache if possible.
+
+        Args:
+            chat_id: Chat to send to
+            paths: Downloaded files of the video
+            content_key: Cache key of the video (None = don't cache)
+            caption: Caption of the first message
+            progress_callback: Called with (bytes sent, total bytes) while uploading
+
+        Raises:
+            UploadError: If a file is too large and can't be split, or the upload failed
+        """
+        # Requests following the same download all end up here; the first uploads,
+        # the others wait for it and send its file_ids
+        if content_key and (content_key in self._uploads or self.cached(content_key)):
+            try:
+                if await self.send_cached(chat_id, content_key, caption):
+                    return
+            except BadRequest as e:
+                # A later part was rejected after the first went out: upload the video afresh
+                logger.warning(f"Cached parts of {content_key} were rejected, uploading again: {e}")
+                await self.forget(content_key)
+
+        done = asyncio.get_running_loop().create_future()
+        if content_key:
+            self._uploads[content_key] = done
+        try:
+            uploads = []
+            for path in paths:
+                uploads.extend(await self._upload_file(chat_id, path, caption if not uploads else None, progress_callback))
+            if content_key and uploads:
+                self._file_ids[content_key] = uploads
+                if self.job_store is not None:
+                    await asyncio.to_thread(self.job_store.set_uploads, content_key, uploads)
+        finally:
+            done.set_result(None)
+            if content_key and self._uploads.get(content_key) is done:
+                del self._uploads[content_key]
+
+    async def _upload_file(
+        self,
+        chat_id: int,
+        path: str,
+        caption: Optional[str],
+        progress_callback: Optional[Callable[[int, int], None]]
+    ) -> List[Tuple[str, str]]:
+        if os.path.getsize(path) <= self.max_size:
+            return [await self._upload(chat_id, path, caption, progress_callback)]
+
+        work_dir = tempfile.mkdtemp(prefix='upload-', dir=self.work_dir)
+        try:
+            parts = await split_video(path, self.max_size, work_dir)
+            logger.info(f"Split {path} into {len(parts)} parts for upload")
+            uploads = []
+            for index, part in enumerate(parts, start=1):
+                part_caption = f"{caption or os.path.basename(path)} ({index}/{len(parts)})"
+                uploads.append(await self._upload(chat_id, part, part_caption, progress_callback))
+            return uploads
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def _upload(
+        self,
+        chat_id: int,
+        path: str,
+        caption: Optional[str],
+        progress_callback: Optional[Callable[[int, int], None]]
+    ) -> Tuple[str, str]:
+        """Stream one file to sendVideo and return the (kind, file_id) Telegram assigned."""
+        boundary = uuid.uuid4().hex
+        fields = {'chat_id': str(chat_id), 'supports_streaming': 'true', 'disable_notification': 'true'}
+        if caption:
+            fields['caption'] = caption
+        head = _multipart_head(boundary, fields, 'video', os.path.basename(path))
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        length = len(head) + os.path.getsize(path) + len(tail)
+
+        started = time.monotonic()
+        try:
+            response = await self._get_client().post(
+                f"{self.bot.base_url}/sendVideo",
+                content=_stream_file(path, head, tail, progress_callback),
+                headers={
+                    'Content-Type': f'multipart/form-data; boundary={boundary}',
+                    'Content-Length': str(length),
+                }
+            )
+            data = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise UploadError(f"Upload of {path} failed: {e}")
+        if not data.get('ok'):
+            raise UploadError(f"Upload of {path} rejected: {data.get('description', response.status_code)}")
+
+        message = Message.de_json(data['result'], self.bot)
+        logger.info(f"Uploaded {path} ({length} bytes) to chat {chat_id} in {time.monotonic() - started:.1f}s")
+        if message.video:
+            return 'video', message.video.file_id
+        if message.document:
+            # Telegram keeps files it can't stream (e.g. some containers) as documents
+            return 'document', message.document.file_id
+        raise UploadError(f"Upload of {path} returned no file")
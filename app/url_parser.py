@@ -0,0 +1,116 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+VIDEO = 'video'
+SHORTS = 'shorts'
+LIVE = 'live'
+PLAYLIST = 'playlist'
+CHANNEL = 'channel'
+
+_YOUTUBE_HOSTS = frozenset({
+    'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com',
+    'youtube-nocookie.com', 'www.youtube-nocookie.com',
+})
+_SHORT_HOSTS = frozenset({'youtu.be', 'www.youtu.be'})
+
+_VIDEO_ID_RE = re.compile(r'[0-9A-Za-z_-]{11}')
+_PLAYLIST_ID_RE = re.compile(r'[0-9A-Za-z_-]{2,}')
+
+# Path rules for youtube.com hosts, tried in order: (pattern, kind).
+# A named group 'id' is a video ID, 'channel' a channel path.
+_PATH_RULES = tuple((re.compile(pattern), kind) for pattern, kind in (
+    (r'/(?:embed|v|e)/(?P<id>[0-9A-Za-z_-]{11})/?', VIDEO),
+    (r'/shorts/(?P<id>[0-9A-Za-z_-]{11})/?', SHORTS),
+    (r'/live/(?P<id>[0-9A-Za-z_-]{11})/?', LIVE),
+    (r'/(?P<channel>@[\w.-]+|channel/UC[0-9A-Za-z_-]{22}|c/[\w.-]+|user/[\w.-]+)/live/?', LIVE),
+    (r'/(?P<channel>(?:@[\w.-]+|channel/UC[0-9A-Za-z_-]{22}|c/[\w.-]+|user/[\w.-]+)(?:/[\w-]+)?)/?', CHANNEL),
+))
+
+
+@dataclass(frozen=True)
+class ParsedURL:
+    """A recognized YouTube link: what it points to and its canonical form."""
+    kind: str  # video, shorts, live, playlist or channel
+    id: str  # Video ID, playlist ID or channel path (e.g. '@name', 'channel/UC.../videos')
+    playlist_id: Optional[str] = None  # Playlist a video link was opened from
+
+    @property
+    def canonical_url(self) -> str:
+        """One URL per target, so equivalent links become the same job."""
+        if self.kind == PLAYLIST:
+            return f"https://www.youtube.com/playlist?list={self.id}"
+        if self.kind in (CHANNEL, LIVE) and not _VIDEO_ID_RE.fullmatch(self.id):
+            suffix = '/live' if self.kind == LIVE else ''
+            return f"https://www.youtube.com/{self.id}{suffix}"
+        url = f"https://www.youtube.com/watch?v={self.id}"
+        if self.playlist_id:
+            url += f"&list={self.playlist_id}"
+        return url
+
+    @property
+    def content_key(self) -> Optional[str]:
+        """
+        Dedup key of a single video, in the format of make_content_key() and
+        the download archive. None for links whose content changes over time
+        (playlists, channels, a channel's current live stream), or which may
+        expand to a playlist.
+        """
+        if self.kind in (PLAYLIST, CHANNEL) or self.playlist_id or not _VIDEO_ID_RE.fullmatch(self.id):
+            return None
+        return f"youtube {self.id}"
+
+
+def _parse_watch(query: str) -> Optional[ParsedURL]:
+    params = parse_qs(query)
+    video_id = (params.get('v') or [''])[0]
+    playlist_id = (params.get('list') or [''])[0]
+    playlist_id = playlist_id if _PLAYLIST_ID_RE.fullmatch(playlist_id) else None
+    if _VIDEO_ID_RE.fullmatch(video_id):
+        return ParsedURL(VIDEO, video_id, playlist_id)
+    if playlist_id:
+        return ParsedURL(PLAYLIST, playlist_id)
+    return None
+
+
+def parse_url(url: str) -> Optional[ParsedURL]:
+    """
+    Classify a YouTube link without any network access.
+
+    Args:
+        url: Link, with or without scheme
+
+    Returns:
+        ParsedURL, or None if the text is not a supported YouTube link
+    """
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+    except ValueError:
+        return None
+    if parts.scheme.lower() not in ('http', 'https') or not host:
+        return None
+
+    if host in _SHORT_HOSTS:
+        video_id = parts.path.strip('/')
+        if not _VIDEO_ID_RE.fullmatch(video_id):
+            return None
+        playlist_id = (parse_qs(parts.query).get('list') or [''])[0]
+        return ParsedURL(VIDEO, video_id, playlist_id if _PLAYLIST_ID_RE.fullmatch(playlist_id) else None)
+
+    if host not in _YOUTUBE_HOSTS:
+        return None
+
+    path = parts.path
+    if path in ('/watch', '/watch/', '/playlist', '/playlist/'):
+        return _parse_watch(parts.query)
+    for pattern, kind in _PATH_RULES:
+        match = pattern.fullmatch(path)
+        if match:
+            groups = match.groupdict()
+            return ParsedURL(kind, groups.get('id') or groups['channel'])
+    return None
@@ -1,12 +1,200 @@
+import copy
+import fcntl
 import os
 import logging
+import pickle
 import re
+import threading
+import time
 from typing import Dict, Any, Optional
 from config import Config
-import yt_dlp
+import ydl_pool
+from format_planner import candidate_plans, format_size
+from url_parser import parse_url
 
 logger = logging.getLogger(__name__)
 
+# Raw extraction results handed from get_video_info() to download_video().
+# url -> (extracted_at, info_dict); wall clock time, so workers in other processes can check it
+_info_cache: Dict[str, tuple] = {}
+_info_cache_lock = threading.Lock()
+
+
+def _cache_info(url: str, info: Dict[str, Any]) -> None:
+    """Store an extraction result for reuse by the download step."""
+    if Config.EXTRACTION_CACHE_TTL <= 0:
+        return
+    
+    now = time.time()
+    with _info_cache_lock:
+        # Drop expired entries so links that are never downloaded don't pile up
+        expired = [
+            key for key, (extracted_at, _) in _info_cache.items()
+            if now - extracted_at > Config.EXTRACTION_CACHE_TTL
+        ]
+        for key in expired:
+            del _info_cache[key]
+        _info_cache[url] = (now, info)
+
+
+def _fresh_info(url: str, cached: Optional[tuple]) -> Optional[Dict[str, Any]]:
+    """The info of an (extracted_at, info) cache entry, if it is still fresh."""
+    if cached is None:
+        return None
+    
+    extracted_at, info = cached
+    if time.time() - extracted_at > Config.EXTRACTION_CACHE_TTL:
+        # Signed format URLs may have expired, let yt-dlp re-resolve them
+        logger.debug(f"Cached info for {url} expired, extracting again")
+        return None
+    return info
+
+
+def _pop_cached_info(url: str) -> Optional[Dict[str, Any]]:
+    """Take a cached extraction result if it is still fresh."""
+    with _info_cache_lock:
+        cached = _info_cache.pop(url, None)
+    return _fresh_info(url, cached)
+
+
+def handoff_info(url: str) -> Optional[tuple]:
+    """
+    Take a cached extraction result along to a job that runs in a worker process.
+    
+    The cache lives in the bot process, where the probes run, so with
+    EXECUTOR_BACKEND=process download_video() would never find it. Pass the
+    returned entry as download_video(handoff=...) instead; it is pickled
+    with the job.
+    
+    Returns:
+        The (extracted_at, info) entry, or None with the thread backend (the
+        job takes the entry itself), if nothing is cached, or if the info
+        can't be pickled (the worker then extracts again)
+    """
+    if Config.EXECUTOR_BACKEND != 'process':
+        return None
+    
+    with _info_cache_lock:
+        cached = _info_cache.pop(url, None)
+    if cached is None:
+        return None
+    try:
+        pickle.dumps(cached[1])
+    except Exception as e:
+        logger.warning(f"Extracted info of {url} can't be sent to a worker process, it will be extracted again: {e}")
+        return None
+    return cached
+
+
+# Content keys listed in the download archive, reloaded when the file changes
+_archive_keys: set = set()
+_archive_mtime: Optional[float] = None
+_archive_lock = threading.Lock()
+
+
+def make_content_key(info: Dict[str, Any]) -> Optional[str]:
+    """
+    Build the dedup key of an extracted video: extractor + video ID.
+    
+    The format matches yt-dlp's download archive lines ("youtube <id>"),
+    so the key can be looked up there directly.
+    """
+    extractor = info.get('extractor_key') or info.get('ie_key')
+    video_id = info.get('id')
+    if not extractor or not video_id:
+        return None
+    return f"{extractor.lower()} {video_id}"
+
+
+def estimate_filesize(info: Dict[str, Any]) -> Optional[int]:
+    """
+    Estimate the download size of an extracted video, for disk space reservation.
+    
+    Without format selection at hand, this assumes the largest video format
+    plus the largest audio-only format (what 'best' quality downloads), so
+    the estimate errs on the large side. Returns None if no size is known.
+    """
+    top_level = format_size(info, None)
+    if top_level:
+        return top_level
+    
+    duration = info.get('duration')
+    video, audio = 0, 0
+    for fmt in info.get('formats') or []:
+        size = format_size(fmt, duration)
+        if not size:
+            continue
+        if fmt.get('vcodec') == 'none':
+            audio = max(audio, size)
+        else:
+            video = max(video, size)
+    total = video + audio
+    if total and Config.MAX_FILE_SIZE > 0:
+        total = min(total, Config.MAX_FILE_SIZE)
+    return total or None
+
+
+def is_downloaded(content_key: str) -> bool:
+    """Check whether yt-dlp's download archive already lists a video."""
+    global _archive_keys, _archive_mtime
+    
+    if not Config.DOWNLOAD_ARCHIVE or not content_key:
+        return False
+    
+    try:
+        mtime = os.path.getmtime(Config.DOWNLOAD_ARCHIVE)
+    except OSError:
+        return False
+    
+    with _archive_lock:
+        if mtime != _archive_mtime:
+            try:
+                with open(Config.DOWNLOAD_ARCHIVE, 'r', encoding='utf-8') as f:
+                    _archive_keys = {line.strip() for line in f if line.strip()}
+                _archive_mtime = mtime
+            except OSError as e:
+                logger.error(f"Error reading download archive: {e}")
+                return False
+        return content_key in _archive_keys
+
+
+def forget_downloaded(content_keys: list) -> int:
+    """
+    Take videos out of yt-dlp's download archive, so they are downloaded again when asked for.
+    
+    The archive is rewritten in place under the same exclusive lock yt-dlp
+    takes to append to it, so concurrent downloads (in any process) wait
+    instead of losing their line.
+    
+    Returns:
+        int: Number of archive lines removed
+    """
+    global _archive_mtime
+    
+    keys = set(key for key in content_keys if key)
+    if not Config.DOWNLOAD_ARCHIVE or not keys or not os.path.exists(Config.DOWNLOAD_ARCHIVE):
+        return 0
+    
+    with open(Config.DOWNLOAD_ARCHIVE, 'r+', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            lines = f.readlines()
+            kept = [line for line in lines if line.strip() not in keys]
+            if len(kept) != len(lines):
+                f.seek(0)
+                f.writelines(kept)
+                f.truncate()
+                f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    with _archive_lock:
+        _archive_mtime = None  # Reload on the next is_downloaded()
+    removed = len(lines) - len(kept)
+    if removed:
+        logger.info(f"Removed {removed} evicted videos from the download archive")
+    return removed
+
+
 def get_yt_dlp_options(progress_hook=None) -> Dict[str, Any]:
     """Generate yt-dlp options based on configuration"""
     
@@ -20,10 +208,20 @@ def get_yt_dlp_options(progress_hook=None) -> Dict[str, Any]:
         },
         'noplaylist': not Config.YT_DLP_PLAYLIST,
         'progress_hooks': [progress_hook] if progress_hook else [],
+        # Same hook for merging/conversion, so cancellation also stops post-processing
+        'postprocessor_hooks': [progress_hook] if progress_hook else [],
         'max_filesize': Config.MAX_FILE_SIZE if Config.MAX_FILE_SIZE > 0 else None,
         'concurrent_fragment_downloads': Config.CONCURRENT_FRAGMENT_DOWNLOADS,
+        # Resume from .part files left in the temp dir by an interrupted run
+        'continuedl': True,
+        'nopart': False,
+        'cachedir': Config.YT_DLP_CACHE_DIR,
     }
     
+    # Record finished videos so repeated links can be answered from the archive
+    if Config.DOWNLOAD_ARCHIVE:
+        ydl_opts['download_archive'] = Config.DOWNLOAD_ARCHIVE
+    
     # Audio-only option
     if Config.YT_DLP_AUDIO_ONLY:
         ydl_opts['format'] = 'bestaudio/best'
@@ -40,7 +238,20 @@ def get_yt_dlp_options(progress_hook=None) -> Dict[str, Any]:
 
 def is_valid_youtube_url(url: str) -> bool:
     """Check if URL is a valid YouTube URL"""
-    return "youtube.com" in url or "youtu.be" in url
+    return parse_url(url) is not None
+
+# Links with a scheme, and bare YouTube links as people paste them
+_URL_RE = re.compile(r'https?://\S+|(?<![\w./])(?:(?:www|m|music)\.)?(?:youtube\.com|youtu\.be)/\S+', re.IGNORECASE)
+
+def extract_urls(text: str) -> list:
+    """Find all YouTube links in a text, in order and canonicalized without duplicates."""
+    urls = []
+    for match in _URL_RE.finditer(text or ''):
+        # Punctuation around links in prose isn't part of them
+        parsed = parse_url(match.group(0).rstrip('.,;:!?)]}>\'"'))
+        if parsed and parsed.canonical_url not in urls:
+            urls.append(parsed.canonical_url)
+    return urls
 
 def get_file_size(file_path: str) -> int:
     """Get file size in bytes"""
@@ -73,6 +284,63 @@ def sanitize_filename(filename: str, is_playlist=False) -> str:
     
     return sanitized
 
+def _playlist_entries(info: Dict[str, Any]) -> list:
+    """
+    Build downloadable entries from a flat playlist extraction.
+    
+    Each entry carries the playlist fields yt-dlp would have added itself,
+    so entries downloaded on their own still land in the playlist folder.
+    """
+    entries = [entry for entry in info.get('entries', []) if entry]
+    playlist_title = info.get('title') or info.get('id')
+    
+    result = []
+    for index, entry in enumerate(entries, start=1):
+        entry_url = entry.get('url') or entry.get('webpage_url')
+        if not entry_url:
+            continue
+        result.append({
+            'url': entry_url,
+            'title': entry.get('title', 'Unknown Video'),
+            'content_key': make_content_key(entry),
+            'filesize': estimate_filesize(entry),
+            'extra_info': {
+                'playlist': playlist_title,
+                'playlist_id': info.get('id'),
+                'playlist_title': playlist_title,
+                'playlist_uploader': info.get('uploader'),
+                'playlist_index': index,
+                'playlist_count': len(entries),
+                'n_entries': len(entries),
+            },
+        })
+    return result
+
+def _configured_height(ydl, info: Dict[str, Any]) -> Optional[int]:
+    """
+    Height of the format the configured selector picks for a video.
+    
+    The format planner never goes above it, so YT_DLP_FORMAT/YT_DLP_QUALITY
+    stay the upper limit and the planner only steps down from there.
+    
+    Args:
+        ydl: Instance whose 'format' is the configured selector
+        info: Raw extraction result of a single video (process=False)
+    
+    Returns:
+        The height (0 for an audio-only pick), or None if the configured
+        format can't be selected from the extracted formats
+    """
+    if info.get('_type', 'video') != 'video':
+        return None
+    try:
+        # Format selection only, on a copy: the raw result is reused for the download
+        selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+    except Exception as e:
+        logger.warning(f"Could not select the configured format for {info.get('id')}: {e}")
+        return None
+    return selected.get('height') or 0
+
 def get_video_info(url: str) -> Optional[Dict[str, Any]]:
     """
     Get video or playlist information without downloading.
@@ -88,25 +356,48 @@ def get_video_info(url: str) -> Optional[Dict[str, Any]]:
             'quiet': True,
             'no_warnings': True,
             'extract_flat': True,  # Don't download, just get metadata
+            'noplaylist': not Config.YT_DLP_PLAYLIST,  # Resolve the link the same way the download will
+            'cachedir': Config.YT_DLP_CACHE_DIR,
         }
+        # Don't let a stalled connection keep a probe thread past its deadline
+        if Config.PROBE_TIMEOUT > 0:
+            ydl_opts['socket_timeout'] = Config.PROBE_TIMEOUT
+        # The configured format is the planner's ceiling, see _configured_height()
+        if Config.FORMAT_PLANNER:
+            ydl_opts['format'] = get_yt_dlp_options()['format']
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        with ydl_pool.acquire(ydl_opts) as ydl:
+            # Keep the raw extractor result (process=False) so download_video()
+            # can run format selection on it without extracting the URL again
+            info = ydl.extract_info(url, download=False, process=False)
             
             if info:
                 # Check if it's a playlist
                 is_playlist = 'entries' in info
                 
+                if is_playlist:
+                    # Playlist entries may be a lazy generator, materialize them
+                    # once so they can be counted and reused for the download
+                    info['entries'] = list(info.get('entries') or [])
+                
+                _cache_info(url, info)
+                
                 if is_playlist:
                     return {
                         'type': 'playlist',
                         'title': info.get('title', 'Unknown Playlist'),
                         'video_count': len(info.get('entries', [])),
                         'uploader': info.get('uploader', 'Unknown'),
+                        'entries': _playlist_entries(info),
                     }
                 else:
                     return {
                         'type': 'video',
+                        'content_key': make_content_key(info),
+                        'filesize': estimate_filesize(info),
+                        'format_plans': (
+                            candidate_plans(info, _configured_height(ydl, info)) if Config.FORMAT_PLANNER else []
+                        ),
                         'title': info.get('title', 'Unknown Video'),
                         'duration': info.get('duration', 0),
                         'uploader': info.get('uploader', 'Unknown'),
@@ -116,17 +407,50 @@ def get_video_info(url: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def download_video(url: str, progress_hook=None) -> None:
+def _downloaded_files(info: Optional[Dict[str, Any]]) -> list:
+    """Final paths of the files a processed extraction result downloaded (playlists included)."""
+    if not info:
+        return []
+    if 'entries' in info:
+        return [path for entry in info.get('entries') or [] for path in _downloaded_files(entry)]
+    return [
+        download['filepath'] for download in info.get('requested_downloads') or []
+        if download.get('filepath')
+    ]
+
+
+def download_video(
+    url: str,
+    progress_hook=None,
+    extra_info: Optional[Dict[str, Any]] = None,
+    format_spec: Optional[str] = None,
+    handoff: Optional[tuple] = None
+) -> list:
     """
     Download video or playlist from the given URL.
     Uses yt-dlp's native playlist handling via output template.
+    If get_video_info() extracted the URL recently, its result is reused
+    instead of extracting the page again (from this process's cache, or
+    from handoff when the job runs in a worker process).
     
     Args:
         url: YouTube URL to download
         progress_hook: Optional callback function for progress updates
+        extra_info: Optional fields merged into the extracted info (e.g. playlist
+            fields for a single playlist entry, see get_video_info())
+        format_spec: Optional yt-dlp format selector tried before the configured one
+            (from the format planner, which stays within the configured format);
+            the configured one is used if it is not available
+        handoff: Extraction result taken along from the bot process (see
+            handoff_info()), used instead of this process's cache
+    
+    Returns:
+        Paths of the downloaded files (empty if all were already in the archive)
     """
     try:
-        download_opts = get_yt_dlp_options(progress_hook=progress_hook)
+        download_opts = get_yt_dlp_options()
+        if format_spec:
+            download_opts['format'] = f"{format_spec}/{download_opts['format']}"
         
         # Override output template to handle playlists automatically
         if Config.PLAYLIST_FOLDER:
@@ -139,9 +463,16 @@ def download_video(url: str, progress_hook=None) -> None:
             download_opts['outtmpl'] = template
             logger.info(f"Using playlist-aware template: {template}")
         
-        # Perform the download
-        with yt_dlp.YoutubeDL(download_opts) as ydl:
-            ydl.download([url])
+        cached_info = _fresh_info(url, handoff) if handoff else _pop_cached_info(url)
+        
+        # Perform the download on a pooled instance, warm from earlier jobs
+        with ydl_pool.acquire(download_opts, progress_hook) as ydl:
+            if cached_info is not None:
+                logger.info(f"Reusing extracted info for {url}")
+                info = ydl.process_ie_result(cached_info, download=True, extra_info=extra_info or {})
+            else:
+                info = ydl.extract_info(url, download=True, extra_info=extra_info or {})
+        return _downloaded_files(info)
             
     except Exception as e:
         logger.error(f"Error downloading URL {url}: {e}")
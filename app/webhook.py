@@ -0,0 +1,44 @@
+import hmac
+import json
+import logging
+from typing import Dict, Tuple
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+class WebhookHandler:
+    """
+    Feeds updates POSTed by Telegram into an application's update queue.
+
+    Served as a route of the metrics HTTP server (see metrics.add_route()),
+    so webhook mode needs no web framework and no extra port. Requests
+    without the secret token given to setWebhook are rejected.
+    """
+
+    def __init__(self, application, secret_token: str):
+        """
+        Args:
+            application: The telegram.ext.Application processing the updates
+            secret_token: Value Telegram sends in the X-Telegram-Bot-Api-Secret-Token header
+        """
+        self.application = application
+        self.secret_token = secret_token
+
+    async def __call__(self, headers: Dict[str, str], body: bytes) -> Tuple[str, str, str]:
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, '').encode(), self.secret_token.encode()):
+            logger.warning("Rejected webhook request with a wrong secret token")
+            return '403 Forbidden', 'text/plain; charset=utf-8', 'forbidden\n'
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return '400 Bad Request', 'text/plain; charset=utf-8', 'bad request\n'
+
+        # Answer right away; the application processes the update on its own
+        await self.application.update_queue.put(update)
+        return '200 OK', 'text/plain; charset=utf-8', 'ok\n'
@@ -0,0 +1,227 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import yt_dlp
+from yt_dlp.postprocessor import FFmpegPostProcessor
+
+from config import Config
+from executors import POSTPROCESS_STAGE
+
+logger = logging.getLogger(__name__)
+
+# Options set on a pooled instance for each job instead of keying the pool by them
+_PER_JOB_PARAMS = ('format', 'concurrent_fragment_downloads')
+
+
+def warm_ffmpeg() -> None:
+    """
+    Detect ffmpeg's and ffprobe's versions and features now.
+
+    yt-dlp runs both binaries once per process to find out, on the first
+    merge or conversion. Doing it ahead also pulls them into the page cache.
+    """
+    versions, _ = FFmpegPostProcessor.get_versions_and_features()
+    if versions:
+        logger.info(f"ffmpeg ready: {versions}")
+    else:
+        logger.warning("ffmpeg not found; formats can't be merged or converted")
+
+
+def _has_ffmpeg_work(ydl: yt_dlp.YoutubeDL, info: Dict[str, Any]) -> bool:
+    """Whether a file's post-processing runs ffmpeg (merging, fixups, conversion), not just a move."""
+    # YoutubeDL._pps is private; if a yt-dlp version lacks it, assume there is work
+    pps = getattr(ydl, '_pps', None)
+    configured = pps.get('post_process') if isinstance(pps, dict) else True
+    return bool(info.get('__postprocessors') or configured)
+
+
+def _more_downloads_follow(ydl: yt_dlp.YoutubeDL, info: Dict[str, Any]) -> bool:
+    """Whether the run downloads more files after this one's post-processing."""
+    # Entries of a playlist yt-dlp downloads itself carry their number and the entry count
+    # (fanned-out entries don't have playlist_autonumber: they are single downloads)
+    number, count = info.get('playlist_autonumber'), info.get('n_entries')
+    if number is not None and (count is None or number < count):
+        return True
+    # Comma-separated formats and download sections give one file each
+    format_spec = ydl.params.get('format')
+    return (isinstance(format_spec, str) and ',' in format_spec) or bool(ydl.params.get('download_ranges'))
+
+
+def _gate_post_processing(ydl: yt_dlp.YoutubeDL, hook: Callable) -> None:
+    """
+    Report ffmpeg post-processing as its own stage (see executors.PostProcessSlots).
+
+    Around each file's post-processing with ffmpeg work (merging formats,
+    fixups, conversion), hook gets a POSTPROCESS_STAGE event with status
+    'started' before, which may block until a post-processing slot is free,
+    and 'finished' after. Files that are only moved into place skip it.
+    The 'started' event's release_slot is only true for the run's last
+    download, so a playlist run keeps its download slot until the end.
+    """
+    post_process = ydl.post_process
+
+    def gated_post_process(filename, info, files_to_move=None):
+        if not _has_ffmpeg_work(ydl, info):
+            return post_process(filename, info, files_to_move)
+        hook({
+            'status': 'started', 'postprocessor': POSTPROCESS_STAGE,
+            'release_slot': not _more_downloads_follow(ydl, info),
+        })
+        try:
+            return post_process(filename, info, files_to_move)
+        finally:
+            hook({'status': 'finished', 'postprocessor': POSTPROCESS_STAGE})
+
+    ydl.post_process = gated_post_process
+
+
+class _PooledInstance:
+    """A YoutubeDL instance plus the hook of the job currently using it."""
+
+    def __init__(self, params: Dict[str, Any]):
+        self.hook: Optional[Callable] = None
+        self.uses = 0
+        self.archive_mtime: Optional[float] = None
+        # The instance keeps these trampolines for life; each job swaps self.hook
+        params = dict(params, progress_hooks=[self._forward], postprocessor_hooks=[self._forward])
+        self.ydl = yt_dlp.YoutubeDL(params)
+        _gate_post_processing(self.ydl, self._forward)
+        self.archive_mtime = self._archive_file_mtime()
+
+    def _forward(self, d: Dict[str, Any]) -> None:
+        if self.hook is not None:
+            self.hook(d)
+
+    def _archive_file_mtime(self) -> Optional[float]:
+        archive = self.ydl.params.get('download_archive')
+        if not isinstance(archive, str):
+            return None
+        try:
+            return os.path.getmtime(archive)
+        except OSError:
+            return None
+
+    def prepare(self, hook: Optional[Callable], params: Dict[str, Any]) -> None:
+        """Reset per-job state before handing the instance to a job, and apply the job's _PER_JOB_PARAMS."""
+        self.hook = hook
+        self.uses += 1
+        # Private counter behind autonumber and max_downloads; left alone if a yt-dlp version lacks it
+        if hasattr(self.ydl, '_num_downloads'):
+            self.ydl._num_downloads = 0
+        # Read by the fragment downloader each download; tuned at runtime (see concurrency.py)
+        self.ydl.params['concurrent_fragment_downloads'] = params.get('concurrent_fragment_downloads')
+        # The format is chosen per job (see format_planner); rebuild the selector when it changes
+        format_spec = params.get('format')
+        if format_spec != self.ydl.params.get('format'):
+            self.ydl.params['format'] = format_spec
+            self.ydl.format_selector = self.ydl.build_format_selector(format_spec) if format_spec else None
+        # Other instances (and worker processes) append to the archive too
+        mtime = self._archive_file_mtime()
+        if mtime is not None and mtime != self.archive_mtime:
+            with open(self.ydl.params['download_archive'], 'r', encoding='utf-8') as f:
+                self.ydl.archive = {line.strip() for line in f if line.strip()}
+            self.archive_mtime = mtime
+
+
+class YDLPool:
+    """
+    Long-lived YoutubeDL instances, keyed by their options.
+
+    Building a YoutubeDL sets up extractors, the cookie jar and an HTTP
+    session, and YouTube's extractor caches player code and signature
+    functions per instance. Reusing instances keeps all of that, including
+    keep-alive connections, warm across jobs.
+
+    An instance is used by one job at a time. Progress and post-processor
+    hooks are per job, so instances get a forwarding hook at creation and
+    each job plugs its own hook in. The format and fragment concurrency
+    are per job too, so jobs downloading different formats (or started
+    under different concurrency limits) share instances. Instances are closed
+    after max_uses jobs or a failed job, and at most max_idle of them are
+    kept per option set.
+    """
+
+    def __init__(self, max_idle: int = 4, max_uses: int = 50):
+        """
+        Args:
+            max_idle: Idle instances kept per option set (0 = no pooling)
+            max_uses: Close an instance after this many jobs (0 = never)
+        """
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self._idle: Dict[str, List[_PooledInstance]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(params: Dict[str, Any]) -> str:
+        options = {
+            name: value for name, value in params.items()
+            if name not in ('progress_hooks', 'postprocessor_hooks') + _PER_JOB_PARAMS
+        }
+        return json.dumps(options, sort_keys=True, default=repr)
+
+    @contextlib.contextmanager
+    def acquire(self, params: Dict[str, Any], progress_hook: Optional[Callable] = None) -> Iterator[yt_dlp.YoutubeDL]:
+        """
+        Borrow a YoutubeDL built with the given options.
+
+        Args:
+            params: YoutubeDL options; progress_hooks and postprocessor_hooks are ignored,
+                _PER_JOB_PARAMS apply to this job only
+            progress_hook: Hook receiving this job's progress and post-processor events
+        """
+        if self.max_idle <= 0:
+            hooks = [progress_hook] if progress_hook else []
+            with yt_dlp.YoutubeDL(dict(params, progress_hooks=hooks, postprocessor_hooks=hooks)) as ydl:
+                if progress_hook:
+                    _gate_post_processing(ydl, progress_hook)
+                yield ydl
+            return
+
+        key = self._key(params)
+        with self._lock:
+            idle = self._idle.get(key)
+            instance = idle.pop() if idle else None
+        if instance is None:
+            instance = _PooledInstance(params)
+
+        instance.prepare(progress_hook, params)
+        try:
+            yield instance.ydl
+        except BaseException:
+            # An aborted job may leave the instance mid-download, don't reuse it
+            instance.ydl.close()
+            raise
+        finally:
+            instance.hook = None
+        self._release(key, instance)
+
+    def _release(self, key: str, instance: _PooledInstance) -> None:
+        if not self.max_uses or instance.uses < self.max_uses:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append(instance)
+                    return
+        instance.ydl.close()
+
+    def close(self) -> None:
+        """Close all idle instances."""
+        with self._lock:
+            instances = [instance for idle in self._idle.values() for instance in idle]
+            self._idle.clear()
+        for instance in instances:
+            instance.ydl.close()
+
+
+# Pool of this process (process backend workers get their own)
+_pool = YDLPool(Config.YDL_POOL_SIZE, Config.YDL_POOL_MAX_USES)
+
+
+def acquire(params: Dict[str, Any], progress_hook: Optional[Callable] = None):
+    """Borrow a YoutubeDL from the process-wide pool, see YDLPool.acquire()."""
+    return _pool.acquire(params, progress_hook)
@@ -0,0 +1,263 @@
+"""
+Fake YouTube-like origin and stub Telegram Bot API for offline benchmarks.
+
+One asyncio HTTP server answers both:
+
+  /progressive/<name>.mp4          progressive file (Range supported)
+  /hls/<name>.m3u8                 HLS media playlist, /hls/<name>/seg<N>.ts segments
+  /dash/<name>.mpd                 DASH manifest, /dash/<name>/init.mp4 and seg<N>.m4s
+  /bot<token>/<method>             Bot API methods (getMe, sendMessage, editMessageText,
+                                   deleteMessage, getFile, ...)
+  /file/bot<token>/videos/<id>     Telegram file downloads
+
+Media sizes come from the server options, and every response body is
+throttled to the configured per-connection bandwidth after the configured
+latency. Run standalone (python bench/fake_servers.py --port 8090) or let
+bench/run.py start it.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+WRITE_CHUNK = 64 * 1024
+
+
+class FakeServers:
+    """HTTP server for the fake origin and the stub Bot API."""
+
+    def __init__(
+        self,
+        file_size: int = 8 * 1024 * 1024,
+        segment_size: int = 512 * 1024,
+        segments: int = 16,
+        bandwidth: int = 0,
+        latency: float = 0.0,
+        flood_rate: float = 0.0
+    ):
+        """
+        Args:
+            file_size: Size of progressive files and Telegram files (bytes)
+            segment_size: Size of each HLS/DASH segment (bytes)
+            segments: Number of segments per HLS/DASH stream
+            bandwidth: Per-connection bandwidth in bytes/s (0 = unlimited)
+            latency: Delay before every response (seconds)
+            flood_rate: Fraction of editMessageText calls answered with 429
+        """
+        self.file_size = file_size
+        self.segment_size = segment_size
+        self.segments = segments
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self._message_ids = itertools.count(1)
+        self.requests = 0
+        self.bot_api_calls = {}
+
+    # Media
+
+    def _hls_playlist(self, name: str) -> bytes:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:2", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for index in range(self.segments):
+            lines += ["#EXTINF:2.0,", f"{name}/seg{index}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return ("\n".join(lines) + "\n").encode()
+
+    def _dash_manifest(self, name: str) -> bytes:
+        segment_urls = "".join(f'<SegmentURL media="{name}/seg{index}.m4s"/>' for index in range(self.segments))
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" '
+            f'mediaPresentationDuration="PT{self.segments * 2}S" minBufferTime="PT2S" '
+            'profiles="urn:mpeg:dash:profile:isoff-main:2011">'
+            '<Period><AdaptationSet mimeType="video/mp4" contentType="video">'
+            '<Representation id="video" bandwidth="2000000" codecs="avc1.4d401f" width="1280" height="720">'
+            f'<SegmentList timescale="1" duration="2"><Initialization sourceURL="{name}/init.mp4"/>'
+            f'{segment_urls}</SegmentList>'
+            '</Representation></AdaptationSet></Period></MPD>'
+        ).encode()
+
+    # Bot API
+
+    def _bot_api(self, method: str, params: dict):
+        """Return (status, JSON body) for a Bot API call."""
+        self.bot_api_calls[method] = self.bot_api_calls.get(method, 0) + 1
+        chat = {"id": int(params.get("chat_id", 1)), "type": "private"}
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            if method == "editMessageText" and random.random() < self.flood_rate:
+                return 429, {
+                    "ok": False, "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1}
+                }
+            message_id = int(params["message_id"]) if method == "editMessageText" else next(self._message_ids)
+            result = {"message_id": message_id, "date": int(time.time()), "chat": chat, "text": params.get("text", "")}
+        elif method == "getFile":
+            file_id = params["file_id"]
+            result = {
+                "file_id": file_id,
+                "file_unique_id": f"unique-{file_id}",
+                "file_size": self.file_size,
+                "file_path": f"videos/{file_id}.mp4",
+            }
+        else:
+            result = True
+        return 200, {"ok": True, "result": result}
+
+    # HTTP plumbing
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        body = b''
+        if 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        return method, target, headers, body
+
+    @staticmethod
+    def _form(headers: dict, body: bytes) -> dict:
+        """Decode Bot API parameters (JSON, urlencoded or multipart)."""
+        content_type = headers.get('content-type', '')
+        if 'json' in content_type:
+            return json.loads(body or b'{}')
+        if 'multipart/form-data' in content_type:
+            boundary = content_type.split('boundary=', 1)[1].strip('"').encode()
+            params = {}
+            for part in body.split(b'--' + boundary):
+                head, _, value = part.partition(b'\r\n\r\n')
+                match = re.search(rb'name="([^"]+)"', head)
+                if match and b'filename=' not in head:
+                    params[match.group(1).decode()] = value.rstrip(b'\r\n').decode('utf-8', 'replace')
+            return params
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+    async def _send(self, writer, status: int, content_type: str, body_size: int, body: bytes = None,
+                    headers: dict = None, send_body: bool = True) -> None:
+        reason = {200: 'OK', 206: 'Partial Content', 404: 'Not Found', 429: 'Too Many Requests'}.get(status, 'OK')
+        head = [f"HTTP/1.1 {status} {reason}", f"Content-Type: {content_type}",
+                f"Content-Length: {body_size}", "Accept-Ranges: bytes", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1'))
+        if not send_body:
+            await writer.drain()
+            return
+
+        if body is not None:
+            writer.write(body)
+            await writer.drain()
+            return
+
+        # Synthetic media, throttled to the configured bandwidth
+        chunk = b'\0' * WRITE_CHUNK
+        remaining = body_size
+        while remaining > 0:
+            size = min(WRITE_CHUNK, remaining)
+            writer.write(chunk[:size])
+            await writer.drain()
+            remaining -= size
+            if self.bandwidth:
+                await asyncio.sleep(size / self.bandwidth)
+
+    async def _send_media(self, writer, size: int, content_type: str, headers: dict, send_body: bool) -> None:
+        """Send a synthetic file of the given size, honoring a Range header."""
+        match = re.match(r'bytes=(\d*)-(\d*)', headers.get('range', ''))
+        if match and (match.group(1) or match.group(2)):
+            start = int(match.group(1) or 0)
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            await self._send(writer, 206, content_type, end - start + 1,
+                             headers={"Content-Range": f"bytes {start}-{end}/{size}"}, send_body=send_body)
+        else:
+            await self._send(writer, 200, content_type, size, send_body=send_body)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, target, headers, body = request
+            self.requests += 1
+            path = unquote(urlsplit(target).path)
+            send_body = method != 'HEAD'
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+            bot_match = re.match(r'^/bot[^/]+/(\w+)$', path)
+            if bot_match:
+                params = self._form(headers, body)
+                params.update({key: values[0] for key, values in parse_qs(urlsplit(target).query).items()})
+                status, payload = self._bot_api(bot_match.group(1), params)
+                data = json.dumps(payload).encode()
+                await self._send(writer, status, 'application/json', len(data), data)
+            elif re.match(r'^/progressive/[^/]+\.mp4$', path) or re.match(r'^/file/bot[^/]+/videos/', path):
+                await self._send_media(writer, self.file_size, 'video/mp4', headers, send_body)
+            elif re.match(r'^/hls/[^/]+\.m3u8$', path):
+                data = self._hls_playlist(path.rsplit('/', 1)[1][:-len('.m3u8')])
+                await self._send(writer, 200, 'application/vnd.apple.mpegurl', len(data), data, send_body=send_body)
+            elif re.match(r'^/hls/[^/]+/seg\d+\.ts$', path):
+                await self._send_media(writer, self.segment_size, 'video/mp2t', headers, send_body)
+            elif re.match(r'^/dash/[^/]+\.mpd$', path):
+                data = self._dash_manifest(path.rsplit('/', 1)[1][:-len('.mpd')])
+                await self._send(writer, 200, 'application/dash+xml', len(data), data, send_body=send_body)
+            elif re.match(r'^/dash/[^/]+/(init\.mp4|seg\d+\.m4s)$', path):
+                await self._send_media(writer, self.segment_size, 'video/mp4', headers, send_body)
+            else:
+                data = b'not found'
+                await self._send(writer, 404, 'text/plain', len(data), data)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(port: int, **options) -> None:
+    servers = FakeServers(**options)
+    server = await asyncio.start_server(servers.handle, '127.0.0.1', port, backlog=1024)
+    print(f"Fake origin and Bot API listening on http://127.0.0.1:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--file-size', type=int, default=8 * 1024 * 1024, help="progressive/Telegram file size (bytes)")
+    parser.add_argument('--segment-size', type=int, default=512 * 1024, help="HLS/DASH segment size (bytes)")
+    parser.add_argument('--segments', type=int, default=16, help="segments per HLS/DASH stream")
+    parser.add_argument('--bandwidth', type=int, default=0, help="per-connection bytes/s (0 = unlimited)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before every response")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="fraction of edits answered with 429")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(
+            args.port,
+            file_size=args.file_size,
+            segment_size=args.segment_size,
+            segments=args.segments,
+            bandwidth=args.bandwidth,
+            latency=args.latency,
+            flood_rate=args.flood_rate
+        ))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
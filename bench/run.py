@@ -0,0 +1,303 @@
+"""
+Offline benchmark of the download pipeline.
+
+Starts bench/fake_servers.py and drives the real bot handlers
+(download_youtube_and_notify / download_telegram_and_notify), DownloadManager
+and utils.download_video against it: yt-dlp fetches progressive, HLS or DASH
+media from the fake origin, Telegram files come from the stub Bot API, and all
+progress messages go to the stub as well. Reports jobs/min, queue latency,
+event-loop lag and memory per job.
+
+Example:
+    python bench/run.py --jobs 30 --kind mixed --concurrency 3 --users 4 --bandwidth 4000000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "app")
+KINDS = ('progressive', 'hls', 'dash', 'telegram')
+
+
+def percentile(values, fraction: float) -> float:
+    """Nearest-rank percentile, 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=20, help="number of downloads")
+    parser.add_argument('--kind', choices=KINDS + ('mixed',), default='progressive', help="media of the jobs")
+    parser.add_argument('--users', type=int, default=1, help="jobs are spread round-robin over this many users")
+    parser.add_argument('--concurrency', type=int, default=3, help="MAX_CONCURRENT_DOWNLOADS")
+    parser.add_argument('--per-user', type=int, default=0, help="MAX_DOWNLOADS_PER_USER (0 = no limit)")
+    parser.add_argument('--fragments', type=int, default=4, help="CONCURRENT_FRAGMENT_DOWNLOADS")
+    parser.add_argument('--auto-tune', action='store_true', help="AUTO_TUNE_CONCURRENCY, --concurrency is the start value")
+    parser.add_argument('--auto-tune-interval', type=float, default=2, help="AUTO_TUNE_INTERVAL")
+    parser.add_argument('--backend', choices=('thread', 'process'), default='thread', help="EXECUTOR_BACKEND")
+    parser.add_argument('--progress-interval', type=int, default=1, help="PROGRESS_UPDATE_INTERVAL")
+    parser.add_argument('--file-size', type=int, default=8 * 1024 * 1024, help="progressive/Telegram file size")
+    parser.add_argument('--segment-size', type=int, default=512 * 1024, help="HLS/DASH segment size")
+    parser.add_argument('--segments', type=int, default=16, help="segments per HLS/DASH stream")
+    parser.add_argument('--bandwidth', type=int, default=0, help="per-connection bytes/s (0 = unlimited)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before every origin/API response")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="fraction of edits answered with 429")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--verbose', action='store_true', help="show yt-dlp's console output")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    parser.add_argument('--output', help="also append the report to this file")
+    return parser.parse_args()
+
+
+def configure_environment(args, work_dir: str) -> None:
+    """Point the bot's configuration at a scratch directory before app modules are imported."""
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "DOWNLOAD_DIR": os.path.join(work_dir, "downloads"),
+        "TEMP_DOWNLOAD_DIR": os.path.join(work_dir, "downloads", "tmp"),
+        "DOWNLOAD_ARCHIVE": os.path.join(work_dir, "downloads", ".download_archive"),
+        "LOG_DIR": os.path.join(work_dir, "logs"),
+        "LOG_LEVEL": "WARNING",
+        "ALLOWED_USERS_FILE": os.path.join(work_dir, "allowed_users.json"),
+        "JOB_JOURNAL": "false",
+        "METRICS_ENABLED": "false",
+        "MAX_CONCURRENT_DOWNLOADS": str(args.concurrency),
+        "MAX_DOWNLOADS_PER_USER": str(args.per_user),
+        "CONCURRENT_FRAGMENT_DOWNLOADS": str(args.fragments),
+        "EXECUTOR_BACKEND": args.backend,
+        "AUTO_TUNE_CONCURRENCY": str(args.auto_tune).lower(),
+        "AUTO_TUNE_INTERVAL": str(args.auto_tune_interval),
+        "PROGRESS_UPDATE_INTERVAL": str(args.progress_interval),
+        "TELEGRAM_VIDEO_MAX_SIZE": str(max(args.file_size, 1)),
+    })
+    for name in ("DOWNLOAD_DIR", "TEMP_DOWNLOAD_DIR", "LOG_DIR"):
+        os.makedirs(os.environ[name], exist_ok=True)
+
+
+def start_fake_servers(args) -> subprocess.Popen:
+    """Run the fake origin and Bot API in their own process, so they don't share our event loop."""
+    process = subprocess.Popen(
+        [
+            sys.executable, os.path.join(BENCH_DIR, "fake_servers.py"),
+            "--port", str(args.port),
+            "--file-size", str(args.file_size),
+            "--segment-size", str(args.segment_size),
+            "--segments", str(args.segments),
+            "--bandwidth", str(args.bandwidth),
+            "--latency", str(args.latency),
+            "--flood-rate", str(args.flood_rate),
+        ],
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    process.stdout.readline()  # Wait until it listens
+    return process
+
+
+@contextlib.contextmanager
+def silence_output():
+    """
+    Send stdout/stderr to /dev/null, including that of worker processes.
+
+    yt-dlp prints progress and warnings to the console.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved + [devnull]:
+            os.close(fd)
+
+
+async def monitor_loop_lag(samples: list, interval: float = 0.01) -> None:
+    """Measure how late the event loop wakes up from short sleeps."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+async def run_benchmark(args) -> dict:
+    sys.path.insert(0, APP_DIR)
+    from telegram import Bot, Video
+
+    import bot as bot_module
+    import metrics
+    from concurrency import ConcurrencyController
+    from config import Config
+    from download_manager import get_download_manager
+    from progress_dispatcher import ProgressDispatcher
+
+    origin = f"http://127.0.0.1:{args.port}"
+    bot = Bot(
+        Config.BOT_TOKEN,
+        base_url=f"{origin}/bot",
+        base_file_url=f"{origin}/file/bot",
+        request=metrics.InstrumentedRequest(connection_pool_size=256)
+    )
+
+    download_manager = get_download_manager(
+        max_concurrent=Config.MAX_CONCURRENT_DOWNLOADS,
+        max_per_user=Config.MAX_DOWNLOADS_PER_USER,
+        backend=Config.EXECUTOR_BACKEND,
+        max_jobs_per_worker=Config.MAX_JOBS_PER_WORKER,
+        temp_dir=Config.TEMP_DOWNLOAD_DIR,
+        max_concurrent_limit=Config.AUTO_TUNE_MAX_DOWNLOADS if Config.AUTO_TUNE_CONCURRENCY else None
+    )
+    bot_module.download_manager = download_manager
+
+    # Queue latency: time from enqueue to admission of every task
+    queue_latencies = []
+    enqueue = download_manager.scheduler.enqueue
+
+    def timed_enqueue(task_id, user_id, priority):
+        admission = enqueue(task_id, user_id, priority)
+        enqueued = time.perf_counter()
+        admission.add_done_callback(
+            lambda future: queue_latencies.append(time.perf_counter() - enqueued) if not future.exception() else None
+        )
+        return admission
+
+    download_manager.scheduler.enqueue = timed_enqueue
+
+    def make_job(index: int):
+        kind = args.kind if args.kind != 'mixed' else KINDS[index % len(KINDS)]
+        user_id = 1000 + index % args.users
+        name = f"job{index}"
+        if kind == 'telegram':
+            video = Video(f"bench{index}", f"bench-unique-{index}", 1280, 720, 10, file_size=args.file_size)
+            video.set_bot(bot)
+            return bot_module.download_telegram_and_notify(bot, user_id, user_id, video)
+        url = {
+            'progressive': f"{origin}/progressive/{name}.mp4",
+            'hls': f"{origin}/hls/{name}.m3u8",
+            'dash': f"{origin}/dash/{name}.mpd",
+        }[kind]
+        return bot_module.download_youtube_and_notify(bot, user_id, user_id, url, f"🎥 {name}")
+
+    lag_samples = []
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    async with bot:
+        bot_module.progress_dispatcher = ProgressDispatcher(
+            bot,
+            max_edits_per_second=Config.PROGRESS_EDITS_PER_SECOND,
+            min_interval=Config.PROGRESS_UPDATE_INTERVAL
+        )
+        bot_module.progress_dispatcher.start()
+        controller = None
+        if Config.AUTO_TUNE_CONCURRENCY:
+            controller = ConcurrencyController(
+                download_manager,
+                min_downloads=Config.AUTO_TUNE_MIN_DOWNLOADS,
+                max_downloads=Config.AUTO_TUNE_MAX_DOWNLOADS,
+                min_fragments=Config.AUTO_TUNE_MIN_FRAGMENTS,
+                max_fragments=Config.AUTO_TUNE_MAX_FRAGMENTS,
+                interval=Config.AUTO_TUNE_INTERVAL,
+                disk_latency=Config.AUTO_TUNE_DISK_LATENCY
+            )
+            controller.start()
+        lag_monitor = asyncio.create_task(monitor_loop_lag(lag_samples))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(make_job(index) for index in range(args.jobs)))
+        elapsed = time.perf_counter() - started
+
+        lag_monitor.cancel()
+        if controller:
+            await controller.stop()
+        await bot_module.progress_dispatcher.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    download_manager.shutdown()
+
+    done = metrics.JOBS.value(outcome='done')
+    return {
+        'kind': args.kind,
+        'jobs': args.jobs,
+        'done': int(done),
+        'failed': int(metrics.JOBS.value(outcome='failed')),
+        'concurrency': args.concurrency,
+        'per_user': args.per_user,
+        'users': args.users,
+        'backend': args.backend,
+        'fragments': args.fragments,
+        'auto_tune': args.auto_tune,
+        # Limits in effect at the end (differ from the start values with --auto-tune)
+        'final_concurrency': download_manager.max_concurrent,
+        'final_fragments': Config.CONCURRENT_FRAGMENT_DOWNLOADS,
+        'elapsed_s': round(elapsed, 2),
+        'jobs_per_min': round(done / elapsed * 60, 1) if elapsed else 0.0,
+        'mb_per_s': round(metrics.DOWNLOADED_BYTES.value() / elapsed / 1e6, 2) if elapsed else 0.0,
+        'queue_latency_p50_s': round(percentile(queue_latencies, 0.50), 3),
+        'queue_latency_p99_s': round(percentile(queue_latencies, 0.99), 3),
+        'loop_lag_p50_ms': round(percentile(lag_samples, 0.50) * 1000, 2),
+        'loop_lag_p99_ms': round(percentile(lag_samples, 0.99) * 1000, 2),
+        'loop_lag_max_ms': round(max(lag_samples, default=0) * 1000, 2),
+        # ru_maxrss is in KB on Linux
+        'peak_rss_mb': round(rss_after / 1024, 1),
+        'rss_growth_per_job_kb': round((rss_after - rss_before) / max(args.jobs, 1), 1),
+        'telegram_edits': int(metrics.TELEGRAM_RESPONSES.value(method='editMessageText')),
+        'telegram_429s': int(metrics.TELEGRAM_FLOOD_WAITS.value()),
+    }
+
+
+def format_report(report: dict) -> str:
+    return "\n".join([
+        f"Benchmark: {report['jobs']} {report['kind']} jobs, {report['users']} users, "
+        f"concurrency {report['concurrency']} (per user {report['per_user'] or '∞'}), "
+        f"{report['backend']} backend, {report['fragments']} fragments"
+        + (" (auto-tuned)" if report['auto_tune'] else ""),
+        f"  final limits   concurrency {report['final_concurrency']}, {report['final_fragments']} fragments",
+        f"  completed      {report['done']} done, {report['failed']} failed in {report['elapsed_s']}s",
+        f"  throughput     {report['jobs_per_min']} jobs/min, {report['mb_per_s']} MB/s",
+        f"  queue latency  p50 {report['queue_latency_p50_s']}s, p99 {report['queue_latency_p99_s']}s",
+        f"  loop lag       p50 {report['loop_lag_p50_ms']}ms, p99 {report['loop_lag_p99_ms']}ms, "
+        f"max {report['loop_lag_max_ms']}ms",
+        f"  memory         peak RSS {report['peak_rss_mb']}MB, +{report['rss_growth_per_job_kb']}KB per job",
+        f"  telegram       {report['telegram_edits']} edits, {report['telegram_429s']} flood waits",
+    ])
+
+
+def main():
+    args = parse_args()
+    work_dir = tempfile.mkdtemp(prefix="ytdl-bench-")
+    configure_environment(args, work_dir)
+    servers = start_fake_servers(args)
+    try:
+        with contextlib.nullcontext() if args.verbose else silence_output():
+            report = asyncio.run(run_benchmark(args))
+    finally:
+        servers.terminate()
+        servers.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report) if args.json else format_report(report)
+    print(text)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(text + "\n")
+
+
+if __name__ == '__main__':
+    main()
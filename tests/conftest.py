@@ -0,0 +1,18 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# The bot's modules import each other by module name (they run from app/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+
+@pytest.fixture
+def loop():
+    """Event loop the scheduler's admission futures are created on."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
@@ -0,0 +1,145 @@
+import pytest
+
+from scheduler import PRIORITY_HIGH, PRIORITY_NORMAL, FairScheduler
+
+
+def admitted(futures, task_ids):
+    """Task IDs whose admission future resolved, in the given order."""
+    return [task_id for task_id in task_ids if futures[task_id].done() and not futures[task_id].exception()]
+
+
+def run_in_order(scheduler, futures):
+    """Release the running task one at a time and record the order tasks are admitted in."""
+    order = [task_id for task_id in futures if futures[task_id].done()]
+    while len(order) < len(futures):
+        scheduler.release(order[-1])
+        newly = [task_id for task_id in futures if futures[task_id].done() and task_id not in order]
+        assert len(newly) == 1
+        order.extend(newly)
+    return order
+
+
+def test_users_are_served_round_robin(loop):
+    scheduler = FairScheduler(max_concurrent=1)
+    futures = {}
+    # Task 0 takes the slot, the others queue up: users in order of arrival, FIFO per user
+    for task_id, user_id in [(0, 'x'), (1, 'a'), (2, 'a'), (3, 'a'), (4, 'b'), (5, 'b')]:
+        futures[task_id] = scheduler.enqueue(task_id, user_id)
+
+    assert admitted(futures, futures) == [0]
+    assert scheduler.positions() == {1: 1, 4: 2, 2: 3, 5: 4, 3: 5}
+    assert run_in_order(scheduler, futures) == [0, 1, 4, 2, 5, 3]
+
+
+def test_release_frees_the_slot(loop):
+    scheduler = FairScheduler(max_concurrent=2)
+    futures = {task_id: scheduler.enqueue(task_id, 'a') for task_id in (1, 2, 3)}
+
+    assert admitted(futures, futures) == [1, 2]
+    assert (scheduler.active_count, scheduler.waiting_count) == (2, 1)
+    scheduler.release(1)
+    assert admitted(futures, futures) == [1, 2, 3]
+    assert (scheduler.active_count, scheduler.waiting_count) == (2, 0)
+    # Releasing twice, or a task that never ran, changes nothing
+    scheduler.release(1)
+    scheduler.release(42)
+    assert scheduler.active_count == 2
+
+
+def test_max_per_user_leaves_slots_to_others(loop):
+    scheduler = FairScheduler(max_concurrent=3, max_per_user=1)
+    futures = {}
+    for task_id, user_id in [(1, 'a'), (2, 'a'), (3, 'b')]:
+        futures[task_id] = scheduler.enqueue(task_id, user_id)
+
+    # User a is at its cap, so b's task goes ahead and a slot stays free
+    assert admitted(futures, futures) == [1, 3]
+    assert scheduler.active_count == 2
+    # Caps only delay tasks, the reported order ignores them
+    assert scheduler.positions() == {2: 1}
+    scheduler.release(1)
+    assert admitted(futures, futures) == [1, 2, 3]
+
+
+def test_a_lone_user_uses_every_slot_without_a_cap(loop):
+    scheduler = FairScheduler(max_concurrent=3)
+    futures = {task_id: scheduler.enqueue(task_id, 'a') for task_id in (1, 2, 3)}
+
+    assert admitted(futures, futures) == [1, 2, 3]
+
+
+def test_high_priority_jumps_the_queue(loop):
+    scheduler = FairScheduler(max_concurrent=1)
+    futures = {}
+    for task_id, user_id, priority in [
+        (0, 'x', PRIORITY_NORMAL), (1, 'a', PRIORITY_NORMAL), (2, 'a', PRIORITY_NORMAL),
+        (3, 'b', PRIORITY_NORMAL), (4, 'c', PRIORITY_HIGH)
+    ]:
+        futures[task_id] = scheduler.enqueue(task_id, user_id, priority)
+
+    assert scheduler.positions() == {4: 1, 1: 2, 3: 3, 2: 4}
+    assert run_in_order(scheduler, futures) == [0, 4, 1, 3, 2]
+
+
+def test_remove_fails_a_waiting_task(loop):
+    scheduler = FairScheduler(max_concurrent=1)
+    futures = {task_id: scheduler.enqueue(task_id, 'a') for task_id in (1, 2, 3)}
+
+    assert scheduler.remove(2, RuntimeError("cancelled"))
+    assert isinstance(futures[2].exception(), RuntimeError)
+    assert not scheduler.remove(2, RuntimeError("cancelled"))
+    assert not scheduler.remove(1, RuntimeError("running tasks aren't waiting"))
+    assert scheduler.positions() == {3: 1}
+    scheduler.release(1)
+    assert admitted(futures, [1, 3]) == [1, 3]
+
+
+def test_admission_check_holds_a_task_and_lets_max_bypass_go_ahead(loop):
+    scheduler = FairScheduler(max_concurrent=3, max_bypass=1)
+    blocked = {1}
+    scheduler.admission_check = lambda task_id: task_id not in blocked
+    futures = {task_id: scheduler.enqueue(task_id, user_id) for task_id, user_id in [(1, 'a'), (2, 'b'), (3, 'c')]}
+
+    # Task 2 may pass the held task 1, then the queue waits for it
+    assert admitted(futures, futures) == [2]
+    assert scheduler.held
+    assert scheduler.positions() == {1: 1, 3: 2}
+
+    blocked.clear()
+    scheduler.dispatch()
+    assert admitted(futures, futures) == [1, 2, 3]
+    assert not scheduler.held
+
+
+def test_admission_check_without_bypass_holds_the_queue(loop):
+    scheduler = FairScheduler(max_concurrent=2)
+    scheduler.admission_check = lambda task_id: task_id != 1
+    futures = {task_id: scheduler.enqueue(task_id, 'a') for task_id in (1, 2)}
+
+    assert admitted(futures, futures) == []
+    assert scheduler.positions() == {1: 1, 2: 2}
+
+
+def test_admission_check_raising_rejects_the_task(loop):
+    scheduler = FairScheduler(max_concurrent=1)
+
+    def check(task_id):
+        if task_id == 1:
+            raise OSError("can never fit")
+        return True
+
+    scheduler.admission_check = check
+    futures = {task_id: scheduler.enqueue(task_id, 'a') for task_id in (1, 2)}
+
+    with pytest.raises(OSError):
+        futures[1].result()
+    assert admitted(futures, futures) == [2]
+    assert scheduler.waiting_count == 0
+
+
+def test_set_max_concurrent_admits_waiting_tasks(loop):
+    scheduler = FairScheduler(max_concurrent=1)
+    futures = {task_id: scheduler.enqueue(task_id, 'a') for task_id in (1, 2, 3)}
+
+    scheduler.set_max_concurrent(3)
+    assert admitted(futures, futures) == [1, 2, 3]
@@ -0,0 +1,112 @@
+import pytest
+
+from url_parser import CHANNEL, LIVE, PLAYLIST, SHORTS, VIDEO, parse_url
+
+VIDEO_ID = 'dQw4w9WgXcQ'
+CANONICAL = f'https://www.youtube.com/watch?v={VIDEO_ID}'
+
+
+# Every spelling of one video: one canonical URL and one content key
+@pytest.mark.parametrize('url', [
+    f'https://www.youtube.com/watch?v={VIDEO_ID}',
+    f'http://youtube.com/watch?v={VIDEO_ID}',
+    f'www.youtube.com/watch?v={VIDEO_ID}',
+    f'youtube.com/watch?v={VIDEO_ID}',
+    f'https://m.youtube.com/watch?v={VIDEO_ID}',
+    f'https://music.youtube.com/watch?v={VIDEO_ID}',
+    f'https://youtu.be/{VIDEO_ID}',
+    f'youtu.be/{VIDEO_ID}',
+    f'https://youtu.be/{VIDEO_ID}?t=42',
+    f'https://youtu.be/{VIDEO_ID}?si=tracking',
+    f'https://www.youtube.com/watch?v={VIDEO_ID}&t=10s',
+    f'https://www.youtube.com/watch?feature=share&v={VIDEO_ID}&pp=tracking',
+    f'https://www.youtube.com/embed/{VIDEO_ID}',
+    f'https://www.youtube-nocookie.com/embed/{VIDEO_ID}',
+    f'https://www.youtube.com/v/{VIDEO_ID}',
+    f'  https://www.youtube.com/watch?v={VIDEO_ID}  ',
+])
+def test_video_links_collapse_to_one_key(url):
+    parsed = parse_url(url)
+
+    assert parsed is not None
+    assert parsed.kind == VIDEO
+    assert parsed.canonical_url == CANONICAL
+    assert parsed.content_key == f'youtube {VIDEO_ID}'
+
+
+@pytest.mark.parametrize('url, kind', [
+    (f'https://www.youtube.com/shorts/{VIDEO_ID}', SHORTS),
+    (f'https://youtube.com/shorts/{VIDEO_ID}?feature=share', SHORTS),
+    (f'https://m.youtube.com/shorts/{VIDEO_ID}/', SHORTS),
+    (f'https://www.youtube.com/live/{VIDEO_ID}', LIVE),
+    (f'https://www.youtube.com/live/{VIDEO_ID}?si=tracking', LIVE),
+])
+def test_shorts_and_live_videos_share_the_video_key(url, kind):
+    parsed = parse_url(url)
+
+    assert parsed.kind == kind
+    assert parsed.canonical_url == CANONICAL
+    assert parsed.content_key == f'youtube {VIDEO_ID}'
+
+
+# Links that may expand to more than one video, or change over time, get no content key
+@pytest.mark.parametrize('url, kind, canonical_url', [
+    (
+        f'https://www.youtube.com/watch?v={VIDEO_ID}&list=PLabcdef123',
+        VIDEO, f'{CANONICAL}&list=PLabcdef123',
+    ),
+    (
+        f'https://youtu.be/{VIDEO_ID}?list=PLabcdef123',
+        VIDEO, f'{CANONICAL}&list=PLabcdef123',
+    ),
+    (
+        'https://www.youtube.com/playlist?list=PLabcdef123',
+        PLAYLIST, 'https://www.youtube.com/playlist?list=PLabcdef123',
+    ),
+    (
+        'https://www.youtube.com/watch?list=PLabcdef123',
+        PLAYLIST, 'https://www.youtube.com/playlist?list=PLabcdef123',
+    ),
+    ('https://www.youtube.com/@SomeChannel', CHANNEL, 'https://www.youtube.com/@SomeChannel'),
+    ('https://www.youtube.com/@SomeChannel/videos', CHANNEL, 'https://www.youtube.com/@SomeChannel/videos'),
+    (
+        'https://www.youtube.com/channel/UCabcdefghijklmnopqrstuv',
+        CHANNEL, 'https://www.youtube.com/channel/UCabcdefghijklmnopqrstuv',
+    ),
+    ('https://www.youtube.com/user/someone', CHANNEL, 'https://www.youtube.com/user/someone'),
+    ('https://www.youtube.com/@SomeChannel/live', LIVE, 'https://www.youtube.com/@SomeChannel/live'),
+])
+def test_playlists_and_channels_have_no_content_key(url, kind, canonical_url):
+    parsed = parse_url(url)
+
+    assert parsed.kind == kind
+    assert parsed.canonical_url == canonical_url
+    assert parsed.content_key is None
+
+
+@pytest.mark.parametrize('url', [
+    # YouTube named somewhere other than the host
+    f'https://evil.example/?youtube.com/watch?v={VIDEO_ID}',
+    f'https://evil.example/youtube.com/watch?v={VIDEO_ID}',
+    f'https://evil.example/watch?v={VIDEO_ID}#youtube.com',
+    f'https://youtube.com.evil.com/watch?v={VIDEO_ID}',
+    f'https://notyoutube.com/watch?v={VIDEO_ID}',
+    f'https://youtube.com@evil.com/watch?v={VIDEO_ID}',
+    f'https://youtu.be.evil.com/{VIDEO_ID}',
+    # Not http(s)
+    f'ftp://www.youtube.com/watch?v={VIDEO_ID}',
+    f'javascript://www.youtube.com/watch?v={VIDEO_ID}',
+    # YouTube, but nothing downloadable
+    'https://www.youtube.com/',
+    'https://www.youtube.com/watch',
+    'https://www.youtube.com/watch?v=tooshort',
+    'https://www.youtube.com/feed/subscriptions',
+    'https://youtu.be/',
+    'https://youtu.be/tooshort',
+    # Not a link at all
+    '',
+    'hello there',
+    'http://[::1',
+])
+def test_other_links_are_rejected(url):
+    assert parse_url(url) is None
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Local Bot API mode against a stand-in server: getFile answers with a path in a
+# fake server directory, which the bot must hard-link instead of downloading.
+WORK_DIR = tempfile.mkdtemp(prefix="local-bot-api-")
+SERVER_DIR = "/var/lib/telegram-bot-api"
+DATA_DIR = os.path.join(WORK_DIR, "server")
+VIDEO_SIZE = 3 * 1024 * 1024
+
+os.environ.update({
+    "TELEGRAM_API_URL": "http://127.0.0.1:18081",
+    "TELEGRAM_API_SERVER_DIR": SERVER_DIR,
+    "TELEGRAM_API_DATA_DIR": DATA_DIR,
+    "DOWNLOAD_DIR": os.path.join(WORK_DIR, "downloads"),
+    "TEMP_DOWNLOAD_DIR": os.path.join(WORK_DIR, "downloads", "tmp"),
+})
+
+# Add app directory to path
+sys.path.append(os.path.abspath("app"))
+
+from telegram import Bot, Video
+
+from config import Config
+from job_store import JobStore
+from telegram_downloader import download_telegram_video
+from uploader import Uploader
+
+# Bot API calls the stand-in received: (method, request body size)
+calls = []
+
+
+class StandInBotAPI(BaseHTTPRequestHandler):
+    """Answers getMe and getFile like `telegram-bot-api --local` would."""
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        # Read uploads in chunks, like the real server
+        remaining = int(self.headers.get("Content-Length") or 0)
+        size = remaining
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+        calls.append((method, size))
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Stand-in", "username": "standin_bot"}
+        elif method == "getFile":
+            result = {
+                "file_id": "video-id",
+                "file_unique_id": "video-unique",
+                "file_size": VIDEO_SIZE,
+                "file_path": f"{SERVER_DIR}/bot-token/videos/file_0.mp4",
+            }
+        elif method == "sendVideo":
+            result = {
+                "message_id": len(calls), "date": 0, "chat": {"id": 42, "type": "private"},
+                "video": {"file_id": "uploaded-id", "file_unique_id": "uploaded-unique", "width": 640,
+                          "height": 360, "duration": 10},
+            }
+        else:
+            result = True
+
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def verify_local_mode():
+    print("Verifying local Bot API mode...")
+    if not Config.TELEGRAM_LOCAL_MODE:
+        print("❌ TELEGRAM_API_URL did not enable local mode")
+        return False
+    print(f"Size limit: {Config.TELEGRAM_VIDEO_MAX_SIZE} bytes")
+
+    # The file as the local server stores it
+    source = os.path.join(DATA_DIR, "bot-token", "videos", "file_0.mp4")
+    os.makedirs(os.path.dirname(source), exist_ok=True)
+    with open(source, "wb") as f:
+        f.write(os.urandom(VIDEO_SIZE))
+
+    server = HTTPServer(("127.0.0.1", 18081), StandInBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        async with Bot(
+            "123:stand-in",
+            base_url=f"{Config.TELEGRAM_API_URL}/bot",
+            base_file_url=f"{Config.TELEGRAM_API_URL}/file/bot",
+            local_mode=True
+        ) as bot:
+            video = Video("video-id", "video-unique", 640, 360, 10, file_size=VIDEO_SIZE)
+            video.set_bot(bot)
+            events = []
+            filepath = await download_telegram_video(video, progress_hook=events.append)
+    finally:
+        server.shutdown()
+
+    print(f"Downloaded to: {filepath}")
+    if os.path.getsize(filepath) != VIDEO_SIZE:
+        print("❌ Size mismatch")
+        return False
+    if not events or events[-1]['status'] != 'finished':
+        print("❌ No 'finished' progress event")
+        return False
+    if os.stat(filepath).st_ino != os.stat(source).st_ino:
+        print("⚠️ File was copied, not hard-linked (different filesystems?)")
+    else:
+        print("Hard-linked, no data copied")
+
+    print("✅ Verification passed!")
+    return True
+
+
+async def verify_upload_back():
+    print("Verifying upload back to the chat...")
+    path = os.path.join(WORK_DIR, "upload.mp4")
+    with open(path, "wb") as f:
+        f.write(os.urandom(VIDEO_SIZE))
+    job_store = JobStore(os.path.join(WORK_DIR, "jobs.db"))
+
+    server = HTTPServer(("127.0.0.1", 18081), StandInBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    calls.clear()
+    try:
+        async with Bot("123:stand-in", base_url=f"{Config.TELEGRAM_API_URL}/bot", local_mode=True) as bot:
+            uploader = Uploader(bot, job_store, max_size=Config.TELEGRAM_UPLOAD_MAX_SIZE)
+            progress = []
+            # Two requests for the same video at once: one upload, one resend
+            await asyncio.gather(
+                uploader.deliver(42, [path], "youtube abc", "first", lambda sent, total: progress.append(sent)),
+                uploader.deliver(43, [path], "youtube abc", "second"),
+            )
+            await uploader.close()
+            # After a restart the file_id comes from the job store
+            sent_from_store = await Uploader(bot, job_store).send_cached(44, "youtube abc")
+    finally:
+        server.shutdown()
+
+    uploads = [size for method, size in calls if method == "sendVideo" and size > VIDEO_SIZE]
+    resends = [size for method, size in calls if method == "sendVideo" and size < VIDEO_SIZE]
+    print(f"Uploads: {len(uploads)} ({uploads[0] if uploads else 0} bytes), resends by file_id: {len(resends)}")
+    if len(uploads) != 1 or len(resends) != 2:
+        print("❌ Expected one upload and two resends")
+        return False
+    if not progress or progress[-1] != VIDEO_SIZE:
+        print("❌ Upload progress did not reach the file size")
+        return False
+    if not sent_from_store or job_store.get_uploads("youtube abc") != [("video", "uploaded-id")]:
+        print("❌ file_id was not kept in the job store")
+        return False
+
+    print("✅ Verification passed!")
+    return True
+
+
+if __name__ == "__main__":
+    success = asyncio.run(verify_local_mode()) and asyncio.run(verify_upload_back())
+    sys.exit(0 if success else 1)
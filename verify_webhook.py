@@ -0,0 +1,145 @@
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Webhook mode end to end: the bot runs against a stand-in Bot API server and
+# recorded updates are POSTed to its webhook port, like Telegram would.
+# Usage: python verify_webhook.py [updates.jsonl]  (one recorded update per line)
+WORK_DIR = tempfile.mkdtemp(prefix="webhook-")
+PORT = 18080
+SECRET = "verify-secret"
+
+os.environ.update({
+    "BOT_TOKEN": "123:stand-in",
+    "TELEGRAM_API_URL": "http://127.0.0.1:18082",
+    "UPDATE_MODE": "webhook",
+    "WEBHOOK_URL": "https://bot.example.invalid/telegram",
+    "WEBHOOK_SECRET": SECRET,
+    "METRICS_PORT": str(PORT),
+    "DOWNLOAD_DIR": os.path.join(WORK_DIR, "downloads"),
+    "TEMP_DOWNLOAD_DIR": os.path.join(WORK_DIR, "downloads", "tmp"),
+    "LOG_DIR": os.path.join(WORK_DIR, "logs"),
+    "ALLOWED_USERS_FILE": os.path.join(WORK_DIR, "allowed_users.json"),
+    "JOB_JOURNAL": "false",
+})
+os.environ.pop("BOT_ACCESS_PASSWORD", None)
+
+# Add app directory to path
+sys.path.append(os.path.abspath("app"))
+
+import bot
+
+calls = []
+
+
+class StandInBotAPI(BaseHTTPRequestHandler):
+    """Answers the Bot API methods the bot calls and records them."""
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length).decode() if length else ""
+        calls.append((method, data))
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Stand-in", "username": "standin_bot"}
+        elif method == "sendMessage":
+            result = {"message_id": len(calls), "date": int(time.time()), "chat": {"id": 42, "type": "private"}}
+        else:
+            result = True
+
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def sample_updates():
+    user = {"id": 42, "is_bot": False, "first_name": "Tester"}
+    chat = {"id": 42, "type": "private"}
+    return [
+        {"update_id": 1, "message": {
+            "message_id": 1, "date": int(time.time()), "chat": chat, "from": user, "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }},
+        {"update_id": 2, "message": {
+            "message_id": 2, "date": int(time.time()), "chat": chat, "from": user, "text": "https://evil.example/?youtube.com",
+        }},
+    ]
+
+
+def post(body: bytes, secret: str) -> int:
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{PORT}/telegram", data=body, method="POST",
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def feed(updates, results):
+    # Wait for the webhook to be registered and the server to listen
+    deadline = time.monotonic() + 30
+    while not any(method == "setWebhook" for method, _ in calls) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    time.sleep(0.5)
+
+    results["forbidden"] = post(json.dumps(updates[0]).encode(), "wrong-secret")
+    results["statuses"] = [post(json.dumps(update).encode(), SECRET) for update in updates]
+    deadline = time.monotonic() + 10
+    while sum(method == "sendMessage" for method, _ in calls) < len(updates) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def verify_webhook(updates_file=None):
+    print("Verifying webhook mode...")
+    if updates_file:
+        with open(updates_file, encoding="utf-8") as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+    else:
+        updates = sample_updates()
+
+    server = HTTPServer(("127.0.0.1", 18082), StandInBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = {}
+    threading.Thread(target=feed, args=(updates, results), daemon=True).start()
+    try:
+        bot.main()
+    finally:
+        server.shutdown()
+
+    replies = sum(method == "sendMessage" for method, _ in calls)
+    print(f"Wrong secret: HTTP {results.get('forbidden')}")
+    print(f"Updates posted: {results.get('statuses')}, replies sent: {replies}")
+    if results.get("forbidden") != 403:
+        print("❌ Request with a wrong secret token was not rejected")
+        return False
+    if results.get("statuses") != [200] * len(updates):
+        print("❌ Not all updates were accepted")
+        return False
+    if replies < len(updates):
+        print("❌ Not every update was answered")
+        return False
+
+    print("✅ Verification passed!")
+    return True
+
+
+if __name__ == "__main__":
+    success = verify_webhook(sys.argv[1] if len(sys.argv) > 1 else None)
+    sys.exit(0 if success else 1)